@@ -0,0 +1,63 @@
+import json
+
+from eth_utils import to_hex
+from hexbytes import HexBytes
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3._utils.request import make_post_request
+
+from metrics import metrics
+
+
+class BatchCallException(Exception):
+    def __init__(self, fn_name, error):
+        self.message = "Batched call to %s failed: %s" % (fn_name, error)
+        super().__init__(self.message)
+
+
+class BatchReader:
+    """
+    Collects contract read calls and sends them to the node as a single JSON-RPC batch request. Every call in the batch
+    is pinned to the same block so the results describe one consistent chain state.
+    """
+
+    def __init__(self, web3: Web3, timeout=None):
+        self.web3 = web3
+        self.timeout = timeout
+        self.calls = []
+
+    def add(self, contract_fn) -> int:
+        """Queue a contract function call (e.g contract.functions.getOrder(id)) and return its index in the results."""
+        self.calls.append(contract_fn)
+        return len(self.calls) - 1
+
+    def execute(self, block_identifier='latest') -> list:
+        if not self.calls:
+            return []
+        block = to_hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+        payload = [{
+            'jsonrpc': '2.0',
+            'id': request_id,
+            'method': 'eth_call',
+            'params': [{'to': contract_fn.address, 'data': contract_fn._encode_transaction_data()}, block],
+        } for request_id, contract_fn in enumerate(self.calls)]
+
+        with metrics.timer('eth_call_batch'):
+            response = make_post_request(self.web3.provider.endpoint_uri, json.dumps(payload).encode('utf-8'),
+                                         timeout=self.timeout or 10)
+        responses = {item['id']: item for item in json.loads(response)}
+
+        results = []
+        for request_id, contract_fn in enumerate(self.calls):
+            item = responses.get(request_id, {'error': 'missing from batch response'})
+            if 'error' in item:
+                raise BatchCallException(contract_fn.fn_name, item['error'])
+            results.append(self._decode(contract_fn, item['result']))
+        return results
+
+    def _decode(self, contract_fn, result):
+        output_types = get_abi_output_types(contract_fn.abi)
+        output_data = self.web3.codec.decode_abi(output_types, HexBytes(result))
+        normalized_data = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, output_data)
+        return normalized_data[0] if len(normalized_data) == 1 else normalized_data
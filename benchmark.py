@@ -0,0 +1,254 @@
+import argparse
+import gc
+import json
+import os
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+
+import numpy as np
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+from dexalot import Dexalot
+from enums import OrderStatus, OrderType
+from market_maker import MarketMaker
+from order_diff import reconcile, within_tolerance
+from orderbook import BookLevels
+
+TRADER_ADDRESS = '0x' + 'ab' * 20
+OTHER_ADDRESSES = ['0x' + f'{i:02x}' * 20 for i in range(1, 9)]
+
+PAIR_DATA = {
+    'pair': 'TEAM2/AVAX', 'base': 'TEAM2', 'quote': 'AVAX', 'basedisplaydecimals': 2, 'quotedisplaydecimals': 2,
+    'baseaddress': '0x' + '11' * 20, 'quoteaddress': '', 'mintrade_amnt': '1', 'maxtrade_amnt': '10000',
+    'base_evmdecimals': 18, 'quote_evmdecimals': 18,
+}
+
+# Minimal TradePairs ABI, only addOrder is encoded by the benchmark
+TRADE_PAIRS_ABI = [{
+    'name': 'addOrder', 'type': 'function', 'stateMutability': 'nonpayable', 'outputs': [],
+    'inputs': [{'name': '_tradePairId', 'type': 'bytes32'}, {'name': '_price', 'type': 'uint256'},
+               {'name': '_quantity', 'type': 'uint256'}, {'name': '_side', 'type': 'uint8'},
+               {'name': '_type1', 'type': 'uint8'}],
+}]
+
+
+class BenchDexalot(Dexalot):
+    """Offline Dexalot backend. Transactions are built and ABI encoded but never signed or sent."""
+
+    def __init__(self, pair_data: dict):
+        super().__init__(base_url='', trade_pair=pair_data['pair'], web3=Web3(), trader_address=TRADER_ADDRESS)
+        self._apply_pair_data(pair_data)
+        self.trade_pairs_contract = self.web3.eth.contract(address='0x' + '22' * 20, abi=TRADE_PAIRS_ABI)
+
+    def estimate_gas_for_txn(self, txn):
+        return Decimal(0)
+
+    def _build_transaction(self, contract_txn) -> dict:
+        return {'to': contract_txn.address, 'data': contract_txn._encode_transaction_data(), 'gas': 500000,
+                'gasPrice': 25 * 10 ** 9}
+
+    def _send_transaction(self, txn: dict, nonce=None):
+        return HexBytes(os.urandom(32))
+
+    def _process_transaction(self, txn_hash, description: str, on_receipt=None, contract_txn=None):
+        return None
+
+
+class CountingScheduler:
+    """Stands in for the RequoteScheduler so requote requests are counted instead of scheduled."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def request(self, reason: str, refresh_book=False):
+        self.requests += 1
+
+
+class BenchEvent:
+    __slots__ = ('event', 'args', 'blockNumber', 'transactionHash', 'received_timestamp')
+
+    def __init__(self, args, block_number: int):
+        self.event = 'OrderStatusChanged'
+        self.args = args
+        self.blockNumber = block_number
+        self.transactionHash = HexBytes(os.urandom(32))
+        self.received_timestamp = time.monotonic()
+
+    def indexed(self, arg_name: str):
+        return None
+
+
+def bench_config() -> dict:
+    return {
+        'trade_pair': PAIR_DATA['pair'], 'target_spread': 1, 'order_price_tolerance': 0.005,
+        'order_amount_tolerance': 0.2, 'default_amount': 5, 'default_mid_price': 20, 'additional_state_update': 60,
+        'requote_debounce': 1, 'n_price_levels': 5, 'n_ladder_levels': 5, 'ladder_level_spacing': 0.1,
+        'ladder_size_growth': 1.2, 'inventory_price_skew': 0.5, 'inventory_amount_skew': 0.5, 'min_spread': 0.5,
+        'max_spread': 3, 'volatility_half_life': 50, 'volatility_spread_factor': 4, 'trade_flow_window': 100,
+        'trade_flow_spread_factor': 0.5, 'maker_fee': 0.001, 'gas_token_price': 1, 'fill_horizon_trades': 20,
+        'quote_gate_margin': 1, 'n_agg_orders': 50, 'ws_url': None, 'event_poll_interval': 0.25,
+        'max_book_pages': 20, 'order_registry_grace_period': 10, 'journal_path': None,
+        'checkpoint_path': None, 'checkpoint_interval': 5, 'checkpoint_max_age': 600,
+    }
+
+
+def generate_fixture(seed=1, n_events=20000, n_levels=50, n_open_orders=10) -> dict:
+    """Synthetic book snapshot, REST open orders and an OrderStatusChanged stream around a mid of 20."""
+    rng = random.Random(seed)
+    tick = 10 ** (PAIR_DATA['quote_evmdecimals'] - PAIR_DATA['quotedisplaydecimals'])
+    lot = 10 ** (PAIR_DATA['base_evmdecimals'] - PAIR_DATA['basedisplaydecimals'])
+    mid_ticks = 2000
+
+    bid_book = [[mid_ticks - 50 - level, rng.randint(1, 500) * 100] for level in range(n_levels)]
+    ask_book = [[mid_ticks + 50 + level, rng.randint(1, 500) * 100] for level in range(n_levels)]
+    open_orders = [{'id': '0x' + os.urandom(32).hex(), 'side': side, 'price': str(Decimal(price).scaleb(-2)),
+                    'quantity': '5.00', 'quantityfilled': '0'}
+                   for side, price in ((i % 2, mid_ticks - 50 - i if i % 2 == 0 else mid_ticks + 50 + i)
+                                       for i in range(n_open_orders))]
+
+    events = []
+    live = []
+    for block in range(n_events):
+        if live and rng.random() < 0.5:
+            order = live.pop(rng.randrange(len(live)))
+            status = rng.choice((OrderStatus.CANCELLED, OrderStatus.FILLED, OrderStatus.PARTIAL))
+            filled = order['quantity'] if status == OrderStatus.FILLED else \
+                (order['quantity'] // 2 if status == OrderStatus.PARTIAL else 0)
+            if status == OrderStatus.PARTIAL:
+                live.append(dict(order, quantityfilled=filled))
+            events.append(dict(order, status=status.value, quantityfilled=filled, block=block + 1))
+        else:
+            side = rng.randrange(2)
+            price = mid_ticks + (-1 if side == 0 else 1) * rng.randint(1, 80)
+            order = {'id': '0x' + os.urandom(32).hex(), 'side': side, 'price': price * tick,
+                     'quantity': rng.randint(1, 500) * lot, 'quantityfilled': 0,
+                     'trader': TRADER_ADDRESS if rng.random() < 0.05 else rng.choice(OTHER_ADDRESSES)}
+            live.append(order)
+            events.append(dict(order, status=OrderStatus.NEW.value, block=block + 1))
+
+    return {'pair': PAIR_DATA, 'bid_book': bid_book, 'ask_book': ask_book, 'open_orders': open_orders,
+            'events': events}
+
+
+def to_events(fixture: dict, pair_id: bytes) -> list:
+    # bytes32 arguments as plain bytes, the way processLog decodes them
+    return [BenchEvent(AttributeDict({
+        'pair': pair_id, 'id': bytes.fromhex(event['id'][2:]), 'status': event['status'], 'side': event['side'],
+        'traderaddress': event['trader'], 'price': event['price'], 'quantity': event['quantity'],
+        'quantityfilled': event['quantityfilled']}), event['block']) for event in fixture['events']]
+
+
+def to_chain_state(fixture: dict) -> dict:
+    books = []
+    for levels in (fixture['bid_book'], fixture['ask_book']):
+        book_levels = BookLevels()
+        for price, quantity in levels:
+            book_levels.append(price, quantity)
+        books.append(book_levels)
+    return {'block_number': 0, 'bid_book': books[0], 'ask_book': books[1], 'base_balance': (10 ** 21, 10 ** 21, 0),
+            'quote_balance': (10 ** 21, 10 ** 21, 0), 'orders': {}}
+
+
+def create_market_maker(fixture: dict) -> MarketMaker:
+    market_maker = MarketMaker(bench_config())
+    market_maker.dexalot = BenchDexalot(fixture['pair'])
+    market_maker.requote_scheduler = CountingScheduler()
+    market_maker.apply_state(fixture['open_orders'], to_chain_state(fixture))
+    return market_maker
+
+
+def measure(name: str, fn, inputs: list, repeat=1) -> dict:
+    """Time fn over every input, then run it again under tracemalloc for allocations."""
+    latencies = np.empty(len(inputs) * repeat)
+    gc.collect()
+    start = time.perf_counter()
+    i = 0
+    for _ in range(repeat):
+        for item in inputs:
+            call_start = time.perf_counter()
+            fn(item)
+            latencies[i] = time.perf_counter() - call_start
+            i += 1
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for item in inputs:
+        fn(item)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'name': name, 'calls': len(latencies), 'calls_per_sec': len(latencies) / elapsed,
+            'p50_us': np.percentile(latencies, 50) * 1e6, 'p90_us': np.percentile(latencies, 90) * 1e6,
+            'p99_us': np.percentile(latencies, 99) * 1e6, 'max_us': latencies.max() * 1e6,
+            'peak_kib': (peak - baseline) / 1024, 'retained_bytes_per_call': (current - baseline) / len(inputs)}
+
+
+def run_benchmarks(fixture: dict, repeat: int) -> list:
+    results = []
+
+    # Event handling through the local book, order registry and requote decision
+    market_maker = create_market_maker(fixture)
+    events = to_events(fixture, market_maker.pair_id)
+    results.append(measure('handle_order_status_changed', market_maker.handle_order_status_changed, events))
+
+    # State update parsing of REST open orders and a book snapshot
+    market_maker = create_market_maker(fixture)
+    chain_state = to_chain_state(fixture)
+    results.append(measure('apply_state', lambda _: market_maker.apply_state(fixture['open_orders'], chain_state),
+                           range(200), repeat))
+
+    # Quote calculation and reconcile against the live orders
+    market_maker = create_market_maker(fixture)
+    live_orders = list(market_maker.order_registry)
+    results.append(measure('calculate_quotes + reconcile', lambda _: reconcile(
+        live_orders, market_maker.calculate_quotes(), market_maker.price_tolerance, market_maker.amount_tolerance),
+                           range(1000), repeat))
+
+    values = [(random.randint(1, 10 ** 6), random.randint(1, 10 ** 6)) for _ in range(10000)]
+    results.append(measure('within_tolerance', lambda value: within_tolerance(value[0], value[1], 200000),
+                           values, repeat))
+
+    # addOrder checks and ABI encoding
+    dexalot = market_maker.dexalot
+    quotes = market_maker.calculate_quotes()
+    results.append(measure('add_order_ticks', lambda quote: dexalot.add_order_ticks(
+        dexalot.trade_pair, quote.price, quote.amount, quote.side, OrderType.LIMIT), quotes * 200, repeat))
+    return results
+
+
+def format_results(results: list) -> str:
+    log_line = f"{'benchmark':<30} {'calls':>8} {'calls/s':>12} {'p50 us':>9} {'p90 us':>9} {'p99 us':>9} " \
+               f"{'max us':>9} {'peak KiB':>9} {'B/call':>8}" + '\n'
+    for result in results:
+        log_line += f"{result['name']:<30} {result['calls']:>8} {result['calls_per_sec']:>12.0f} " \
+                    f"{result['p50_us']:>9.1f} {result['p90_us']:>9.1f} {result['p99_us']:>9.1f} " \
+                    f"{result['max_us']:>9.1f} {result['peak_kib']:>9.1f} {result['retained_bytes_per_call']:>8.1f}" + '\n'
+    return log_line
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the market maker hot paths")
+    parser.add_argument('--fixture', help="JSON fixture to replay instead of a synthetic one")
+    parser.add_argument('--save-fixture', help="Write the synthetic fixture to this path")
+    parser.add_argument('--events', type=int, default=20000, help="Number of synthetic events")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help="Timed passes over each input set")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture) as f:
+            fixture = json.load(f)
+    else:
+        fixture = generate_fixture(args.seed, args.events)
+        if args.save_fixture:
+            with open(args.save_fixture, 'w') as f:
+                json.dump(fixture, f)
+
+    results = run_benchmarks(fixture, args.repeat)
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
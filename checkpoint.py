@@ -0,0 +1,69 @@
+import json
+import os
+import time
+
+from logger import get_logger
+
+logger = get_logger('dexalot_checkpoint')
+
+CHECKPOINT_VERSION = 1
+
+
+def _json_default(value):
+    # Transaction hashes and raw transaction fields
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def write_checkpoint(path: str, checkpoint: dict):
+    """
+    Write checkpoint atomically: it is written and fsynced to a temporary file next to path which then replaces path,
+    so a crash at any point leaves either the previous or the new checkpoint, never a partial one.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(checkpoint, version=CHECKPOINT_VERSION), f, default=_json_default)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if directory and hasattr(os, 'O_DIRECTORY'):
+        # Persist the rename itself
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def read_checkpoint(path: str):
+    """Checkpoint at path, None if there is none or it can not be used."""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        logger.warning(f"Ignoring checkpoint {path} of version {checkpoint.get('version')}")
+        return None
+    return checkpoint
+
+
+def checkpoint_path(path_template: str, trade_pair: str) -> str:
+    return path_template.format(pair=trade_pair.replace('/', '-'))
+
+
+def resume_position(checkpoint: dict, max_age: float):
+    """(block number, log index) of the last event processed before the checkpoint, None if the checkpoint has none
+    or is older than max_age seconds, too far behind to fetch the missed logs in one request."""
+    if checkpoint.get('processed_position') is None:
+        return None
+    if max_age is not None and time.time() - checkpoint['timestamp'] > max_age:
+        return None
+    return tuple(checkpoint['processed_position'])
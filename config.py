@@ -30,13 +30,21 @@ def init_config():
     register_private_key(web3, private_key)
 
     # Web3 Config
+    config['rpc_url'] = ulr_devnet  # Used by shard workers to open their own read-only connection
+    config['ws_url'] = 'wss://node.dexalot-dev.com/ext/bc/C/ws'  # Websocket endpoint for log subscriptions, None to poll
+    config['event_poll_interval'] = 0.25  # Seconds between new block checks when polling for logs
     config['trader_address'] = web3.eth.default_account
     config['web3'] = web3
 
     # Exchange Handler Config
     config['base_url'] = 'https://api.dexalot-dev.com/api/'
     config['timeout'] = 10
+    config['max_retries'] = 3  # Retries with exponential backoff on REST timeouts, connection and server errors
     config['trade_pair'] = 'TEAM2/AVAX'
+    config['trade_pairs'] = [config['trade_pair']]  # Pairs quoted from one process, more than one runs the MultiPairRunner
+    config['n_shards'] = 1  # Worker processes the pairs are spread over, more than one runs the ShardedRunner
+    config['pair_configs'] = {}  # Per pair config overrides, e.g {'TEAM2/AVAX': {'target_spread': 0.5}}
+    config['reference_cache_path'] = 'cache/dexalot_reference.json'  # Pair data and contract ABIs for fast restarts, None to disable
 
     # MM Config
     config['default_mid_price'] = 20  # Default mid price if no market
@@ -44,8 +52,32 @@ def init_config():
     config['order_amount_tolerance'] = 0.2  # Tolernace when comparing order amounts (20% = 0.2). Order size is replensished when order falls below this threshold
     config['default_amount'] = 5
     config['target_spread'] = 1  # Target spread - can vary slightly due to the existing order tolerance
+    config['n_ladder_levels'] = 1  # Number of quotes per side
+    config['ladder_level_spacing'] = 0.1  # Price distance between ladder levels
+    config['ladder_size_growth'] = 1.0  # Size multiplier per ladder level away from the mid (1 = flat)
+    config['min_spread'] = 0.5  # Lower bound of the volatility based spread
+    config['max_spread'] = 3  # Upper bound of the volatility based spread
+    config['volatility_half_life'] = 50  # Trades over which the weight of a return in the EWMA volatility halves, also the warmup before the spread follows it
+    config['volatility_spread_factor'] = 4  # Spread in standard deviations of a trade return, 0 to always quote the target spread
+    config['trade_flow_window'] = 100  # Trades in the taker buy/sell imbalance window
+    config['trade_flow_spread_factor'] = 0.5  # Fraction of the spread added to the side takers are trading into at a fully one sided flow
+    config['maker_fee'] = 0.001  # Maker fee rate (0.1% = 0.001) taken off the spread captured by a filled quote
+    config['gas_token_price'] = 1  # Price of the gas token (AVAX) in the quote token, 1 for AVAX quoted pairs
+    config['fill_horizon_trades'] = 20  # Trades over which a quote's fill probability is estimated from the volatility
+    config['quote_gate_margin'] = 1  # Expected edge gained over gas cost required to cancel or add quotes, None to disable the gate
+    config['inventory_price_skew'] = 0.5  # Fraction of the target spread quotes are shifted by when all inventory is in one token
+    config['inventory_amount_skew'] = 0.5  # Fraction of the default amount moved between bid and ask when all inventory is in one token
     config['n_price_levels'] = 5
     config['n_agg_orders'] = 50
+    config['max_book_pages'] = 20  # Maximum getNOrders pages read per side when walking the full book
+    config['order_registry_grace_period'] = 10  # Seconds local order updates are trusted over a lagging REST open orders view
+    config['requote_debounce'] = 1  # Seconds over which events are coalesced into a single requote
+    config['journal_path'] = None  # Binary event journal per pair for replay.py, e.g 'journal/{pair}.bin'. None to disable
+    config['checkpoint_path'] = None  # Crash-safe runtime checkpoint per pair for warm restarts, e.g 'checkpoint/{pair}.json'. None to disable
+    config['checkpoint_interval'] = 5  # Seconds between checkpoint writes
+    config['checkpoint_max_age'] = 600  # Seconds after which a checkpoint is too old to resume events from, its orders and nonces are still restored
+    config['metrics_dump_interval'] = 60  # Seconds between stage latency dumps to the log, None to disable
+    config['metrics_port'] = None  # Local port serving stage latencies as JSON on /metrics, None to disable
     config['additional_state_update'] = 60  # Additional state update incase events are missed or out of sync
 
     return config
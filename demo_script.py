@@ -16,7 +16,8 @@ logger = get_logger('dexalot-demo')
 def run_demo(config):
     # Initialize Dexalot Exchange Handler and GET reference data
     dexalot = Dexalot(base_url=config['base_url'], trade_pair=config['trade_pair'], web3=config['web3'],
-                      trader_address=config['trader_address'], timeout=config['timeout'])
+                      trader_address=config['trader_address'], timeout=config['timeout'],
+                      max_retries=config['max_retries'], reference_cache_path=config['reference_cache_path'])
 
     target_spread = config['target_spread']
     order_price_tolerance = config['order_price_tolerance']
@@ -55,9 +56,8 @@ def run_demo(config):
     # Wait 10 seconds and cancel orders individually
     time.sleep(10)
     market_maker.update_state()
-    open_orders = market_maker.open_orders
-    for order in open_orders:
-        dexalot.cancel_order(dexalot.trade_pair, order['id'])
+    for order in market_maker.order_registry:
+        dexalot.cancel_order(dexalot.trade_pair, order.id)
 
     # Wait 20 seconds and place new (different) buy and sell orders
     time.sleep(20)
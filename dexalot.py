@@ -1,22 +1,46 @@
+import asyncio
+import copy
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 from web3 import Web3
+from web3.logs import DISCARD
 
-from config import extract_environment_variable
 from enums import OrderSide, OrderType
+from batch_reader import BatchReader
+from gas_oracle import GasOracle
 from logger import get_logger
+from metrics import metrics
+from nonce_manager import NonceManager
+from order_registry import to_order_id
+from orderbook import BookLevels
+from reference_cache import ReferenceCache
+from web3_utils import sign_tx
 
 logger = get_logger("dexalot_exchange")
 
 
+class MaxRetriesException(Exception):
+    def __init__(self, path, params):
+        self.message = "Max retries on %s (%s) hit, raising." % (path, json.dumps(params or ''))
+        super().__init__(self.message)
+
+
+DEPLOYMENT_TYPES = ["Exchange", "Portfolio", "TradePairs", "OrderBooks"]
+
+
 class Dexalot:
 
     # Base URL
     # https://api.dexalot-dev.com/api/
 
-    def __init__(self, base_url: str, trade_pair: str, web3: Web3, trader_address, timeout=None):
+    def __init__(self, base_url: str, trade_pair: str, web3: Web3, trader_address, timeout=None, max_retries=3,
+                 backoff_base=0.25, backoff_max=4, reference_cache_path=None):
 
         self.base_url = base_url
         self.trade_pair = trade_pair
@@ -32,17 +56,90 @@ class Dexalot:
         self.max_trade_amount = None
         self.base_decimals = None
         self.quote_decimals = None
+        self.price_tick = None
+        self.quantity_lot = None
         self.exchange_contract = None
         self.portfolio_contract = None
         self.trade_pairs_contract = None
         self.orderbooks_contract = None
         self.timeout = timeout
-        self.retries = 0
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Keep-alive connection pool shared by all REST calls, retries are handled in _request_dexalot
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        self.async_session = None
+        self.reference_cache = ReferenceCache(reference_cache_path, base_url) if reference_cache_path else None
+        self.reference_data = None
+        self.reference_data_from_cache = False
+        self.tx_pipeline = None
+        self.nonce_manager = NonceManager(web3, trader_address)
+        self.gas_oracle = GasOracle(web3)
+        self.read_executor = ThreadPoolExecutor(max_workers=2)
+        self.latest_block_number = None
 
     def initialize(self):
+        """
+        Load pair reference data and contracts. With a reference cache configured a valid cache is used straight away
+        and revalidate_reference_data should be called afterwards, otherwise everything is fetched from the REST API.
+        """
+        cache = self.reference_cache.load() if self.reference_cache is not None else None
+        if cache is not None and self.trade_pair in cache['pairs'] and set(DEPLOYMENT_TYPES) <= set(cache['contracts']):
+            logger.info(f"Loaded reference data from cache {self.reference_cache.path}")
+            self.reference_data = cache
+            self.reference_data_from_cache = True
+        else:
+            self.reference_data = self.fetch_reference_data()
+            self.reference_data_from_cache = False
+        self._apply_pair_data(self.reference_data['pairs'][self.trade_pair])
+        self._apply_contracts(self.reference_data['contracts'])
 
-        # Fetch Trading Pair MetaData
-        pair_data = self.fetch_single_pair(self.trade_pair)
+    def for_pair(self, trade_pair: str):
+        """
+        Handler for another pair of the same deployment. It shares this handler's web3 connection, contracts, REST
+        sessions, nonce manager, gas oracle and transaction pipeline so several pairs can be traded from one process.
+        """
+        if trade_pair not in self.reference_data['pairs']:
+            raise Exception(f"Could not find {trade_pair} in deployed pairs")
+        pair_dexalot = copy.copy(self)
+        pair_dexalot.trade_pair = trade_pair
+        pair_dexalot._apply_pair_data(self.reference_data['pairs'][trade_pair])
+        return pair_dexalot
+
+    def fetch_reference_data(self) -> dict:
+        # Fetch the pairs and the contract ABIs concurrently
+        pairs_future = self.read_executor.submit(self.fetch_all_pairs)
+        contract_infos = dict(zip(DEPLOYMENT_TYPES, self.read_executor.map(self.fetch_contract_and_abi,
+                                                                            DEPLOYMENT_TYPES)))
+        pairs = pairs_future.result()
+        if self.trade_pair not in [pair_data['pair'] for pair_data in pairs]:
+            raise Exception(f"Could not find {self.trade_pair} in deployed pairs")
+        contracts = {deployment_type: {'address': contract_info['address'], 'abi': contract_info['abi']['abi']}
+                     for deployment_type, contract_info in contract_infos.items()}
+
+        if self.reference_cache is not None:
+            return self.reference_cache.save(pairs, contracts)
+        return {'pairs': {pair_data['pair']: pair_data for pair_data in pairs}, 'contracts': contracts}
+
+    def revalidate_reference_data(self) -> bool:
+        """Refetch reference data from the REST API and reload anything that changed since it was cached. Returns True
+        if the pair data or any contract address or ABI changed."""
+        cached = self.reference_data
+        fresh = self.fetch_reference_data()
+        changed_contracts = ReferenceCache.changed_contracts(cached, fresh['contracts'])
+        pair_changed = cached['pairs'].get(self.trade_pair) != fresh['pairs'][self.trade_pair]
+
+        self.reference_data = fresh
+        if pair_changed:
+            logger.warning(f"Pair reference data for {self.trade_pair} changed since it was cached")
+            self._apply_pair_data(fresh['pairs'][self.trade_pair])
+        if changed_contracts:
+            logger.warning(f"Contracts {changed_contracts} changed since they were cached. Reloading")
+            self._apply_contracts(fresh['contracts'])
+        return pair_changed or bool(changed_contracts)
+
+    def _apply_pair_data(self, pair_data: dict):
         self.base_symbol = str(pair_data['base'])
         self.quote_symbol = str(pair_data['quote'])
         self.base_display_decimals = int(pair_data['basedisplaydecimals'])
@@ -54,26 +151,39 @@ class Dexalot:
         self.max_trade_amount = float(pair_data['maxtrade_amnt'])
         self.base_decimals = int(pair_data['base_evmdecimals'])
         self.quote_decimals = int(pair_data['quote_evmdecimals'])
+        # Orders must conform to display decimals so book values are exact multiples of these
+        self.price_tick = 10 ** (self.quote_decimals - self.quote_display_decimals)
+        self.quantity_lot = 10 ** (self.base_decimals - self.base_display_decimals)
+        # Trade amount limits in ticks * lots so order notionals are checked with integer arithmetic
+        self.min_trade_notional = int(Decimal(str(pair_data['mintrade_amnt'])).scaleb(
+            self.quote_display_decimals + self.base_display_decimals))
+        self.max_trade_notional = int(Decimal(str(pair_data['maxtrade_amnt'])).scaleb(
+            self.quote_display_decimals + self.base_display_decimals))
         logger.info(f"Retrieved pair reference data for {self.trade_pair}: {pair_data}")
 
-        # Initialize Exchange Contract
-        contract_info = self.fetch_contract_and_abi(deployment_type="Exchange")
-        self.exchange_contract = self.web3.eth.contract(address=contract_info["address"], abi=contract_info["abi"]["abi"])
-
-        # Initialize Portfolio Contract
-        contract_info = self.fetch_contract_and_abi(deployment_type="Portfolio")
-        self.portfolio_contract = self.web3.eth.contract(address=contract_info["address"],
-                                                         abi=contract_info["abi"]["abi"])
-
-        # Initialize TradePairs Contract
-        contract_info = self.fetch_contract_and_abi(deployment_type="TradePairs")
-        self.trade_pairs_contract = self.web3.eth.contract(address=contract_info["address"],
-                                                           abi=contract_info["abi"]["abi"])
-
-        # Initialize Orderbook Contract
-        contract_info = self.fetch_contract_and_abi(deployment_type="OrderBooks")
-        self.orderbooks_contract = self.web3.eth.contract(address=contract_info["address"],
-                                                          abi=contract_info["abi"]["abi"])
+    def to_ticks(self, price: Decimal) -> int:
+        """Price in quote display ticks, the unit prices are kept in by books, quotes and tolerance checks."""
+        return int(round(Decimal(price).scaleb(self.quote_display_decimals)))
+
+    def to_lots(self, amount: Decimal) -> int:
+        """Amount in base display lots, the unit quantities are kept in by books, quotes and tolerance checks."""
+        return int(round(Decimal(amount).scaleb(self.base_display_decimals)))
+
+    def from_ticks(self, ticks: int) -> Decimal:
+        return Decimal(ticks).scaleb(-self.quote_display_decimals)
+
+    def from_lots(self, lots: int) -> Decimal:
+        return Decimal(lots).scaleb(-self.base_display_decimals)
+
+    def _apply_contracts(self, contracts: dict):
+        self.exchange_contract = self.web3.eth.contract(address=contracts["Exchange"]["address"],
+                                                        abi=contracts["Exchange"]["abi"])
+        self.portfolio_contract = self.web3.eth.contract(address=contracts["Portfolio"]["address"],
+                                                         abi=contracts["Portfolio"]["abi"])
+        self.trade_pairs_contract = self.web3.eth.contract(address=contracts["TradePairs"]["address"],
+                                                           abi=contracts["TradePairs"]["abi"])
+        self.orderbooks_contract = self.web3.eth.contract(address=contracts["OrderBooks"]["address"],
+                                                          abi=contracts["OrderBooks"]["abi"])
         logger.info("All contracts have been initialized and ready to trade")
 
     def deposit_token(self, quantity: Decimal, is_base=True):
@@ -86,8 +196,8 @@ class Dexalot:
         deposit_token = self.trade_pairs_contract.functions.getSymbol(trade_pair, is_base).call()
 
         if is_base:
-            txn = self.portfolio_contract.functions.depositToken(trader_address, deposit_token, quantity).transact()
-            txn_receipt = self.web3.eth.wait_for_transaction_receipt(txn)
+            txn = self._build_transaction(
+                self.portfolio_contract.functions.depositToken(trader_address, deposit_token, quantity))
         else:
             # Send directly to the contract as AVAX fails check in tokenList.contains(_symbol)
             # https://github.com/Dexalot/contracts/blob/8d4aa94e6b05ac2a4df7ede6f03c94e1bf3b5831/contracts/Portfolio.sol#L272
@@ -95,13 +205,12 @@ class Dexalot:
                 'to': self.portfolio_contract.address,
                 'value': quantity,
                 'chainId': self.web3.eth.chainId,
-                'nonce': self.web3.eth.get_transaction_count(self.web3.eth.default_account),
                 'gas': 200000,
                 'gasPrice': self.web3.toWei('100', 'gwei'),
             }
-            signed_txn = self.web3.eth.account.sign_transaction(txn, private_key=extract_environment_variable('PRIVATE_KEY'))
-            txn = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            txn_receipt = self.web3.eth.wait_for_transaction_receipt(txn)
+        txn_hash = self._send_transaction(txn)
+        txn_receipt = self.web3.eth.wait_for_transaction_receipt(txn_hash)
+        self._record_receipt(txn_hash, txn_receipt)
 
         return txn_receipt
 
@@ -110,25 +219,33 @@ class Dexalot:
         # https://api.dexalot-dev.com/api/trading/pairs
         path = "trading/tokens"
         all_tokens = self._request_dexalot(path=path)
-        deployed_tokens = []
+        return self._filter_deployed(all_tokens)
 
-        for token in all_tokens:
-            if token['status'] == 'deployed':
-                deployed_tokens.append(token)
+    async def fetch_tokens_async(self) -> list:
 
-        return deployed_tokens
+        all_tokens = await self._request_dexalot_async(path="trading/tokens")
+        return self._filter_deployed(all_tokens)
 
     def fetch_all_pairs(self) -> list:
 
         # https://api.dexalot-dev.com/api/trading/pairs
         path = "trading/pairs"
         all_pairs = self._request_dexalot(path=path)
-        deployed_pairs = []
+        return self._filter_deployed(all_pairs)
+
+    async def fetch_all_pairs_async(self) -> list:
 
-        for pair in all_pairs:
-            if pair['status'] == 'deployed':
-                deployed_pairs.append(pair)
-        return deployed_pairs
+        all_pairs = await self._request_dexalot_async(path="trading/pairs")
+        return self._filter_deployed(all_pairs)
+
+    @staticmethod
+    def _filter_deployed(items: list) -> list:
+        deployed_items = []
+
+        for item in items:
+            if item['status'] == 'deployed':
+                deployed_items.append(item)
+        return deployed_items
 
     def fetch_single_pair(self, single_pair: str):
 
@@ -143,7 +260,7 @@ class Dexalot:
 
         # https://api.dexalot-dev.com/api/trading/deploymentabi
         response = None
-        if deployment_type in ["Exchange", "Portfolio", "TradePairs", "OrderBooks"]:
+        if deployment_type in DEPLOYMENT_TYPES:
             path = "trading/deploymentabi/" + deployment_type
             response = self._request_dexalot(path)
         else:
@@ -159,9 +276,15 @@ class Dexalot:
         response = self._request_dexalot(path=path, params=params)
         return response['rows']
 
+    async def fetch_open_orders_async(self) -> list:
+
+        params = {'traderaddress': self.trade_address, 'pair': self.trade_pair}
+        response = await self._request_dexalot_async(path="trading/openorders/params", params=params)
+        return response['rows']
+
     def fetch_order_status(self, order_id):
 
-        order_id_bytes = bytes.fromhex(order_id[2:])
+        order_id_bytes = bytes.fromhex(to_order_id(order_id)[2:])
         order_info = self.trade_pairs_contract.functions.getOrder(order_id_bytes).call()
         return order_info
 
@@ -180,108 +303,377 @@ class Dexalot:
         ask_book = self.orderbooks_contract.functions.getNOrders(ask_book_id, price_levels, aggregated_orders, 0, b'', 0).call()
         return bid_book[:2], ask_book[:2]
 
+    def _fetch_book_pages(self, cursors: dict, books: dict, page_levels: int, page_orders: int, max_pages: int,
+                          block_identifier):
+        """
+        Walk the books in cursors ({(book id, book type): (lastPrice, lastOrder)}) further into books, the next page
+        of every book still being walked is read together in one batch request so both sides are fetched concurrently.
+        """
+        for _ in range(max_pages):
+            if not cursors:
+                return
+            batch = BatchReader(self.web3, self.timeout)
+            calls = {book: batch.add(self.orderbooks_contract.functions.getNOrders(
+                book[0], page_levels, page_orders, last_price, last_order, book[1]))
+                for book, (last_price, last_order) in cursors.items()}
+            results = batch.execute(block_identifier)
+            cursors = {}
+            for book, call in calls.items():
+                prices, quantities, last_price, last_order = results[call]
+                self._append_book_levels(books[book], prices, quantities)
+                if self._has_next_page(prices, last_price):
+                    cursors[book] = (last_price, last_order)
+        for book in cursors:
+            logger.warning(f"Stopped reading {book[0]} after {max_pages + 1} pages with {len(books[book])} price levels")
+
+    @staticmethod
+    def _has_next_page(prices, last_price) -> bool:
+        # A zero cursor or a short page means the end of the book was reached
+        return last_price != 0 and bool(prices) and prices[-1] != 0
+
+    def fetch_state_batch(self, order_ids: list, page_levels: int, page_orders: int, max_pages=20,
+                          block_identifier=None):
+        """
+        Read the first page of both books, getOrder for every id in order_ids and our Portfolio balances of the base
+        and quote token in a single JSON-RPC batch request. All reads are pinned to one block, by default the block the
+        node is at, whose number decides which events are already in the book. Books deeper than one page are walked
+        further from the returned cursors at the same block, the next pages of both sides batched together.
+
+        The latest block we have seen in receipts or events is only a lower bound: a node lagging behind it would
+        return state older than what has been processed, so None is returned instead.
+        """
+        block_number = self.web3.eth.block_number if block_identifier is None else block_identifier
+        if self.latest_block_number is not None and block_number < self.latest_block_number:
+            logger.warning(f"Skipping state read at block {block_number}, behind block {self.latest_block_number} "
+                           f"already seen")
+            return None
+        bid_book_id = bytes(self.trade_pair + '-BUYBOOK', 'utf-8')
+        ask_book_id = bytes(self.trade_pair + '-SELLBOOK', 'utf-8')
+        trader_address = Web3.toChecksumAddress(self.trade_address)
+
+        batch = BatchReader(self.web3, self.timeout)
+        bid_call = batch.add(self.orderbooks_contract.functions.getNOrders(bid_book_id, page_levels, page_orders, 0,
+                                                                           b'', 1))
+        ask_call = batch.add(self.orderbooks_contract.functions.getNOrders(ask_book_id, page_levels, page_orders, 0,
+                                                                           b'', 0))
+        base_balance_call = batch.add(self.portfolio_contract.functions.getBalance(
+            trader_address, self.web3.toBytes(text=self.base_symbol)))
+        quote_balance_call = batch.add(self.portfolio_contract.functions.getBalance(
+            trader_address, self.web3.toBytes(text=self.quote_symbol)))
+        order_calls = {order_id: batch.add(self.trade_pairs_contract.functions.getOrder(bytes.fromhex(to_order_id(order_id)[2:])))
+                       for order_id in order_ids}
+        results = batch.execute(block_number)
+
+        books = {}
+        cursors = {}
+        for book, call in (((bid_book_id, 1), bid_call), ((ask_book_id, 0), ask_call)):
+            prices, quantities, last_price, last_order = results[call]
+            books[book] = BookLevels()
+            self._append_book_levels(books[book], prices, quantities)
+            if self._has_next_page(prices, last_price):
+                cursors[book] = (last_price, last_order)
+        self._fetch_book_pages(cursors, books, page_levels, page_orders, max_pages - 1, block_number)
+
+        return {
+            'block_number': block_number,
+            'bid_book': books[(bid_book_id, 1)],
+            'ask_book': books[(ask_book_id, 0)],
+            'base_balance': results[base_balance_call],
+            'quote_balance': results[quote_balance_call],
+            'orders': {order_id: results[call] for order_id, call in order_calls.items()},
+        }
+
+    def fetch_order_statuses(self, order_ids: list, block_identifier='latest') -> dict:
+        batch = BatchReader(self.web3, self.timeout)
+        order_calls = {order_id: batch.add(self.trade_pairs_contract.functions.getOrder(bytes.fromhex(to_order_id(order_id)[2:])))
+                       for order_id in order_ids}
+        results = batch.execute(block_identifier)
+        return {order_id: results[call] for order_id, call in order_calls.items()}
+
+    def order_status_changes(self, txn_receipt) -> list:
+        """OrderStatusChanged events emitted by a mined transaction."""
+        return self.trade_pairs_contract.events.OrderStatusChanged().processReceipt(txn_receipt, errors=DISCARD)
+
+    def observe_block(self, block_number: int):
+        if self.latest_block_number is None or block_number > self.latest_block_number:
+            self.latest_block_number = block_number
+
+    def _append_book_levels(self, book_levels: BookLevels, prices, quantities):
+        for price, quantity in zip(prices, quantities):
+            if price == 0:
+                break
+            if quantity:
+                book_levels.append(price // self.price_tick, quantity // self.quantity_lot)
+
+    def expected_gas_cost(self, fn_name: str, batch_size=None):
+        """Gas cost in wei of a TradePairs call, of batch_size order ids for cancelAllOrders, served from the gas oracle
+        cache. None while it is cold."""
+        return self.gas_oracle.cached_cost(self.trade_pairs_contract.address, fn_name, batch_size)
+
     def estimate_gas_for_txn(self, txn):
 
-        gas_amount = txn.estimateGas()
-        gas_price = self.web3.eth.gasPrice
+        gas_amount, gas_price = self.gas_oracle.estimate(txn, self.trade_address)
         gas_cost = Decimal(gas_price * gas_amount) / 10 ** 18
         return gas_cost
 
     def add_order(self, trade_pair_id, price: Decimal, base_amount: Decimal, order_side: OrderSide,
-                  order_type: OrderType):
+                  order_type: OrderType, on_receipt=None):
+        return self.add_order_ticks(trade_pair_id, self.to_ticks(price), self.to_lots(base_amount), order_side,
+                                    order_type, on_receipt)
+
+    def add_order_ticks(self, trade_pair_id, price_ticks: int, lots: int, order_side: OrderSide,
+                        order_type: OrderType, on_receipt=None):
+        """add_order with the price in ticks and the amount in lots, encoded to EVM integers by multiplication only."""
 
-        quote_amount = base_amount * price
-        if (quote_amount < self.min_trade_amount) or (quote_amount > self.max_trade_amount):
+        notional = price_ticks * lots
+        if (notional < self.min_trade_notional) or (notional > self.max_trade_notional):
+            quote_amount = Decimal(notional).scaleb(-self.quote_display_decimals - self.base_display_decimals)
             logger.info(
                 f"Order size {quote_amount:.3f} {self.quote_symbol} must be between {self.min_trade_amount} and {self.max_trade_amount}")
             return None
 
-        price_norm = int(round(price, self.quote_display_decimals) * 10 ** self.quote_decimals)
-        base_amount_norm = int(round(base_amount, self.base_display_decimals) * 10 ** self.base_decimals)
         trade_pair_id_bytes = bytes(trade_pair_id, 'utf-8')
 
         # Build transaction, estimate gas and place order
-        order_txn = self.trade_pairs_contract.functions.addOrder(trade_pair_id_bytes, price_norm, base_amount_norm,
-                                                                 order_side.value, order_type.value)
+        order_txn = self.trade_pairs_contract.functions.addOrder(trade_pair_id_bytes, price_ticks * self.price_tick,
+                                                                 lots * self.quantity_lot, order_side.value,
+                                                                 order_type.value)
         gas_estimate = self.estimate_gas_for_txn(order_txn)
-        logger.info(f"Placing Order Gas Estimate: {gas_estimate} AVAX")
-        # TODO: Add logic for placing transaction if profit > gas
-        txn_hash = order_txn.transact()
+        logger.debug("Placing Order Gas Estimate: %s AVAX", gas_estimate)
+        # Whether the order pays for its gas is decided by the QuoteGate before it gets here
+        txn_hash = self._send_transaction(self._build_transaction(order_txn))
 
-        # Wait for transaction receipt
-        txn_receipt = self.web3.eth.wait_for_transaction_receipt(txn_hash, timeout=60)
-        if txn_receipt['status'] == 1:
-            logger.info(
-                f"SUCCESS - Placing {repr(order_type)} {repr(order_side)} Order. Price {price:.4f}. Size {base_amount:.4f} {self.base_symbol}")
-        elif txn_receipt['status'] == 0:
-            logger.warning(
-                f"FAILED - Placing {repr(order_type)} {repr(order_side)} Order. Price {price:.4f}. Size {base_amount:.4f} {self.base_symbol}")
-        elif txn_receipt is None:
-            logger.warning(f"FAILED - Placing transaction was not mined")
-
-        return txn_receipt
+        description = f"Placing {repr(order_type)} {repr(order_side)} Order. Price {self.from_ticks(price_ticks)}. Size {self.from_lots(lots)} {self.base_symbol}"
+        return self._process_transaction(txn_hash, description, on_receipt, order_txn)
 
-    def cancel_order(self, trade_pair_id: str, order_id: str):
-        # Strip 0x from order_id string and convert to bytes
-        order_id_bytes = bytes.fromhex(order_id[2:])
+    def cancel_order(self, trade_pair_id: str, order_id: str, on_receipt=None):
+        # Strip 0x from the canonical order id and convert to bytes
+        order_id_bytes = bytes.fromhex(to_order_id(order_id)[2:])
         trade_pair_id_bytes = bytes(trade_pair_id, 'utf-8')
 
         cancel_order_txn = self.trade_pairs_contract.functions.cancelOrder(trade_pair_id_bytes, order_id_bytes)
         gas_estimate = self.estimate_gas_for_txn(cancel_order_txn)
-        logger.info(f"Cancel Order Gas Estimate: {gas_estimate} AVAX")
-        txn_hash = cancel_order_txn.transact()
+        logger.debug("Cancel Order Gas Estimate: %s AVAX", gas_estimate)
+        txn_hash = self._send_transaction(self._build_transaction(cancel_order_txn))
 
-        # Wait for transaction receipt
-        txn_receipt = self.web3.eth.wait_for_transaction_receipt(txn_hash, timeout=60)
-        if txn_receipt['status'] == 1:
-            logger.info(f"SUCCESS - Cancelled {order_id}")
-        elif txn_receipt['status'] == 0:
-            logger.warning(f"FAILED - Cancelling {order_id}")
-        elif txn_receipt is None:
-            logger.warning(f"FAILED - Cancelling transaction was not mined")
+        return self._process_transaction(txn_hash, f"Cancelling {order_id}", on_receipt, cancel_order_txn)
 
-    def cancel_all_orders(self, trade_pair_id: str, order_id_list: list):
-        # Strip 0x from order_ids and convert to bytes
-        # TODO: Add logic to cancel in batches if more than 20 orders
+    def cancel_all_orders(self, trade_pair_id: str, order_id_list: list, on_receipt=None):
+        # cancelAllOrders takes at most 20 ids, callers split longer lists with OrderPlan.cancel_batches
+        # Strip 0x from the canonical order ids and convert to bytes
         trade_pair_id = bytes(trade_pair_id, 'utf-8')
         order_id_bytes_list = []
         for order_id in order_id_list:
-            order_id_bytes = bytes.fromhex(order_id[2:])
+            order_id_bytes = bytes.fromhex(to_order_id(order_id)[2:])
             order_id_bytes_list.append(order_id_bytes)
 
         cancel_orders_txn = self.trade_pairs_contract.functions.cancelAllOrders(trade_pair_id, order_id_bytes_list)
         gas_estimate = self.estimate_gas_for_txn(cancel_orders_txn)
-        logger.info(f"Cancel Orders Gas Estimate: {gas_estimate} AVAX")
-        txn_hash = cancel_orders_txn.transact()
+        logger.debug("Cancel Orders Gas Estimate: %s AVAX", gas_estimate)
+        txn_hash = self._send_transaction(self._build_transaction(cancel_orders_txn))
 
-        # Wait for transaction receipt
-        txn_receipt = self.web3.eth.wait_for_transaction_receipt(txn_hash, timeout=60)
-        if txn_receipt['status'] == 1:
-            logger.info(f"SUCCESS - Cancelled {order_id_list}")
-        elif txn_receipt['status'] == 0:
-            logger.warning(f"FAILED - Cancelling {order_id_list}")
-        elif txn_receipt is None:
-            logger.warning(f"FAILED - Cancelling transaction was not mined")
+        return self._process_transaction(txn_hash, f"Cancelling {order_id_list}", on_receipt, cancel_orders_txn)
 
-    def _request_dexalot(self, path, query=None, params=None, timeout=None, max_retries=None):
+    def _build_transaction(self, contract_txn) -> dict:
+        # Legacy gas price so transactions can be replaced by re-sending with a bumped price
+        with metrics.timer('tx_build'):
+            gas_amount, gas_price = self.gas_oracle.estimate(contract_txn, self.trade_address)
+            return contract_txn.buildTransaction({'from': self.trade_address, 'gas': gas_amount, 'gasPrice': gas_price})
 
-        url = self.base_url + path
+    def _send_transaction(self, txn: dict, nonce=None):
+        """
+        Sign and send txn with a locally allocated nonce so it does not have to wait for earlier transactions. A given
+        nonce (a replacement or gap filler) is left to the caller if the send fails, only a nonce allocated here is
+        released.
+        """
+        allocated = nonce is None
+        if allocated:
+            nonce = self.nonce_manager.allocate()
+        txn = dict(txn, nonce=nonce)
+        try:
+            with metrics.timer('tx_sign'):
+                signed_txn = sign_tx(txn, self.web3)
+            with metrics.timer('tx_send'):
+                txn_hash = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        except ValueError as e:
+            # Node rejected the transaction. Either our nonce view is stale or the nonce was never used
+            if 'nonce too low' in str(e):
+                self.nonce_manager.resync()
+            elif allocated:
+                self.nonce_manager.release(nonce)
+            raise
+        except Exception:
+            # Connection errors, timeouts or signing failures. The nonce is handed out again or filled as a gap so later
+            # transactions are not stuck behind it
+            if allocated:
+                self.nonce_manager.release(nonce)
+            raise
+        self.nonce_manager.mark_sent(nonce, txn_hash, txn)
+        # Timed until our own OrderStatusChanged event of this transaction is seen
+        metrics.mark(bytes(txn_hash))
+        return txn_hash
+
+    def replace_transaction(self, nonce: int, gas_price_bump=1.125):
+        """Re-send the in flight transaction with the given nonce at a higher gas price (replace-by-fee)."""
+        txn = self.nonce_manager.replacement(nonce, gas_price_bump)
+        logger.info(f"Replacing transaction with nonce {nonce}. New gas price {txn['gasPrice']}")
+        return self._send_transaction(txn, nonce=nonce)
+
+    def nonce_snapshot(self):
+        return self.nonce_manager.snapshot()
+
+    def restore_nonces(self, snapshot: dict):
+        """Restore the nonce state of a checkpoint and track the receipts of its in flight transactions again."""
+        for txn_hash in self.nonce_manager.restore(snapshot):
+            self.track_in_flight(txn_hash, "Restored transaction")
+
+    def track_in_flight(self, txn_hash, description: str):
+        # Receipt of a transaction only the nonce manager waits for
+        if self.tx_pipeline is not None:
+            self.tx_pipeline.submit(txn_hash, description,
+                                    on_receipt=lambda pending_txn: self._record_receipt(pending_txn.txn_hash,
+                                                                                        pending_txn.receipt))
+
+    def fill_nonce_gaps(self, gas_price_bump=1.125):
+        """
+        Send zero value self transfers for nonces that never made it on chain so later transactions can be mined. The
+        gas price is bumped like a replacement in case the dropped transaction is still in a mempool. Gaps that could
+        not be filled, the failed one included, are kept for the next attempt.
+        """
+        gaps = self.nonce_manager.fill_gaps()
+        for i, nonce in enumerate(gaps):
+            logger.info(f"Filling nonce gap {nonce}")
+            txn = {
+                'to': self.trade_address,
+                'value': 0,
+                'chainId': self.web3.eth.chainId,
+                'gas': 21000,
+                'gasPrice': int(self.gas_oracle.get_gas_price() * gas_price_bump) + 1,
+            }
+            try:
+                self._send_transaction(txn, nonce=nonce)
+            except Exception as e:
+                logger.error(f"Could not fill nonce gap {nonce} due to: {e}")
+                self.nonce_manager.add_gaps(gaps[i:])
+                raise
+
+    def _record_receipt(self, txn_hash, txn_receipt, contract_txn=None):
+        if contract_txn is not None:
+            self.gas_oracle.record_receipt(contract_txn, txn_receipt)
+        if txn_receipt is not None:
+            self.observe_block(txn_receipt['blockNumber'])
+            self.nonce_manager.mark_mined(txn_hash)
+        elif self.tx_pipeline is not None:
+            # Blocking RPCs, run off the event loop and outside the receipt callback
+            asyncio.get_event_loop().create_task(self.handle_dropped(txn_hash))
+        else:
+            self._handle_dropped(txn_hash)
+
+    def _handle_dropped(self, txn_hash) -> bool:
+        try:
+            if not self.nonce_manager.mark_dropped(txn_hash):
+                return False
+            self.fill_nonce_gaps()
+        except Exception as e:
+            logger.error(f"Could not recover nonce of dropped transaction {Web3.toHex(txn_hash)} due to: {e}")
+        return True
+
+    async def handle_dropped(self, txn_hash):
+        """Recover the nonce of a transaction not mined in time. One that is still pending is tracked further."""
+        dropped = await asyncio.get_event_loop().run_in_executor(None, self._handle_dropped, txn_hash)
+        if not dropped:
+            self.track_in_flight(txn_hash, "Slow transaction")
+
+    def _process_transaction(self, txn_hash, description: str, on_receipt=None, contract_txn=None):
+        """
+        With a TransactionPipeline attached the transaction is handed over and a PendingTransaction is returned
+        immediately, the receipt is logged and passed to on_receipt once mined. Without one we block on the receipt.
+        """
+        if self.tx_pipeline is not None:
+            return self.tx_pipeline.submit(txn_hash, description,
+                                           on_receipt=self._receipt_handler(description, on_receipt, contract_txn))
 
-        if timeout is None:
-            timeout = self.timeout
+        # Wait for transaction receipt
+        txn_receipt = self.web3.eth.wait_for_transaction_receipt(txn_hash, timeout=60)
+        self._record_receipt(txn_hash, txn_receipt, contract_txn)
+        self._log_receipt(txn_receipt, description)
+        return txn_receipt
+
+    def _receipt_handler(self, description: str, on_receipt=None, contract_txn=None):
+        def handle_receipt(pending_txn):
+            try:
+                self._record_receipt(pending_txn.txn_hash, pending_txn.receipt, contract_txn)
+                self._log_receipt(pending_txn.receipt, description)
+            finally:
+                # The caller always hears back, or it would wait on the transaction forever
+                if on_receipt is not None:
+                    on_receipt(pending_txn)
+
+        return handle_receipt
+
+    def _log_receipt(self, txn_receipt, description: str):
+        if txn_receipt is None:
+            logger.warning("FAILED - %s. Transaction was not mined", description)
+        elif txn_receipt['status'] == 1:
+            logger.info("SUCCESS - %s", description)
+        elif txn_receipt['status'] == 0:
+            logger.warning("FAILED - %s", description)
 
-        def retry():
-            self.retries += 1
-            if self.retries > max_retries:
-                raise Exception("Max retries on %s (%s) hit, raising." % (path, json.dumps(params or '')))
-            return self._request_dexalot(path, query, params, timeout, max_retries)
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff_base * 2 ** attempt, self.backoff_max)
 
-        try:
-            response = requests.get(url=url, params=params)
-        except requests.exceptions.Timeout as e:
-            logger.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(params or '')))
-            return retry()
+    def _request_dexalot(self, path, params=None, timeout=None, max_retries=None):
 
-        self.retries = 0
+        url = self.base_url + path
+        timeout = self.timeout if timeout is None else timeout
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        for attempt in range(max_retries + 1):
+            try:
+                with metrics.timer('rest_request'):
+                    response = self.session.get(url=url, params=params, timeout=timeout)
+                    response.raise_for_status()
+                    return response.json()
+            except requests.exceptions.Timeout:
+                logger.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(params or '')))
+            except (requests.exceptions.ConnectionError, requests.exceptions.HTTPError) as e:
+                # Client errors will not succeed on retry
+                if isinstance(e, requests.exceptions.HTTPError) and e.response.status_code < 500:
+                    raise
+                logger.warning("Request failed: %s (%s) due to %s, retrying..." % (path, json.dumps(params or ''), e))
+            if attempt < max_retries:
+                time.sleep(self._backoff(attempt))
+
+        raise MaxRetriesException(path, params)
+
+    async def _request_dexalot_async(self, path, params=None, timeout=None, max_retries=None):
 
-        return json.loads(response.text)
+        url = self.base_url + path
+        timeout = self.timeout if timeout is None else timeout
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        if self.async_session is None or self.async_session.closed:
+            self.async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=8))
+
+        for attempt in range(max_retries + 1):
+            try:
+                with metrics.timer('rest_request'):
+                    async with self.async_session.get(url, params=params,
+                                                      timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(params or '')))
+            except aiohttp.ClientError as e:
+                if isinstance(e, aiohttp.ClientResponseError) and e.status < 500:
+                    raise
+                logger.warning("Request failed: %s (%s) due to %s, retrying..." % (path, json.dumps(params or ''), e))
+            if attempt < max_retries:
+                await asyncio.sleep(self._backoff(attempt))
+
+        raise MaxRetriesException(path, params)
+
+    async def close(self):
+        self.session.close()
+        if self.async_session is not None:
+            await self.async_session.close()
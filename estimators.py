@@ -0,0 +1,135 @@
+import math
+from array import array
+
+from enums import OrderSide
+
+
+class RingBuffer:
+    """Fixed-size ring of signed integers with a running total. Pushing a value evicts the oldest once full, both are
+    O(1) and the total is never recomputed from the ring."""
+
+    __slots__ = ('values', 'index', 'count', 'total')
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"Ring buffer capacity must be positive, got {capacity}")
+        self.values = array('q', bytes(8 * capacity))
+        self.index = 0
+        self.count = 0
+        self.total = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, value: int):
+        if self.count == len(self.values):
+            self.total -= self.values[self.index]
+        else:
+            self.count += 1
+        self.values[self.index] = value
+        self.total += value
+        self.index = (self.index + 1) % len(self.values)
+
+
+class EwmaVolatility:
+    """Exponentially weighted volatility of log returns between consecutive trade prices, per trade and as a fraction
+    of the price. The weight of a return halves every half_life trades."""
+
+    __slots__ = ('alpha', 'variance', 'last_price', 'count')
+
+    def __init__(self, half_life: float):
+        self.alpha = 1 - 0.5 ** (1 / half_life)
+        self.variance = 0.0
+        self.last_price = None
+        self.count = 0
+
+    def update(self, price: int):
+        if price <= 0:
+            return
+        if self.last_price is not None:
+            log_return = math.log(price / self.last_price)
+            self.variance += self.alpha * (log_return * log_return - self.variance)
+            self.count += 1
+        self.last_price = price
+
+    @property
+    def value(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class TradeFlow:
+    """Volume and aggressor side of the last window trades. Volume bought by takers counts positive, sold negative."""
+
+    __slots__ = ('signed_volume', 'volume', 'buys')
+
+    def __init__(self, window: int):
+        self.signed_volume = RingBuffer(window)
+        self.volume = RingBuffer(window)
+        self.buys = RingBuffer(window)
+
+    def update(self, aggressor: OrderSide, quantity: int):
+        self.signed_volume.push(quantity if aggressor == OrderSide.BUY else -quantity)
+        self.volume.push(quantity)
+        self.buys.push(aggressor == OrderSide.BUY)
+
+    def imbalance(self) -> float:
+        """Net taker volume as a fraction of the traded volume, from -1 (all sold) to 1 (all bought)."""
+        return self.signed_volume.total / self.volume.total if self.volume.total else 0.0
+
+    def buy_ratio(self) -> float:
+        """Fraction of the trades in the window initiated by a buyer."""
+        return self.buys.total / len(self.buys) if len(self.buys) else 0.5
+
+
+def own_aggressor(maker_order, taker_order):
+    """Side of the taker of a trade one of our orders took part in, None if neither order is ours."""
+    if taker_order is not None:
+        return taker_order.side
+    if maker_order is not None:
+        return OrderSide.SELL if maker_order.side == OrderSide.BUY else OrderSide.BUY
+    return None
+
+
+def classify_aggressor(price: int, best_bid: int, best_ask: int, last_price, last_aggressor):
+    """
+    Side of the taker of a trade from the book before the trade: trades at or through the ask were bought, at or
+    through the bid sold, inside the spread by their side of the mid. Trades at the mid fall back to the tick rule,
+    an uptick was bought and a downtick sold, and an unchanged price repeats the last aggressor.
+    """
+    if best_ask and price >= best_ask:
+        return OrderSide.BUY
+    if best_bid and price <= best_bid:
+        return OrderSide.SELL
+    if best_bid and best_ask:
+        mid_twice = best_bid + best_ask
+        if 2 * price != mid_twice:
+            return OrderSide.BUY if 2 * price > mid_twice else OrderSide.SELL
+    if last_price is None or price == last_price:
+        return last_aggressor
+    return OrderSide.BUY if price > last_price else OrderSide.SELL
+
+
+class MarketEstimators:
+    """Streaming estimators of the pair's trades, updated in O(1) from every Executed event."""
+
+    def __init__(self, volatility_half_life: float, trade_flow_window: int):
+        self.volatility = EwmaVolatility(volatility_half_life)
+        self.trade_flow = TradeFlow(trade_flow_window)
+        self.warmup = math.ceil(volatility_half_life)
+        self.last_price = None
+        self.last_aggressor = None
+
+    @property
+    def warmed_up(self) -> bool:
+        return self.volatility.count >= self.warmup
+
+    def update(self, price: int, quantity: int, aggressor=None, best_bid=0, best_ask=0):
+        """Apply a trade, price in ticks and quantity in lots. The aggressor is classified from the book when it is
+        not known."""
+        if aggressor is None:
+            aggressor = classify_aggressor(price, best_bid, best_ask, self.last_price, self.last_aggressor)
+        self.volatility.update(price)
+        if aggressor is not None:
+            self.trade_flow.update(aggressor, quantity)
+            self.last_aggressor = aggressor
+        self.last_price = price
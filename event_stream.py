@@ -0,0 +1,248 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import websockets
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+from web3._utils.method_formatters import log_entry_formatter
+
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger('dexalot_event_stream')
+
+
+class LazyEvent:
+    """
+    A raw log of a known contract event. Indexed arguments can be compared as raw topics through indexed(), the data
+    fields are only ABI decoded when args (or another decoded field) is first accessed.
+    """
+
+    __slots__ = ('log_entry', 'contract_event', 'topic_positions', 'received_timestamp', '_decoded')
+
+    def __init__(self, log_entry, contract_event, topic_positions: dict):
+        self.log_entry = log_entry
+        self.contract_event = contract_event
+        self.topic_positions = topic_positions
+        self.received_timestamp = time.monotonic()
+        self._decoded = None
+
+    @property
+    def event(self) -> str:
+        return self.contract_event.event_name
+
+    @property
+    def blockNumber(self) -> int:
+        return self.log_entry['blockNumber']
+
+    @property
+    def transactionHash(self):
+        return self.log_entry['transactionHash']
+
+    @property
+    def logIndex(self) -> int:
+        return self.log_entry['logIndex']
+
+    def indexed(self, arg_name: str):
+        """Raw 32 byte topic of an indexed argument, None if the argument is not indexed for this event."""
+        position = self.topic_positions.get(arg_name)
+        return None if position is None else bytes(self.log_entry['topics'][position])
+
+    @property
+    def args(self):
+        if self._decoded is None:
+            self._decoded = self.contract_event.processLog(self.log_entry)
+        return self._decoded.args
+
+
+class EventStream:
+    """
+    Async iterator of lazily decoded contract events. Logs are pushed over a websocket eth_subscribe("logs") subscription which
+    is reconnected with backoff when it drops. Without a websocket (or while reconnecting) logs are polled with
+    eth_getLogs for every new block, so reaction latency is bounded by the block time. After a (re)connect the logs
+    since the last seen block are backfilled so nothing is missed, duplicates from the overlap are dropped.
+
+    A single log filter covers all events so a subscription delivers them in chain order (Executed before the
+    OrderStatusChanged of the orders it fills). The node filters by event signature, and by indexed_filters (e.g
+    {'pair': [pair_id]}) only where the argument is indexed at the same topic position in every event. For the
+    TradePairs events it is not (OrderStatusChanged indexes traderaddress before pair, Executed does not index it at
+    the same position), so the pair is checked here against the raw topics before an event is queued.
+    """
+
+    def __init__(self, web3: Web3, contract, event_names: list, ws_url=None, poll_interval=0.25, from_block=None,
+                 reconnect_delay=1, max_reconnect_delay=30, indexed_filters=None):
+        self.web3 = web3
+        self.contract = contract
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.last_block = None if from_block is None else from_block - 1
+        self.events = {}
+        self.topic_positions = {}
+        for event_name in event_names:
+            event = getattr(self.contract.events, event_name)()
+            event_topic = event_abi_to_log_topic(event.abi)
+            self.events[event_topic] = event
+            indexed_inputs = [event_input for event_input in event.abi['inputs'] if event_input['indexed']]
+            self.topic_positions[event_topic] = {event_input['name']: position
+                                                 for position, event_input in enumerate(indexed_inputs, start=1)}
+        self.indexed_filters = self._encode_indexed_filters(indexed_filters or {})
+        self.topics = self._build_topics()
+        self.queue = asyncio.Queue()
+        self.backfilled = asyncio.Event()  # Set once the logs up to the head at the first poll were queued
+        self.recent_logs = deque(maxlen=1024)
+        self.recent_log_keys = set()
+        self.last_timed_block = 0
+
+    def _encode_indexed_filters(self, indexed_filters: dict) -> dict:
+        # Topics of indexed static arguments are their ABI encoded values
+        encoded_filters = {}
+        for arg_name, values in indexed_filters.items():
+            arg_type = None
+            for event in self.events.values():
+                for event_input in event.abi['inputs']:
+                    if event_input['name'] == arg_name and event_input['indexed']:
+                        arg_type = event_input['type']
+            if arg_type is None:
+                raise ValueError(f"{arg_name} is not an indexed argument of any subscribed event")
+            encoded_filters[arg_name] = {self.web3.codec.encode_single(arg_type, value) for value in values}
+        return encoded_filters
+
+    def _build_topics(self) -> list:
+        topics = [[Web3.toHex(event_topic) for event_topic in self.events]]
+        local_filters = set(self.indexed_filters)
+        for position in range(1, 4):
+            topic_values = None
+            for arg_name, values in self.indexed_filters.items():
+                if all(positions.get(arg_name) == position for positions in self.topic_positions.values()):
+                    topic_values = sorted(Web3.toHex(value) for value in values)
+                    local_filters.discard(arg_name)
+            topics.append(topic_values)
+        if local_filters:
+            logger.info(f"Filtering {sorted(local_filters)} locally, not indexed at the same position in every event")
+        while topics[-1] is None:
+            topics.pop()
+        return topics
+
+    def _matches_indexed_filters(self, log_entry, topic_positions: dict) -> bool:
+        for arg_name, values in self.indexed_filters.items():
+            position = topic_positions.get(arg_name)
+            if position is not None and bytes(log_entry['topics'][position]) not in values:
+                return False
+        return True
+
+    def log_filter(self, from_block=None, to_block=None) -> dict:
+        log_filter = {'address': self.contract.address, 'topics': self.topics}
+        if from_block is not None:
+            log_filter['fromBlock'] = from_block
+            log_filter['toBlock'] = to_block
+        return log_filter
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        task = asyncio.get_event_loop().create_task(self.run())
+        try:
+            while True:
+                yield await self.queue.get()
+                # The consumer asks for the next event once it handled this one
+                self.queue.task_done()
+        finally:
+            task.cancel()
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        if self.last_block is None:
+            self.last_block = await loop.run_in_executor(None, lambda: self.web3.eth.block_number)
+
+        delay = self.reconnect_delay
+        while True:
+            if self.ws_url is not None:
+                try:
+                    await self._run_websocket()
+                    delay = self.reconnect_delay
+                except Exception as e:
+                    logger.warning(f"Log subscription dropped due to: {e}. Polling for {delay}s before reconnecting")
+            # Poll for new blocks until the next reconnect attempt, or forever without a websocket
+            poll_until = loop.time() + delay
+            while self.ws_url is None or loop.time() < poll_until:
+                await self._poll_logs()
+                await asyncio.sleep(self.poll_interval)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _run_websocket(self):
+        async with websockets.connect(self.ws_url) as ws:
+            await ws.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe',
+                                      'params': ['logs', self.log_filter()]}))
+            response = json.loads(await ws.recv())
+            if 'error' in response:
+                raise Exception(response['error'])
+            logger.info(f"Subscribed to logs of {self.contract.address} over websocket")
+
+            # Catch up on anything emitted while we were not subscribed
+            await self._poll_logs()
+            async for message in ws:
+                log_entry = log_entry_formatter(json.loads(message)['params']['result'])
+                self._emit(log_entry)
+                # Only blocks before this one are known to be complete, a backfill restarts from this block
+                self.last_block = max(self.last_block, log_entry['blockNumber'] - 1)
+
+    async def _poll_logs(self):
+        loop = asyncio.get_event_loop()
+        block_number = await loop.run_in_executor(None, lambda: self.web3.eth.block_number)
+        if block_number <= self.last_block:
+            self.backfilled.set()
+            return
+        log_entries = await loop.run_in_executor(
+            None, self.web3.eth.get_logs, self.log_filter(self.last_block + 1, block_number))
+        for log_entry in log_entries:
+            self._emit(log_entry)
+        self.last_block = max(self.last_block, block_number)
+        self.backfilled.set()
+
+    async def wait_caught_up(self):
+        """Wait until the logs from from_block up to the head at the first poll were queued and handled by the
+        consumer, so state built from them reflects the chain at that block."""
+        await self.backfilled.wait()
+        await self.queue.join()
+
+    def _emit(self, log_entry):
+        # Logs removed by a reorg are skipped, the next state update picks up the canonical state
+        if log_entry.get('removed'):
+            return
+        log_key = (log_entry['transactionHash'], log_entry['logIndex'])
+        if log_key in self.recent_log_keys:
+            return
+        if len(self.recent_logs) == self.recent_logs.maxlen:
+            self.recent_log_keys.discard(self.recent_logs[0])
+        self.recent_logs.append(log_key)
+        self.recent_log_keys.add(log_key)
+
+        event = self.decode(log_entry)
+        if event is not None:
+            self.queue.put_nowait(event)
+            if log_entry['blockNumber'] > self.last_timed_block:
+                self.last_timed_block = log_entry['blockNumber']
+                asyncio.get_event_loop().create_task(self._observe_block_delay(log_entry['blockNumber'], time.time()))
+
+    async def _observe_block_delay(self, block_number: int, received_time: float):
+        # Delay from block production to receiving its first event, one block header read per block with events
+        loop = asyncio.get_event_loop()
+        try:
+            block = await loop.run_in_executor(None, self.web3.eth.get_block, block_number)
+        except Exception as e:
+            logger.warning(f"Could not fetch block {block_number} due to: {e}")
+            return
+        metrics.observe('event_block_delay', received_time - block['timestamp'])
+
+    def decode(self, log_entry):
+        """LazyEvent of a raw log, None if it is not a subscribed event or does not pass the indexed filters."""
+        event_topic = log_entry['topics'][0]
+        event = self.events.get(event_topic)
+        if event is None or not self._matches_indexed_filters(log_entry, self.topic_positions[event_topic]):
+            return None
+        return LazyEvent(log_entry, event, self.topic_positions[event_topic])
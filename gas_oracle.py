@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import deque
+
+from web3 import Web3
+
+from logger import get_logger
+
+logger = get_logger('dexalot_gas_oracle')
+
+
+class GasOracle:
+    """
+    Serves gas limits and gas price from memory so sending a transaction does not need estimateGas and gasPrice round
+    trips. Gas limits are learned per contract function, and per batch size for functions taking a list such as
+    cancelAllOrders, from the gasUsed of recent receipts. The gas price is refreshed by run() in the background. A cold
+    cache (unseen function or stale gas price) falls back to a live call and seeds the cache with its result. A
+    transaction that ran out of gas drops what was learned for its function so the next one is estimated again.
+    """
+
+    def __init__(self, web3: Web3, gas_price_ttl=15, refresh_interval=5, gas_limit_headroom=1.25, receipt_window=20):
+        self.web3 = web3
+        self.gas_price_ttl = gas_price_ttl
+        self.refresh_interval = refresh_interval
+        self.gas_limit_headroom = gas_limit_headroom
+        self.receipt_window = receipt_window
+        self.gas_used = {}  # (contract address, function name, batch size) -> deque of recent gasUsed
+        self.gas_limits = {}  # Same key -> last gas limit handed out
+        self.gas_price = None
+        self.gas_price_timestamp = None
+
+    @staticmethod
+    def batch_size(contract_txn):
+        # Number of items of the first list argument, gas usage grows with it. None for functions without one
+        for arg in contract_txn.args:
+            if isinstance(arg, (list, tuple)):
+                return len(arg)
+        return None
+
+    @classmethod
+    def function_key(cls, contract_txn):
+        return contract_txn.address, contract_txn.fn_name, cls.batch_size(contract_txn)
+
+    def get_gas_price(self) -> int:
+        if self.gas_price is None or time.monotonic() - self.gas_price_timestamp > self.gas_price_ttl:
+            logger.debug("Gas price cache is cold. Fetching live gas price")
+            self.update_gas_price()
+        return self.gas_price
+
+    def get_gas_limit(self, contract_txn, sender=None) -> int:
+        key = self.function_key(contract_txn)
+        recent_gas_used = self.gas_used.get(key)
+        if not recent_gas_used:
+            logger.debug(f"No gas usage recorded for {key[1]} of batch size {key[2]}. Falling back to estimateGas")
+            gas_estimate = contract_txn.estimateGas({'from': sender} if sender else None)
+            self.record_gas_used(key, gas_estimate)
+            recent_gas_used = self.gas_used[key]
+        # Matching against resting orders makes gas usage vary so size from the worst recent case
+        gas_limit = int(max(recent_gas_used) * self.gas_limit_headroom)
+        self.gas_limits[key] = gas_limit
+        return gas_limit
+
+    def cached_cost(self, contract_address: str, fn_name: str, batch_size=None):
+        """
+        Expected cost in wei of a contract function from the mean of its recent gasUsed and the cached gas price,
+        without any RPC call. A batch size that was not seen yet is scaled per item from the closest one that was.
+        None while either cache is cold.
+        """
+        if self.gas_price is None:
+            return None
+        recent_gas_used = self.gas_used.get((contract_address, fn_name, batch_size))
+        scale = 1
+        if not recent_gas_used and batch_size:
+            seen_sizes = [key[2] for key, gas_used in self.gas_used.items()
+                          if key[:2] == (contract_address, fn_name) and key[2] and gas_used]
+            if seen_sizes:
+                seen_size = min(seen_sizes, key=lambda size: abs(size - batch_size))
+                recent_gas_used = self.gas_used[(contract_address, fn_name, seen_size)]
+                scale = batch_size / seen_size
+        if not recent_gas_used:
+            return None
+        return int(sum(recent_gas_used) * scale) * self.gas_price // len(recent_gas_used)
+
+    def estimate(self, contract_txn, sender=None):
+        return self.get_gas_limit(contract_txn, sender), self.get_gas_price()
+
+    def record_gas_used(self, key, gas_used: int):
+        if key not in self.gas_used:
+            self.gas_used[key] = deque(maxlen=self.receipt_window)
+        self.gas_used[key].append(gas_used)
+
+    def record_receipt(self, contract_txn, txn_receipt, out_of_gas_ratio=0.95):
+        if txn_receipt is None:
+            return
+        key = self.function_key(contract_txn)
+        if txn_receipt['status'] == 1:
+            self.record_gas_used(key, txn_receipt['gasUsed'])
+            return
+        gas_limit = self.gas_limits.get(key)
+        if gas_limit and txn_receipt['gasUsed'] >= gas_limit * out_of_gas_ratio:
+            # Reverted using (nearly) all its gas: the learned limit is too low, estimate the next one again
+            logger.warning(f"{key[1]} of batch size {key[2]} ran out of gas at {txn_receipt['gasUsed']}. "
+                           f"Dropping its recorded gas usage")
+            self.gas_used.pop(key, None)
+            self.gas_limits.pop(key, None)
+
+    def update_gas_price(self):
+        self.gas_price = self.web3.eth.gasPrice
+        self.gas_price_timestamp = time.monotonic()
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.update_gas_price)
+            except Exception as e:
+                logger.warning(f"Could not refresh gas price due to: {e}")
+            await asyncio.sleep(self.refresh_interval)
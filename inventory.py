@@ -0,0 +1,91 @@
+from collections import deque
+
+from enums import OrderSide
+from logger import get_logger
+from order_diff import TOLERANCE_SCALE
+
+logger = get_logger('dexalot_inventory')
+
+
+class InventoryLedger:
+    """
+    In-memory Portfolio balances of the base and quote token, in EVM units, so quotes can be skewed by our position
+    without reading the Portfolio contract before every requote. Bootstrapped from a Portfolio getBalance snapshot,
+    moved in O(1) by every fill of our orders in Executed events, fees included, and reconciled against the Portfolio
+    balances read on every full state update.
+
+    Fills are remembered with their block until a snapshot at or after that block confirms them, so a snapshot that
+    was read before the latest fills were applied does not roll them back.
+    """
+
+    def __init__(self, base_decimals: int, quote_decimals: int):
+        self.base_decimals = base_decimals
+        self.quote_decimals = quote_decimals
+        self.base = 0
+        self.quote = 0
+        self.fills = deque()  # (block number, base delta, quote delta) of fills not yet confirmed by a snapshot
+        self.block_number = -1  # Block of the last Portfolio snapshot, fills up to it are already in the balances
+        self.initialized = False
+
+    def notional(self, price: int, quantity: int) -> int:
+        """Quote amount of quantity base at price, both in EVM units."""
+        return price * quantity // 10 ** self.base_decimals
+
+    def apply_fill(self, block_number: int, order_side: OrderSide, price: int, quantity: int, fee: int):
+        """Apply a fill of one of our orders. The fee is charged in the token received: base when buying, quote when
+        selling."""
+        if block_number <= self.block_number:
+            return
+        if order_side == OrderSide.BUY:
+            base_delta = quantity - fee
+            quote_delta = -self.notional(price, quantity)
+        else:
+            base_delta = -quantity
+            quote_delta = self.notional(price, quantity) - fee
+        self.base += base_delta
+        self.quote += quote_delta
+        self.fills.append((block_number, base_delta, quote_delta))
+
+    def reconcile(self, block_number: int, base_balance: int, quote_balance: int) -> bool:
+        """Reset the ledger to Portfolio balances read at block_number, replaying the fills of later blocks. Returns
+        True if the ledger had drifted from the snapshot."""
+        while self.fills and self.fills[0][0] <= block_number:
+            self.fills.popleft()
+        base = base_balance + sum(fill[1] for fill in self.fills)
+        quote = quote_balance + sum(fill[2] for fill in self.fills)
+
+        drifted = self.initialized and (base != self.base or quote != self.quote)
+        if drifted:
+            logger.warning(f"Inventory drifted from Portfolio balances at block {block_number}: "
+                           f"base {self.base} -> {base}, quote {self.quote} -> {quote}")
+        self.base = base
+        self.quote = quote
+        self.block_number = max(self.block_number, block_number)
+        self.initialized = True
+        return drifted
+
+    def snapshot(self) -> dict:
+        return {'base_decimals': self.base_decimals, 'quote_decimals': self.quote_decimals, 'base': self.base,
+                'quote': self.quote, 'block_number': self.block_number, 'fills': list(self.fills)}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict):
+        ledger = cls(snapshot['base_decimals'], snapshot['quote_decimals'])
+        ledger.base = snapshot['base']
+        ledger.quote = snapshot['quote']
+        ledger.block_number = snapshot['block_number']
+        ledger.fills.extend(tuple(fill) for fill in snapshot['fills'])
+        ledger.initialized = True
+        return ledger
+
+    def imbalance(self, mid_price: int) -> int:
+        """
+        Share of our inventory value held in excess base, in parts per million from -TOLERANCE_SCALE (all quote) to
+        TOLERANCE_SCALE (all base). mid_price is in quote EVM units per base. Zero when the ledger is empty.
+        """
+        base_value = max(self.notional(mid_price, self.base), 0)
+        quote_value = max(self.quote, 0)
+        total = base_value + quote_value
+        if total == 0:
+            return 0
+        return (base_value - quote_value) * TOLERANCE_SCALE // total
@@ -0,0 +1,116 @@
+import json
+import os
+import struct
+import time
+from array import array
+
+from hexbytes import HexBytes
+
+from orderbook import BookLevels
+
+# Record types
+RECORD_REFERENCE = 0
+RECORD_EVENT = 1
+RECORD_SNAPSHOT = 2
+RECORD_ACTION = 3
+
+# Every record: type, wall clock time, payload length
+RECORD_HEADER = struct.Struct('<BdI')
+# Event payload: blockNumber, logIndex, transactionIndex, transactionHash, blockHash, topic count, then the topics
+# and the log data
+EVENT_HEADER = struct.Struct('<QII32s32sB')
+# Snapshot payload: block number, bid and ask level counts, then the level arrays and a JSON trailer
+SNAPSHOT_HEADER = struct.Struct('<QII')
+
+
+class JournalWriter:
+    """
+    Append-only binary journal of everything the market maker reacts to and does: the raw TradePairs logs it handles,
+    the state snapshots it applies and the order actions it takes. A reference record with the pair data and event
+    ABI is written first so a journal can be replayed on its own. Every record is flushed to the OS as soon as it is
+    written, a record is a single write, so a crash of the process loses nothing up to the incident.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'ab')
+
+    def _write(self, record_type: int, payload: bytes):
+        self.file.write(RECORD_HEADER.pack(record_type, time.time(), len(payload)))
+        self.file.write(payload)
+        self.file.flush()
+
+    def record_reference(self, pair_data: dict, contract_address: str, contract_abi: list, trader_address: str):
+        self._write(RECORD_REFERENCE, json.dumps({'pair': pair_data, 'address': contract_address,
+                                                  'abi': contract_abi, 'trader_address': trader_address}).encode())
+
+    def record_event(self, log_entry):
+        topics = log_entry['topics']
+        header = EVENT_HEADER.pack(log_entry['blockNumber'], log_entry['logIndex'], log_entry.get('transactionIndex', 0),
+                                   bytes(log_entry['transactionHash']),
+                                   bytes(HexBytes(log_entry.get('blockHash') or b'')), len(topics))
+        self._write(RECORD_EVENT,
+                    header + b''.join(bytes(topic) for topic in topics) + bytes(HexBytes(log_entry['data'])))
+
+    def record_snapshot(self, open_orders: list, chain_state: dict):
+        bid_book, ask_book = chain_state['bid_book'], chain_state['ask_book']
+        header = SNAPSHOT_HEADER.pack(chain_state['block_number'] or 0, len(bid_book), len(ask_book))
+        trailer = json.dumps({'open_orders': open_orders, 'base_balance': list(chain_state['base_balance']),
+                              'quote_balance': list(chain_state['quote_balance'])}).encode()
+        self._write(RECORD_SNAPSHOT, header + bid_book.prices.tobytes() + bid_book.quantities.tobytes()
+                    + ask_book.prices.tobytes() + ask_book.quantities.tobytes() + trailer)
+
+    def record_action(self, action: dict):
+        self._write(RECORD_ACTION, json.dumps(action).encode())
+
+    def close(self):
+        self.file.close()
+
+
+def _book_levels(payload: bytes, offset: int, n_levels: int):
+    book_levels = BookLevels()
+    size = n_levels * book_levels.prices.itemsize
+    book_levels.prices = array('Q', payload[offset:offset + size])
+    book_levels.quantities = array('Q', payload[offset + size:offset + 2 * size])
+    return book_levels, offset + 2 * size
+
+
+def decode_record(record_type: int, payload: bytes, reference: dict):
+    if record_type == RECORD_EVENT:
+        block_number, log_index, transaction_index, txn_hash, block_hash, n_topics = EVENT_HEADER.unpack_from(payload)
+        offset = EVENT_HEADER.size
+        topics = [HexBytes(payload[offset + 32 * i:offset + 32 * (i + 1)]) for i in range(n_topics)]
+        return {'address': reference['address'], 'topics': topics,
+                'data': HexBytes(payload[offset + 32 * n_topics:]).hex(), 'blockNumber': block_number,
+                'logIndex': log_index, 'transactionIndex': transaction_index, 'transactionHash': HexBytes(txn_hash),
+                'blockHash': HexBytes(block_hash), 'removed': False}
+    if record_type == RECORD_SNAPSHOT:
+        block_number, n_bids, n_asks = SNAPSHOT_HEADER.unpack_from(payload)
+        bid_book, offset = _book_levels(payload, SNAPSHOT_HEADER.size, n_bids)
+        ask_book, offset = _book_levels(payload, offset, n_asks)
+        trailer = json.loads(payload[offset:])
+        chain_state = {'block_number': block_number, 'bid_book': bid_book, 'ask_book': ask_book,
+                       'base_balance': tuple(trailer['base_balance']),
+                       'quote_balance': tuple(trailer['quote_balance']), 'orders': {}}
+        return trailer['open_orders'], chain_state
+    return json.loads(payload)
+
+
+def read_journal(path: str):
+    """Yield (record type, wall clock time, decoded payload) for every complete record. A record cut short by a crash
+    ends the journal."""
+    reference = None
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            record_type, timestamp, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            record = decode_record(record_type, payload, reference)
+            if record_type == RECORD_REFERENCE:
+                reference = record
+            yield record_type, timestamp, record
@@ -0,0 +1,29 @@
+import numpy as np
+
+from enums import OrderSide
+from order_diff import Quote
+
+
+def build_ladder(bid_price: int, ask_price: int, bid_amount: int, ask_amount: int, n_levels: int,
+                 level_spacing: int, size_growth: float, min_notional: int, max_notional: int) -> list:
+    """
+    Build an n_levels deep ladder of quotes on each side starting at bid_price/ask_price (in ticks) and stepping
+    level_spacing ticks away from the mid per level. Level sizes (in lots) follow a geometric curve, the amount of
+    level i is amount * size_growth^i rounded to a whole lot. Prices, sizes and the min/max notional (ticks * lots)
+    checks are computed in one vectorized pass. Levels that are out of bounds or at a non-positive price are dropped.
+    """
+    levels = np.arange(n_levels, dtype=np.int64)
+    offsets = levels * level_spacing
+    size_curve = size_growth ** levels
+
+    quotes = []
+    for order_side, price, amount, direction in ((OrderSide.BUY, bid_price, bid_amount, -1),
+                                                 (OrderSide.SELL, ask_price, ask_amount, 1)):
+        prices = price + direction * offsets
+        amounts = np.rint(amount * size_curve).astype(np.int64)
+        # Notionals are compared as floats, ticks * lots can overflow int64 for pairs with many display decimals
+        notionals = prices.astype(np.float64) * amounts
+        valid = (prices > 0) & (amounts > 0) & (notionals >= min_notional) & (notionals <= max_notional)
+        quotes.extend(Quote(order_side, int(level_price), int(level_amount))
+                      for level_price, level_amount in zip(prices[valid], amounts[valid]))
+    return quotes
@@ -1,27 +1,101 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import time
 
 FORMAT = logging.Formatter('%(asctime)s [%(module)s %(lineno)d] %(levelname)s: %(message)s')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
+
+# Records of every logger go through one queue to a single writer thread so console and disk I/O stay off the event
+# loop. Messages are only formatted on the writer thread.
+_log_queue = queue.SimpleQueue()
+_handlers = {}  # logger name -> handlers writing its records
+
+
+class _Dispatcher(logging.Handler):
+
+    def emit(self, record):
+        for handler in _handlers.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # Tracebacks have to be rendered while the exception is alive, everything else is formatted by the writer
+        return super().prepare(record) if record.exc_info else record
+
+
+_listener = logging.handlers.QueueListener(_log_queue, _Dispatcher())
+_listener.start()
+atexit.register(_listener.stop)
+
+
+def _json_default(value):
+    # Order ids and hashes are written as 0x prefixed hex, Decimals and enums as strings
+    return '0x' + value.hex() if isinstance(value, bytes) else str(value)
+
+
+class StructuredMessage:
+    """Log message written as one JSON line. Serialization happens on the writer thread."""
+
+    __slots__ = ('event', 'timestamp', 'fields')
+
+    def __init__(self, event: str, fields: dict):
+        self.event = event
+        self.timestamp = time.time()
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps({'ts': self.timestamp, 'event': self.event, **self.fields}, default=_json_default)
+
+
+def _queue_logger(name, handlers):
+    logger = logging.getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+    _handlers[name] = handlers
+    logger.addHandler(_QueueHandler(_log_queue))
+    logger.propagate = False
+    return logger
 
 
 def get_logger(name):
+    if name in _handlers:
+        return logging.getLogger(name)
     log_filename = f"logs/{name}.log"
     os.makedirs(os.path.dirname(log_filename), exist_ok=True)
 
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-
     # Console Handler
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
     ch.setFormatter(FORMAT)
-    logger.addHandler(ch)
 
     # File Handler
-    ch = logging.FileHandler(log_filename)
-    ch.setLevel(logging.DEBUG)
-    ch.setFormatter(FORMAT)
-    logger.addHandler(ch)
-    logger.propagate = False
+    fh = logging.FileHandler(log_filename)
+    fh.setLevel(logging.DEBUG)
+    fh.setFormatter(FORMAT)
 
-    return logger
+    return _queue_logger(name, [ch, fh])
+
+
+def get_event_logger(name):
+    """Logger of a JSON-lines event log, use log_event to write to it."""
+    if name in _handlers:
+        return logging.getLogger(name)
+    log_filename = f"logs/{name}.jsonl"
+    os.makedirs(os.path.dirname(log_filename), exist_ok=True)
+
+    fh = logging.FileHandler(log_filename)
+    fh.setLevel(logging.DEBUG)
+    fh.setFormatter(logging.Formatter('%(message)s'))
+
+    return _queue_logger(name, [fh])
+
+
+def log_event(event_logger, event: str, **fields):
+    if event_logger.isEnabledFor(logging.INFO):
+        event_logger.info(StructuredMessage(event, fields))
@@ -2,10 +2,17 @@ import asyncio
 
 from config import init_config
 from market_maker import MarketMaker
+from multi_pair_runner import MultiPairRunner
+from sharded_runner import ShardedRunner
 
 
 async def run_market_maker(config, loop):
-    market_maker = MarketMaker(config)
+    if config['n_shards'] > 1:
+        market_maker = ShardedRunner(config)
+    elif len(config['trade_pairs']) > 1:
+        market_maker = MultiPairRunner(config)
+    else:
+        market_maker = MarketMaker(config)
     await market_maker.run(loop)
 
 
@@ -1,16 +1,44 @@
 import asyncio
 import datetime
+import logging
+import math
 import time
 from decimal import Decimal
 from random import randrange
 
 from web3 import Web3
 
+from checkpoint import checkpoint_path, read_checkpoint, resume_position, write_checkpoint
 from dexalot import Dexalot
 from enums import OrderSide, OrderType, OrderStatus
-from logger import get_logger
+from estimators import MarketEstimators, own_aggressor
+from event_stream import EventStream
+from inventory import InventoryLedger
+from journal import JournalWriter
+from ladder import build_ladder
+from logger import get_event_logger, get_logger, log_event
+from metrics import metrics, start_metrics
+from order_diff import TOLERANCE_SCALE, OrderPlan, reconcile, to_tolerance, within_tolerance
+from order_registry import OrderRecord, OrderRegistry, to_order_id
+from orderbook import OrderBook
+from quote_gate import QuoteGate
+from requote_scheduler import RequoteScheduler
+from tx_pipeline import TransactionPipeline, PendingTransaction
 
 logger = get_logger('dexalot_market_maker')
+event_log = get_event_logger('dexalot_events')
+
+
+def init_dexalot(config, event_loop, dexalot_class=Dexalot) -> Dexalot:
+    """Create and initialize the Dexalot exchange handler and start its transaction pipeline and gas oracle."""
+    dexalot = dexalot_class(base_url=config['base_url'], trade_pair=config['trade_pair'], web3=config['web3'],
+                      trader_address=config['trader_address'], timeout=config['timeout'],
+                      max_retries=config['max_retries'], reference_cache_path=config['reference_cache_path'])
+    dexalot.initialize()
+    dexalot.tx_pipeline = TransactionPipeline(dexalot.web3)
+    event_loop.create_task(dexalot.tx_pipeline.run())
+    event_loop.create_task(dexalot.gas_oracle.run())
+    return dexalot
 
 
 class MarketMaker:
@@ -21,33 +49,93 @@ class MarketMaker:
         self.dexalot = None
         self.config = config
         self.pair = config['trade_pair']
+        self.pair_id = Web3.toBytes(text=self.pair).ljust(32, b'\x00')
         self.target_spread = Decimal(config['target_spread'])
         self.order_price_tolerance = Decimal(config['order_price_tolerance'])
         self.order_amount_tolerance = Decimal(config['order_amount_tolerance'])
+        self.price_tolerance = to_tolerance(config['order_price_tolerance'])
+        self.amount_tolerance = to_tolerance(config['order_amount_tolerance'])
         self.additional_state_update = config['additional_state_update']
+        self.requote_scheduler = RequoteScheduler(self.requote, config['requote_debounce'])
         self.n_price_levels = int(config['n_price_levels'])
+        self.n_ladder_levels = int(config['n_ladder_levels'])
+        self.ladder_level_spacing = Decimal(config['ladder_level_spacing'])
+        self.ladder_size_growth = Decimal(config['ladder_size_growth'])
+        self.inventory_price_skew = to_tolerance(config['inventory_price_skew'])
+        self.min_spread = Decimal(config['min_spread'])
+        self.max_spread = Decimal(config['max_spread'])
+        self.volatility_spread_factor = float(config['volatility_spread_factor'])
+        self.trade_flow_spread_factor = float(config['trade_flow_spread_factor'])
+        self.fill_horizon_trades = config['fill_horizon_trades']
+        self.gas_token_price = float(config['gas_token_price'])
+        self.quote_gate = None
+        if config['quote_gate_margin'] is not None:
+            self.quote_gate = QuoteGate(to_tolerance(config['maker_fee']), float(config['quote_gate_margin']))
+        self.inventory_amount_skew = to_tolerance(config['inventory_amount_skew'])
         self.n_agg_orders = int(config['n_agg_orders'])
+        self.ws_url = config['ws_url']
+        self.event_poll_interval = config['event_poll_interval']
+        self.max_book_pages = int(config['max_book_pages'])
+        self.journal_path = config['journal_path']
+        self.checkpoint_path = config['checkpoint_path']
+        self.checkpoint_interval = config['checkpoint_interval']
+        self.checkpoint_max_age = config['checkpoint_max_age']
 
         # State Params
-        self.open_orders = {}
-        self.base_inventory = None
-        self.quote_inventory = None
+        self.order_registry = OrderRegistry(config['order_registry_grace_period'])
+        self.inventory = None
+        self.estimators = MarketEstimators(config['volatility_half_life'], int(config['trade_flow_window']))
+        self.order_book = OrderBook()
         self.bid_book = None
         self.ask_book = None
-        self.best_bid_price = None
-        self.best_bid_amount = None
-        self.best_ask_price = None
-        self.best_ask_amount = None
-        self.mid_price = None
+        # Prices are kept in quote ticks and amounts in base lots, Decimal is only used at the config and log edges
+        self.best_bid_ticks = None
+        self.best_bid_lots = None
+        self.best_ask_ticks = None
+        self.best_ask_lots = None
+        self.mid_ticks = None
+        self.spread_ticks = None
+        self.min_spread_ticks = None
+        self.max_spread_ticks = None
+        self.level_spacing_ticks = None
+        self.default_lots = None
+        self.default_mid_ticks = None
         self.updated_timestamp = None
+        self.pending_transactions = {}
+        self.journal = None
+        # (block number, log index) of the last event processed, events of a resumed run up to resume_position were
+        # already processed before the checkpoint
+        self.processed_position = None
+        self.resume_position = None
+        # Set while the events missed since the checkpoint are replayed, quoting waits until they are applied
+        self.replaying_events = False
+        # Block the local order book snapshot was read at, events up to it are already in the book
+        self.book_block_number = None
 
     async def run(self, event_loop):
 
         # Initialize Dexalot Exchange Handler
-        self.dexalot = Dexalot(base_url=self.config['base_url'], trade_pair=self.config['trade_pair'],
-                               web3=self.config['web3'], trader_address=self.config['trader_address'],
-                               timeout=self.config['timeout'])
-        self.dexalot.initialize()
+        self.dexalot = init_dexalot(self.config, event_loop)
+        start_metrics(self.config, event_loop)
+        if self.dexalot.reference_data_from_cache:
+            event_loop.create_task(self.revalidate_reference_data())
+        self.restore_checkpoint()
+        self.start()
+
+        # Start event loops, from the block after the checkpoint when resuming so nothing missed while down is lost
+        event_stream = EventStream(self.dexalot.web3, self.dexalot.trade_pairs_contract,
+                                   ['OrderStatusChanged', 'Executed'], ws_url=self.ws_url,
+                                   poll_interval=self.event_poll_interval, from_block=self.resume_block(),
+                                   indexed_filters={'pair': [self.pair_id]})
+        event_loop.create_task(self.run_event_listener(event_stream))
+        if self.replaying_events:
+            event_loop.create_task(self.requote_when_caught_up(event_stream))
+        if self.checkpoint_path:
+            event_loop.create_task(self.run_checkpoints())
+        await self.run_additional_state_update()
+
+    def start(self):
+
         log_line = '\n' + 50 * '-' + '\n'
         log_line += "Dexalot Market Initialized" + '\n'
         log_line += f"Trade Pair: {self.dexalot.trade_pair}" + '\n'
@@ -58,231 +146,542 @@ class MarketMaker:
         log_line += f"Order Price Tolerance: {self.order_price_tolerance}. Order Amount Tolerance: {self.order_amount_tolerance}" + '\n' + 50 * '-'
         logger.info(log_line)
 
+        if self.journal_path:
+            self.journal = JournalWriter(self.journal_path.format(pair=self.pair.replace('/', '-')))
+            self.journal.record_reference(self.dexalot.reference_data['pairs'][self.pair],
+                                          self.dexalot.trade_pairs_contract.address,
+                                          self.dexalot.trade_pairs_contract.abi, self.dexalot.trade_address)
+
         # Fetch Initial State
         self.update_state()
-        if (self.best_bid_price == 0) and (self.best_ask_price == 0):
-            self.mid_price = Decimal(self.config['default_mid_price'])
+        if (self.best_bid_ticks == 0) and (self.best_ask_ticks == 0):
+            self.mid_ticks = self.default_mid_ticks
             logger.info(
                 f"No orders in the book. Start quoting around default price value: {self.config['default_mid_price']} {self.dexalot.quote_symbol}")
-        elif (self.best_bid_price == 0) or (self.best_ask_price == 0):
-            self.mid_price = self.best_bid_price if not None else self.best_ask_price
+        elif (self.best_bid_ticks == 0) or (self.best_ask_ticks == 0):
+            self.mid_ticks = self.best_bid_ticks or self.best_ask_ticks
             logger.info(
                 f"Liquidity missing from one side of book. Start quoting around the available side: {self.mid_price} {self.dexalot.quote_symbol}")
 
-        # Update out initial orders before starting
-        self.update_orders()
-
-        # Start event loops
-        order_status_event_filter = self.dexalot.trade_pairs_contract.events.OrderStatusChanged.createFilter(
-            fromBlock='latest')
-        executed_event_filter = self.dexalot.trade_pairs_contract.events.Executed.createFilter(fromBlock='latest')
-
-        event_loop.create_task(self.run_order_status_changed_listener(order_status_event_filter, 2))
-        # event_loop.create_task(self.run_executed_listener(executed_event_filter, 2))
-        await self.run_additional_state_update()
+        # Update out initial orders before starting, unless fills and cancels missed while down are still to be applied
+        if self.replaying_events:
+            logger.info(f"Holding the first requote until the events after {self.resume_position} are replayed")
+        else:
+            self.update_orders()
 
     def update_orders(self, random=False):
 
         if random:
-            self.mid_price = self.mid_price + Decimal(randrange(-10, 10) / 10)
+            self.mid_ticks += self.dexalot.to_ticks(Decimal(randrange(-10, 10)) / 10)
 
+        # Sides with transactions in flight are left alone until their receipts arrive
+        sides = []
+        for order_side in (OrderSide.BUY, OrderSide.SELL):
+            if self.has_pending_transactions(order_side):
+                logger.info("%r side has transactions in flight. Skipping requote", order_side)
+            else:
+                sides.append(order_side)
+
+        live_orders = [order for order_side in sides for order in self.order_registry.side_orders(order_side)]
+        desired_quotes = [quote for quote in self.calculate_quotes() if quote.side in sides]
+        plan = reconcile(live_orders, desired_quotes, self.price_tolerance, self.amount_tolerance)
+        if plan and self.quote_gate is not None:
+            plan = self.gate_plan(plan)
+        if plan:
+            logger.info("Executing %s", plan)
+            self.execute_plan(plan)
+
+    def calculate_quotes(self) -> list:
+        # The innermost level is quoted at the target spread, further levels step out by the level spacing
         bid_price, ask_price = self.calculate_order_prices()
         bid_amount, ask_amount = self.calculate_order_amounts()
-
-        buy_orders = [order for order in self.open_orders if order['side'] == OrderSide.BUY.value]
-        if self.orders_require_action(buy_orders, bid_price, bid_amount):
-            for order in buy_orders:
-                logger.info(f"Cancelling BUY order: {order['id']}")
-                self.dexalot.cancel_order(self.pair, order['id'])
-            self.dexalot.add_order(self.pair, bid_price, bid_amount, OrderSide.BUY, OrderType.LIMIT)
-
-        time.sleep(2)
-
-        sell_orders = [order for order in self.open_orders if order['side'] == OrderSide.SELL.value]
-        if self.orders_require_action(sell_orders, ask_price, ask_amount):
-            for order in sell_orders:
-                logger.info(f"Cancelling SELL order: {order['id']}")
-                self.dexalot.cancel_order(self.pair, order['id'])
-            self.dexalot.add_order(self.pair, ask_price, ask_amount, OrderSide.SELL, OrderType.LIMIT)
+        return build_ladder(bid_price, ask_price, bid_amount, ask_amount, self.n_ladder_levels,
+                            self.level_spacing_ticks, float(self.ladder_size_growth),
+                            self.dexalot.min_trade_notional, self.dexalot.max_trade_notional)
+
+    def gate_plan(self, plan: OrderPlan) -> OrderPlan:
+        # Fill probability decays over the distance the price diffuses in fill_horizon_trades, the spread until the
+        # volatility estimate is warmed up
+        if self.estimators.warmed_up:
+            fill_scale = self.estimators.volatility.value * self.mid_ticks * math.sqrt(self.fill_horizon_trades)
+        else:
+            fill_scale = self.spread_ticks
+        return self.quote_gate.apply(plan, self.mid_ticks, max(fill_scale, 1), self.gas_cost('addOrder'),
+                                     self.cancel_gas_cost)
+
+    def cancel_gas_cost(self, n_orders: int) -> float:
+        # Same choice of function as execute_plan
+        if n_orders == 1:
+            return self.gas_cost('cancelOrder')
+        return self.gas_cost('cancelAllOrders', n_orders)
+
+    def gas_cost(self, fn_name: str, batch_size=None) -> float:
+        """Expected gas cost of a TradePairs call in ticks * lots, 0 until the gas oracle has seen it."""
+        gas_cost = self.dexalot.expected_gas_cost(fn_name, batch_size)
+        if gas_cost is None:
+            return 0
+        # Wei of the gas token to EVM units of the quote token, then to ticks * lots
+        quote_cost = gas_cost * self.gas_token_price * 10 ** self.dexalot.quote_decimals / 10 ** 18
+        tick_lot_value = self.dexalot.price_tick * self.dexalot.quantity_lot / 10 ** self.dexalot.base_decimals
+        return quote_cost / tick_lot_value
+
+    def execute_plan(self, plan: OrderPlan):
+        if self.journal is not None:
+            if plan.cancel:
+                self.journal.record_action({'action': 'cancel', 'ids': [order.id for order in plan.cancel]})
+            for quote in plan.add:
+                self.journal.record_action({'action': 'add', 'side': quote.side.value, 'price': quote.price,
+                                            'amount': quote.amount})
+        # Cancel before adding so new orders can not cross our own stale ones
+        if len(plan.cancel) == 1:
+            order = plan.cancel[0]
+            self.track_transaction(self.dexalot.cancel_order(self.pair, order.id, self.handle_transaction_receipt),
+                                   {order.side})
+        elif plan.cancel:
+            cancel_sides = {order.side for order in plan.cancel}
+            for order_ids in plan.cancel_batches():
+                self.track_transaction(self.dexalot.cancel_all_orders(self.pair, order_ids,
+                                                                      self.handle_transaction_receipt), cancel_sides)
+        for quote in plan.add:
+            self.track_transaction(self.dexalot.add_order_ticks(self.pair, quote.price, quote.amount, quote.side,
+                                                                OrderType.LIMIT, self.handle_transaction_receipt),
+                                   {quote.side})
+
+    def track_transaction(self, pending_txn, order_sides: set):
+        # Only transactions submitted through the pipeline are tracked, blocking calls return mined receipts
+        if isinstance(pending_txn, PendingTransaction):
+            # Keyed by the PendingTransaction, a sharded worker only learns the hash once the coordinator sent it
+            self.pending_transactions[pending_txn] = order_sides
+
+    def has_pending_transactions(self, order_side: OrderSide) -> bool:
+        return any(order_side in order_sides for order_sides in self.pending_transactions.values())
+
+    def handle_transaction_receipt(self, pending_txn: PendingTransaction):
+        order_sides = self.pending_transactions.pop(pending_txn, None)
+        if not pending_txn.succeeded:
+            logger.warning(f"{order_sides} transaction {pending_txn} did not succeed. "
+                           f"Orders will be refreshed on the next state update")
+            return
+        # The receipt carries the status changes of our orders, usually before the event stream delivers them
+        for order_status_changed in self.dexalot.order_status_changes(pending_txn.receipt):
+            if order_status_changed.args.pair == self.pair_id:
+                self.apply_own_order_status(order_status_changed.args)
+
+    def apply_own_order_status(self, args):
+        return self.order_registry.apply_status(to_order_id(args.id), OrderSide(args.side), OrderStatus(args.status),
+                                                args.price // self.dexalot.price_tick,
+                                                args.quantity // self.dexalot.quantity_lot,
+                                                args.quantityfilled // self.dexalot.quantity_lot)
 
     def calculate_order_prices(self):
-        bid_price = self.mid_price - (self.target_spread / 2)
-        ask_price = self.mid_price + (self.target_spread / 2)
+        # Prices in ticks. Both quotes are shifted away from the side we hold too much of by up to
+        # inventory_price_skew times the spread
+        bid_spread, ask_spread = self.calculate_spreads()
+        skew = (bid_spread + ask_spread) * self.inventory_price_skew * self.inventory_imbalance() // TOLERANCE_SCALE ** 2
+        bid_price = self.mid_ticks - bid_spread - skew
+        ask_price = self.mid_ticks + ask_spread - skew
 
         return bid_price, ask_price
 
+    def calculate_spreads(self):
+        """
+        Distance in ticks of the bid and ask from the mid. Once the volatility estimate is warmed up the spread is
+        volatility_spread_factor trade return standard deviations within [min_spread, max_spread], before that the
+        target spread. The side takers are trading into is widened by up to trade_flow_spread_factor of the spread.
+        """
+        spread = self.spread_ticks
+        if self.volatility_spread_factor and self.estimators.warmed_up:
+            spread = int(self.volatility_spread_factor * self.estimators.volatility.value * self.mid_ticks)
+            spread = min(max(spread, self.min_spread_ticks), self.max_spread_ticks)
+        # An odd spread puts the extra tick on the ask
+        bid_spread = spread // 2
+        ask_spread = spread - bid_spread
+
+        imbalance = self.estimators.trade_flow.imbalance()
+        widen = int(self.trade_flow_spread_factor * abs(imbalance) * spread)
+        if imbalance > 0:
+            ask_spread += widen
+        elif imbalance < 0:
+            bid_spread += widen
+        return bid_spread, ask_spread
+
     def calculate_order_amounts(self):
-        bid_amount = Decimal(self.config['default_amount'])
-        ask_amount = Decimal(self.config['default_amount'])
+        # Amounts in lots, up to inventory_amount_skew of the default amount is moved from the side that would add to
+        # our excess inventory to the side that reduces it
+        skew = self.default_lots * self.inventory_amount_skew * self.inventory_imbalance() // TOLERANCE_SCALE ** 2
+        bid_amount = max(self.default_lots - skew, 0)
+        ask_amount = max(self.default_lots + skew, 0)
 
         return bid_amount, ask_amount
 
-    def within_tolerance(self, target_value: Decimal, order_value: Decimal, tolerance: Decimal) -> bool:
-        tolerated = order_value * tolerance
-        return bool((order_value < (target_value + tolerated)) and (order_value > (target_value - tolerated)))
-
-    def orders_require_action(self, orders, price: Decimal, quantity: Decimal):
-
-        # We only want one order open per side for now
-        if len(orders) > 1:
-            return True
-        # Minimum spread check
-        price_tolerance = self.order_price_tolerance
-        amount_tolerance = self.order_amount_tolerance
-        return len(orders) == 0 or not all(
-            [(self.within_tolerance(price, Decimal(order['price']), self.order_price_tolerance)
-              and self.within_tolerance(quantity, (Decimal(order['quantity']) - Decimal(order['quantityfilled'])),
-                                        self.order_amount_tolerance))
-             for order in orders])
-
-    def update_state(self):
-
-        self.open_orders = self.dexalot.fetch_open_orders()
-        logger.info(f"Returned {len(self.open_orders)} Open Trades")
-        bid_book, ask_book = self.dexalot.fetch_orderbook(self.n_price_levels, self.n_agg_orders)
-
-        self.best_bid_price = Decimal(bid_book[0][0]) / 10 ** self.dexalot.quote_decimals
-        self.best_bid_amount = Decimal(bid_book[1][0]) / 10 ** self.dexalot.base_decimals
-        self.best_ask_price = Decimal(ask_book[0][0]) / 10 ** self.dexalot.quote_decimals
-        self.best_ask_amount = Decimal(ask_book[1][0]) / 10 ** self.dexalot.base_decimals
-        self.bid_book = bid_book
-        self.ask_book = ask_book
-        self.mid_price = self.calculate_mid(self.best_bid_price, self.best_ask_price)
+    def inventory_imbalance(self) -> int:
+        # Parts per million of our inventory value held in excess base, negative in excess quote
+        if self.inventory is None:
+            return 0
+        return self.inventory.imbalance(self.mid_ticks * self.dexalot.price_tick)
+
+    def within_tolerance(self, target_value: int, order_value: int, tolerance: int) -> bool:
+        return within_tolerance(target_value, order_value, tolerance)
+
+    def update_units(self):
+        # Config values are converted to ticks and lots once per state update so events only do integer arithmetic.
+        # Recomputed every time as the pair decimals can change when reference data is revalidated
+        self.spread_ticks = self.dexalot.to_ticks(self.target_spread)
+        self.min_spread_ticks = self.dexalot.to_ticks(self.min_spread)
+        self.max_spread_ticks = self.dexalot.to_ticks(self.max_spread)
+        self.level_spacing_ticks = self.dexalot.to_ticks(self.ladder_level_spacing)
+        self.default_lots = self.dexalot.to_lots(Decimal(str(self.config['default_amount'])))
+        self.default_mid_ticks = self.dexalot.to_ticks(Decimal(str(self.config['default_mid_price'])))
+
+    @property
+    def best_bid_price(self) -> Decimal:
+        return self.dexalot.from_ticks(self.best_bid_ticks)
+
+    @property
+    def best_bid_amount(self) -> Decimal:
+        return self.dexalot.from_lots(self.best_bid_lots)
+
+    @property
+    def best_ask_price(self) -> Decimal:
+        return self.dexalot.from_ticks(self.best_ask_ticks)
+
+    @property
+    def best_ask_amount(self) -> Decimal:
+        return self.dexalot.from_lots(self.best_ask_lots)
+
+    @property
+    def base_inventory(self) -> Decimal:
+        if self.inventory is not None:
+            return Decimal(self.inventory.base).scaleb(-self.dexalot.base_decimals)
+
+    @property
+    def quote_inventory(self) -> Decimal:
+        if self.inventory is not None:
+            return Decimal(self.inventory.quote).scaleb(-self.dexalot.quote_decimals)
+
+    @property
+    def mid_price(self) -> Decimal:
+        return self.dexalot.from_ticks(self.mid_ticks)
+
+    @mid_price.setter
+    def mid_price(self, mid_price: Decimal):
+        self.mid_ticks = self.dexalot.to_ticks(mid_price)
+
+    def requires_refresh(self, refresh_book: bool) -> bool:
+        return refresh_book or not self.order_book.initialized or not self.order_registry.initialized
+
+    def update_state(self, refresh_book=True):
+        """Unless refresh_book is False, fetch our open orders, a book snapshot and Portfolio balances. Otherwise the
+        local order book and order registry, kept up to date from OrderStatusChanged events, are used as they are."""
+
+        if self.requires_refresh(refresh_book):
+            # Open orders come from the REST API, fetch them while the chain state is read in one batch
+            open_orders_future = self.dexalot.read_executor.submit(self.dexalot.fetch_open_orders)
+            chain_state = self.fetch_chain_state()
+            self.apply_state(open_orders_future.result(), chain_state)
+        else:
+            self.apply_state()
+
+    async def update_state_async(self, refresh_book=True):
+        """Same as update_state but awaits the REST and chain reads concurrently instead of blocking the event loop."""
+
+        if self.requires_refresh(refresh_book):
+            loop = asyncio.get_event_loop()
+            open_orders, chain_state = await asyncio.gather(self.dexalot.fetch_open_orders_async(),
+                                                            loop.run_in_executor(None, self.fetch_chain_state))
+            self.apply_state(open_orders, chain_state)
+        else:
+            self.apply_state()
+
+    def fetch_chain_state(self):
+        return self.dexalot.fetch_state_batch([], self.n_price_levels, self.n_agg_orders, self.max_book_pages)
+
+    def apply_state(self, open_orders=None, chain_state=None):
+
+        self.update_units()
+        if self.journal is not None and chain_state is not None:
+            self.journal.record_snapshot(open_orders, chain_state)
+        if open_orders is not None:
+            self.order_registry.reconcile([self.order_record(order) for order in open_orders])
+        if chain_state is not None:
+            bid_book, ask_book = chain_state['bid_book'], chain_state['ask_book']
+            if self.order_book.initialized:
+                drift = self.order_book.drift(bid_book, ask_book)
+                if drift:
+                    logger.warning(f"Local order book drifted from snapshot on {drift} price levels. Resetting")
+            self.order_book.load_snapshot(bid_book, ask_book)
+            self.book_block_number = chain_state['block_number']
+            self.bid_book = bid_book
+            self.ask_book = ask_book
+            if self.inventory is None or self.inventory.base_decimals != self.dexalot.base_decimals or \
+                    self.inventory.quote_decimals != self.dexalot.quote_decimals:
+                self.inventory = InventoryLedger(self.dexalot.base_decimals, self.dexalot.quote_decimals)
+            # Portfolio getBalance returns the total, available and asset type. The total includes our open orders
+            self.inventory.reconcile(chain_state['block_number'] or 0, chain_state['base_balance'][0],
+                                     chain_state['quote_balance'][0])
+
+        self.update_prices_from_book()
         self.updated_timestamp = self.get_nanos()
 
-        log_line = '\n' + 50 * '-' + '\n'
-        log_line += "Updating State..." + '\n'
-        log_line += f"Bid Book: {bid_book}" + '\n' + f"Ask Book: {ask_book}" + '\n'
-        log_line += f"Best Bid - Price {self.best_bid_price} {self.dexalot.quote_symbol} - " \
-                    f"Amount ({self.best_bid_amount} {self.dexalot.base_symbol})" + '\n'
-        log_line += f"Best Ask - Price {self.best_ask_price} {self.dexalot.quote_symbol} - " \
-                    f"Amount ({self.best_ask_amount} {self.dexalot.base_symbol})" + '\n'
-        log_line += f"Mid Price {self.mid_price} {self.dexalot.quote_symbol}" + '\n' + 50 * '-'
-        logger.info(log_line)
+        # Prices in ticks and amounts in lots, the book depth is only built when the event log is enabled
+        if event_log.isEnabledFor(logging.INFO):
+            log_event(event_log, 'state', pair=self.pair, refreshed=chain_state is not None,
+                      open_orders=len(self.order_registry), best_bid=[self.best_bid_ticks, self.best_bid_lots],
+                      best_ask=[self.best_ask_ticks, self.best_ask_lots], mid=self.mid_ticks,
+                      bids=self.order_book.bids.depth(self.n_price_levels),
+                      asks=self.order_book.asks.depth(self.n_price_levels),
+                      base_inventory=self.inventory and self.inventory.base,
+                      quote_inventory=self.inventory and self.inventory.quote, imbalance=self.inventory_imbalance(),
+                      volatility=self.estimators.volatility.value,
+                      trade_flow=self.estimators.trade_flow.imbalance(), spreads=self.calculate_spreads())
+
+    def order_record(self, order: dict) -> OrderRecord:
+        """OrderRecord of an open order returned by the REST API."""
+        quantity = self.dexalot.to_lots(Decimal(str(order['quantity'])))
+        quantity_filled = self.dexalot.to_lots(Decimal(str(order['quantityfilled'])))
+        return OrderRecord(to_order_id(order['id']), OrderSide(int(order['side'])),
+                           self.dexalot.to_ticks(Decimal(str(order['price']))), quantity, quantity_filled,
+                           OrderStatus.PARTIAL if quantity_filled else OrderStatus.NEW)
+
+    def update_prices_from_book(self):
+        self.best_bid_ticks, self.best_bid_lots = self.order_book.best_bid()
+        self.best_ask_ticks, self.best_ask_lots = self.order_book.best_ask()
+        self.mid_ticks = self.calculate_mid(self.best_bid_ticks, self.best_ask_ticks)
 
     def handle_order_status_changed(self, order_status_changed):
 
-        pair = Web3.toText(order_status_changed.args.pair).split(str(b'\x00', 'utf8'))[0]
-        id = order_status_changed.args.id.hex()
+        if order_status_changed.args.pair != self.pair_id:
+            return
+
+        id = to_order_id(order_status_changed.args.id)
         order_status = OrderStatus(order_status_changed.args.status)
         order_side = OrderSide(order_status_changed.args.side)
         traderaddress = order_status_changed.args.traderaddress
+        price_ticks = order_status_changed.args.price // self.dexalot.price_tick
+        quantity_lots = order_status_changed.args.quantity // self.dexalot.quantity_lot
+        filled_lots = order_status_changed.args.quantityfilled // self.dexalot.quantity_lot
+        self.dexalot.observe_block(order_status_changed.blockNumber)
 
         update_orders = False
 
-        if pair == self.pair:
-            # Perform sanity checks on our own orders
-            if traderaddress == self.dexalot.trade_address:
-                # Fetch the new world state and update our orders
-                if order_status == OrderStatus.FILLED:
-                    filled_quantity = Decimal(
-                        order_status_changed.args.quantityfilled) / 10 ** self.dexalot.quote_decimals
-                    logger.info(f"Order {id} FILLED {filled_quantity}/{filled_quantity} {self.dexalot.quote_symbol}")
-                    update_orders = True
-
-                elif order_status in [OrderStatus.REJECTED, OrderStatus.EXPIRED, OrderStatus.KILLED]:
-                    logger.info(f"Order {id} ERROR... Updating state and replacing orders")
-                    self.update_state()
-                    self.update_orders()
-                # Check remaining amount after partial fill and replenish order if over tolerance
-                elif order_status == OrderStatus.PARTIAL:
-                    filled_quantity = Decimal(
-                        order_status_changed.args.quantityfilled) / 10 ** self.dexalot.base_decimals
-                    total_quantity = Decimal(order_status_changed.args.quantity) / 10 ** self.dexalot.base_decimals
-                    remaining_quantity = total_quantity - filled_quantity
-                    logger.info(
-                        f"Order {id} PARTIAL FILL {filled_quantity}/{total_quantity} {self.dexalot.base_symbol}")
-                    bid_amount, ask_amount = self.calculate_order_amounts()
-
-                    if order_side == OrderSide.BUY:
-                        if not self.within_tolerance(bid_amount, remaining_quantity, self.order_amount_tolerance):
-                            update_orders = True
-                    elif order_side == OrderSide.SELL:
-                        if not self.within_tolerance(ask_amount, remaining_quantity, self.order_amount_tolerance):
-                            update_orders = True
-
-            # Orders from others
-            else:
-                # If a new limit order then we check the new mid and adjust orders if needed
-                if order_status == OrderStatus.NEW:
-                    limit_price = Decimal(order_status_changed.args.price) / 10 ** self.dexalot.quote_decimals
-                    limit_amount = Decimal(order_status_changed.args.quantity) / 10 ** self.dexalot.base_decimals
-                    logger.info(f"NEW {repr(order_side)} LIMIT. Price {limit_price} {self.dexalot.quote_symbol} "
-                                f"Amount {limit_amount} {self.dexalot.base_symbol} placed by {traderaddress}")
-                    # If best bid increases or best ask decreases then we recalculate the mid and apdate orders
-                    if (limit_price > self.best_bid_price) and (order_side == OrderSide.BUY):
-                        logger.info(f"Best Bid moved from {self.best_bid_price} -> {limit_price}")
-                        update_orders = True
-                    elif (limit_price < self.best_ask_price) and (order_side == OrderSide.SELL):
-                        logger.info(f"Best Ask moved from {self.best_ask_price} -> {limit_price}")
+        # Perform sanity checks on our own orders
+        if traderaddress == self.dexalot.trade_address:
+            metrics.observe_since(bytes(order_status_changed.transactionHash), 'own_event_seen')
+            self.apply_own_order_status(order_status_changed.args)
+            # Fetch the new world state and update our orders
+            if order_status == OrderStatus.FILLED:
+                filled_quantity = self.dexalot.from_lots(filled_lots)
+                logger.info("Order %s FILLED %s/%s %s", id, filled_quantity, filled_quantity, self.dexalot.base_symbol)
+                update_orders = True
+
+            elif order_status in [OrderStatus.REJECTED, OrderStatus.EXPIRED, OrderStatus.KILLED]:
+                logger.info("Order %s ERROR... Updating state and replacing orders", id)
+                self.requote_scheduler.request(f"{repr(order_status)} {id}", refresh_book=True)
+            # Check remaining amount after partial fill and replenish order if over tolerance
+            elif order_status == OrderStatus.PARTIAL:
+                remaining_lots = quantity_lots - filled_lots
+                logger.info("Order %s PARTIAL FILL %s/%s %s", id, self.dexalot.from_lots(filled_lots),
+                            self.dexalot.from_lots(quantity_lots), self.dexalot.base_symbol)
+                bid_amount, ask_amount = self.calculate_order_amounts()
+
+                if order_side == OrderSide.BUY:
+                    if not self.within_tolerance(bid_amount, remaining_lots, self.amount_tolerance):
                         update_orders = True
-                # If an existing limit order is removed or filled then we check to see if it was the best bid/ask and adjust orders if needed
-                elif order_status in [OrderStatus.CANCELLED, OrderStatus.FILLED]:
-                    limit_price = Decimal(order_status_changed.args.price) / 10 ** self.dexalot.quote_decimals
-                    limit_amount = Decimal(order_status_changed.args.quantity) / 10 ** self.dexalot.base_decimals
-                    logger.info(f"REMOVED {repr(order_side)} LIMIT. Price {limit_price} {self.dexalot.quote_symbol} "
-                                f"Amount {limit_amount} {self.dexalot.base_symbol} placed by {traderaddress}")
-                    if (limit_price == self.best_bid_price) or (limit_price == self.best_ask_price):
+                elif order_side == OrderSide.SELL:
+                    if not self.within_tolerance(ask_amount, remaining_lots, self.amount_tolerance):
                         update_orders = True
 
-            if update_orders:
-                time.sleep(5)
-                self.update_state()
-                self.update_orders()
-
-    def handler_executed(self, executed):
-        """Current logic can all be handled via OrderStatusChanged events which are emitted alongside Executed events.
-        Executed events could be used to determine useful features such as order aggressor that can be used to adjust skew/spread"""
-
-        pair = Web3.toText(executed.args.pair).split(str(b'\x00', 'utf8'))[0]
+        # Orders from others
+        else:
+            # If a new limit order then we check the new mid and adjust orders if needed
+            if order_status == OrderStatus.NEW:
+                # If best bid increases or best ask decreases then we recalculate the mid and apdate orders
+                if (price_ticks > self.best_bid_ticks) and (order_side == OrderSide.BUY):
+                    logger.debug("Best Bid moved from %s -> %s ticks", self.best_bid_ticks, price_ticks)
+                    update_orders = True
+                elif (price_ticks < self.best_ask_ticks) and (order_side == OrderSide.SELL):
+                    logger.debug("Best Ask moved from %s -> %s ticks", self.best_ask_ticks, price_ticks)
+                    update_orders = True
+            # If an existing limit order is removed or filled then we check to see if it was the best bid/ask and adjust orders if needed
+            elif order_status in [OrderStatus.CANCELLED, OrderStatus.FILLED]:
+                if (price_ticks == self.best_bid_ticks) or (price_ticks == self.best_ask_ticks):
+                    update_orders = True
 
-        if pair == self.pair:
-            maker = executed.args.maker.hex()
-            taker = executed.args.taker.hex()
-            price = Decimal(executed.args.price) / 10 ** self.dexalot.quote_decimals
-            amount = Decimal(executed.args.quantity) / 10 ** self.dexalot.base_decimals
-            fee_maker = Decimal(executed.args.feeMaker) / 10 ** self.dexalot.quote_decimals
-            fee_taker = Decimal(executed.args.feeTaker) / 10 ** self.dexalot.quote_decimals
+        # Apply the event to the local book after the checks above which compare against the previous best prices.
+        # Events the snapshot was read after are already in it
+        if self.book_block_number is None or order_status_changed.blockNumber > self.book_block_number:
+            self.order_book.apply_order_status(id, order_side, order_status, price_ticks, quantity_lots, filled_lots)
+            self.update_prices_from_book()
+            if self.order_book.is_crossed():
+                logger.warning("Local order book is crossed. Refreshing snapshot")
+                self.requote_scheduler.request("crossed local book", refresh_book=True)
+
+        log_event(event_log, 'order_status', pair=self.pair, id=id, status=order_status.value, side=order_side.value,
+                  price=price_ticks, quantity=quantity_lots, filled=filled_lots, trader=traderaddress,
+                  block=order_status_changed.blockNumber, requote=update_orders)
+        if update_orders:
+            self.requote_scheduler.request(f"{repr(order_status)} {repr(order_side)} {id}")
 
-            log_line = f"EXECUTED on {pair}. Price: {price} {self.dexalot.quote_symbol}. Amount: {amount} {self.dexalot.base_symbol}." + '\n'
-            log_line += f"Maker: {maker} (fee paid: {fee_maker}). Taker: {taker} (fee_paid: {fee_taker})"
-            logger.info(log_line)
+    def handler_executed(self, executed):
+        """Every trade of the pair updates the volatility and trade flow estimators, fills of our orders move the
+        inventory ledger."""
+
+        if executed.args.pair == self.pair_id:
+            # Raw EVM integers, converted when the event log is read
+            log_event(event_log, 'executed', pair=self.pair, price=executed.args.price,
+                      quantity=executed.args.quantity, maker=executed.args.maker, taker=executed.args.taker,
+                      fee_maker=executed.args.feeMaker, fee_taker=executed.args.feeTaker,
+                      block=executed.blockNumber)
+            # Executed is emitted before the OrderStatusChanged of the orders it fills, so our maker orders are still
+            # in the registry. Taker fills of orders we have not seen yet are picked up by the next reconciliation.
+            # The bytes32 ids are normalized so orders bootstrapped from REST are found too
+            maker_order = self.order_registry.get(to_order_id(executed.args.maker))
+            taker_order = self.order_registry.get(to_order_id(executed.args.taker))
+            # Same condition as the book update of OrderStatusChanged, which consumes what is recorded here
+            if self.book_block_number is None or executed.blockNumber > self.book_block_number:
+                self.order_book.apply_execution(to_order_id(executed.args.maker), to_order_id(executed.args.taker),
+                                                executed.args.quantity // self.dexalot.quantity_lot)
+            if self.inventory is not None:
+                for order, fee in ((maker_order, executed.args.feeMaker), (taker_order, executed.args.feeTaker)):
+                    if order is not None:
+                        self.inventory.apply_fill(executed.blockNumber, order.side, executed.args.price,
+                                                  executed.args.quantity, fee)
+
+            # The aggressor is known when one of the orders is ours, otherwise it is classified from the local book
+            # which still holds the maker order
+            self.estimators.update(executed.args.price // self.dexalot.price_tick,
+                                   executed.args.quantity // self.dexalot.quantity_lot,
+                                   own_aggressor(maker_order, taker_order),
+                                   self.best_bid_ticks, self.best_ask_ticks)
 
     def cancel_all_transaction(self):
-        order_id_list = []
-        for order in self.open_orders:
-            order_id_list.append(order['id'])
-        self.dexalot.cancel_all_orders(self.pair, order_id_list)
-
-    async def run_order_status_changed_listener(self, event_filter, poll_interval):
-        while True:
-            for order_status_changed in event_filter.get_new_entries():
-                self.handle_order_status_changed(order_status_changed)
-                await asyncio.sleep(poll_interval)
-
-    async def run_executed_listener(self, event_filter, poll_interval):
+        # cancelAllOrders is limited in how many ids it takes, a ladder may need several transactions
+        plan = OrderPlan()
+        plan.cancel.extend(self.order_registry)
+        for order_ids in plan.cancel_batches():
+            self.track_transaction(self.dexalot.cancel_all_orders(self.pair, order_ids,
+                                                                  self.handle_transaction_receipt),
+                                   {order.side for order in plan.cancel})
+
+    def event_matches_pair(self, event) -> bool:
+        pair_topic = event.indexed('pair')
+        if pair_topic is not None:
+            return pair_topic == self.pair_id
+        return event.args.pair == self.pair_id
+
+    async def run_event_listener(self, event_stream: EventStream):
+        async for event in event_stream:
+            # Events of other pairs are dropped before their data is decoded
+            if self.event_matches_pair(event):
+                self.handle_event(event)
+
+    def handle_event(self, event):
+        position = (event.blockNumber, event.logIndex)
+        if self.resume_position is not None and position <= self.resume_position:
+            return
+        if self.journal is not None:
+            self.journal.record_event(event.log_entry)
+        try:
+            if event.event == 'OrderStatusChanged':
+                self.handle_order_status_changed(event)
+            elif event.event == 'Executed':
+                self.handler_executed(event)
+        except Exception as e:
+            logger.error(f"Could not handle {event.event} event due to: {e}")
+        # Only advanced once the event was applied, a checkpoint never resumes past an event it does not contain
+        self.processed_position = max(self.processed_position or position, position)
+        metrics.observe('event_handling', time.monotonic() - event.received_timestamp)
+
+    def checkpoint_state(self) -> dict:
+        return {'pair': self.pair, 'trader_address': self.dexalot.trade_address, 'timestamp': time.time(),
+                'price_tick': self.dexalot.price_tick, 'quantity_lot': self.dexalot.quantity_lot,
+                'processed_position': self.processed_position, 'orders': self.order_registry.snapshot(),
+                'inventory': self.inventory.snapshot() if self.inventory is not None else None,
+                'nonces': self.dexalot.nonce_snapshot()}
+
+    def restore_checkpoint(self):
+        """Warm start from the checkpoint of a previous run: our open orders, inventory and in flight nonces are restored
+        and events are resumed after the last one processed, so fills and cancels while we were down are applied."""
+        if not self.checkpoint_path:
+            return
+        path = checkpoint_path(self.checkpoint_path, self.pair)
+        checkpoint = read_checkpoint(path)
+        if checkpoint is None:
+            return
+        if checkpoint['pair'] != self.pair or checkpoint['trader_address'] != self.dexalot.trade_address:
+            logger.warning(f"Ignoring checkpoint {path} of {checkpoint['pair']} for {checkpoint['trader_address']}")
+            return
+        if checkpoint['price_tick'] != self.dexalot.price_tick or checkpoint['quantity_lot'] != self.dexalot.quantity_lot:
+            logger.warning(f"Ignoring checkpoint {path} as the pair decimals changed")
+            return
+
+        self.order_registry.restore(checkpoint['orders'])
+        if checkpoint['inventory'] is not None:
+            self.inventory = InventoryLedger.from_snapshot(checkpoint['inventory'])
+        if checkpoint['nonces'] is not None:
+            self.dexalot.restore_nonces(checkpoint['nonces'])
+        self.resume_position = resume_position(checkpoint, self.checkpoint_max_age)
+        self.processed_position = self.resume_position
+        self.replaying_events = self.resume_position is not None
+        logger.info(f"Restored {len(self.order_registry)} open orders from checkpoint {path}. "
+                    f"Resuming events after {self.resume_position}")
+
+    def resume_block(self):
+        return self.resume_position[0] if self.resume_position is not None else None
+
+    async def requote_when_caught_up(self, event_stream: EventStream):
+        await event_stream.wait_caught_up()
+        self.finish_replay()
+
+    def finish_replay(self):
+        if not self.replaying_events:
+            return
+        self.replaying_events = False
+        logger.info(f"Replayed events up to {self.processed_position}. Quoting")
+        self.requote_scheduler.request("caught up with missed events", refresh_book=True)
+
+    async def run_checkpoints(self):
+        path = checkpoint_path(self.checkpoint_path, self.pair)
+        loop = asyncio.get_event_loop()
         while True:
-            for executed in event_filter.get_new_entries():
-                self.handler_executed(executed)
-                await asyncio.sleep(poll_interval)
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                # The state is captured on the event loop, only the file write runs in the executor
+                await loop.run_in_executor(None, write_checkpoint, path, self.checkpoint_state())
+            except Exception as e:
+                logger.error(f"Could not write checkpoint due to: {e}")
+
+    async def revalidate_reference_data(self):
+        loop = asyncio.get_event_loop()
+        try:
+            changed = await loop.run_in_executor(None, self.dexalot.revalidate_reference_data)
+        except Exception as e:
+            logger.error(f"Could not revalidate cached reference data due to: {e}")
+            return
+        if changed:
+            # Decimals or contracts changed so the book has to be rebuilt in the new units
+            self.order_book.initialized = False
+            self.requote_scheduler.request("reference data changed", refresh_book=True)
+
+    async def requote(self, refresh_book=False):
+        await self.update_state_async(refresh_book)
+        if not self.replaying_events:
+            self.update_orders()
 
     async def run_additional_state_update(self):
         while True:
             # Update the market state and then our orders
             await asyncio.sleep(self.additional_state_update)
-            try:
-                self.update_state()
-                self.update_orders()
-            except Exception as e:
-                logger.error(f"Could not update orders due to: {e}")
+            self.requote_scheduler.request("additional state update", refresh_book=True)
 
-    def calculate_mid(self, bid_price: Decimal, ask_price: Decimal) -> Decimal:
+    def calculate_mid(self, bid_price: int, ask_price: int) -> int:
+        # Prices in ticks, the mid is rounded down to a whole tick
         if (bid_price == 0) and (ask_price == 0):
-            return self.config['default_mid_price']
+            return self.default_mid_ticks
         elif (bid_price == 0) or (ask_price == 0):
-            return bid_price + self.target_spread / 2 if ask_price == 0 else ask_price - self.target_spread / 2
+            return bid_price + self.spread_ticks // 2 if ask_price == 0 else ask_price - self.spread_ticks // 2
         else:
-            return (bid_price + ask_price) / 2
+            return (bid_price + ask_price) // 2
 
     def get_nanos(self) -> int:
         return int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 10 ** 9)
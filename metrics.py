@@ -0,0 +1,125 @@
+import asyncio
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from logger import get_logger
+
+logger = get_logger('dexalot_metrics')
+
+
+class Histogram:
+    """Latency histogram over log spaced buckets from 100us to 100s (10 per decade), constant memory."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    BOUNDS = [1e-4 * 10 ** (i / 10) for i in range(61)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percentile: float) -> float:
+        """Upper bound of the bucket holding the percentile, capped at the largest observed value."""
+        if not self.count:
+            return 0.0
+        rank = percentile / 100 * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return min(self.BOUNDS[bucket], self.max) if bucket < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {'count': self.count, 'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99), 'max': self.max}
+
+
+class Metrics:
+    """
+    Stage latencies of the quoting pipeline in seconds, one histogram per stage. Durations are measured with the
+    monotonic clock. mark()/observe_since() time stages that start and end in different places, e.g. from sending a
+    transaction to seeing its OrderStatusChanged event, keyed by something both ends know such as the txn hash.
+    """
+
+    def __init__(self, max_marks=4096):
+        self.histograms = {}
+        self.marks = OrderedDict()
+        self.max_marks = max_marks
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+    def mark(self, key, timestamp=None):
+        self.marks[key] = time.monotonic() if timestamp is None else timestamp
+        if len(self.marks) > self.max_marks:
+            self.marks.popitem(last=False)
+
+    def observe_since(self, key, stage: str):
+        timestamp = self.marks.pop(key, None)
+        if timestamp is not None:
+            self.observe(stage, time.monotonic() - timestamp)
+
+    def snapshot(self) -> dict:
+        return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def format(self) -> str:
+        log_line = '\n' + 50 * '-' + '\n'
+        log_line += "Stage Latencies (ms)" + '\n'
+        for stage, summary in self.snapshot().items():
+            log_line += f"{stage}: count {summary['count']} - mean {summary['mean'] * 1000:.1f} - " \
+                        f"p50 {summary['p50'] * 1000:.1f} - p90 {summary['p90'] * 1000:.1f} - " \
+                        f"p99 {summary['p99'] * 1000:.1f} - max {summary['max'] * 1000:.1f}" + '\n'
+        return log_line + 50 * '-'
+
+    async def run_dump(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(self.format())
+
+    async def start_server(self, host: str, port: int):
+        """Serve the snapshot as JSON on http://host:port/metrics."""
+
+        async def handle_metrics(request):
+            return web.json_response(self.snapshot())
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+metrics = Metrics()
+
+
+def start_metrics(config, event_loop):
+    if config['metrics_dump_interval']:
+        event_loop.create_task(metrics.run_dump(config['metrics_dump_interval']))
+    if config['metrics_port'] is not None:
+        event_loop.create_task(metrics.start_server('127.0.0.1', config['metrics_port']))
@@ -0,0 +1,88 @@
+import asyncio
+
+from event_stream import EventStream
+from logger import get_logger
+from market_maker import MarketMaker, init_dexalot
+from metrics import start_metrics
+
+logger = get_logger('dexalot_multi_pair_runner')
+
+
+class MultiPairRunner:
+    """
+    Runs a MarketMaker per pair in config['trade_pairs'] from one process. All pairs share one Dexalot contract set,
+    REST session, nonce manager, gas oracle and transaction pipeline. A single event stream filtered on every pair id
+    is demultiplexed by the indexed pair topic to the market maker of the pair. Each market maker keeps its own state
+    and config, config['pair_configs'][pair] overrides the shared config for that pair.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.dexalot = None
+        self.market_makers = {}  # pair_id -> MarketMaker
+
+    def pair_config(self, trade_pair: str) -> dict:
+        pair_config = dict(self.config)
+        pair_config['trade_pair'] = trade_pair
+        pair_config.update(self.config['pair_configs'].get(trade_pair, {}))
+        return pair_config
+
+    async def run(self, event_loop):
+
+        # One exchange handler is initialized, every pair gets a view of it
+        self.dexalot = init_dexalot(self.pair_config(self.config['trade_pairs'][0]), event_loop)
+        start_metrics(self.config, event_loop)
+        self.start_market_makers(event_loop)
+        if self.dexalot.reference_data_from_cache:
+            event_loop.create_task(self.revalidate_reference_data())
+
+        event_stream = EventStream(self.dexalot.web3, self.dexalot.trade_pairs_contract,
+                                   ['OrderStatusChanged', 'Executed'], ws_url=self.config['ws_url'],
+                                   poll_interval=self.config['event_poll_interval'], from_block=self.resume_block(),
+                                   indexed_filters={'pair': list(self.market_makers)})
+        for market_maker in self.market_makers.values():
+            if market_maker.replaying_events:
+                event_loop.create_task(market_maker.requote_when_caught_up(event_stream))
+        await self.run_event_listener(event_stream)
+
+    def start_market_makers(self, event_loop):
+        for trade_pair in self.config['trade_pairs']:
+            market_maker = MarketMaker(self.pair_config(trade_pair))
+            market_maker.dexalot = self.dexalot.for_pair(trade_pair)
+            market_maker.restore_checkpoint()
+            market_maker.start()
+            self.market_makers[market_maker.pair_id] = market_maker
+            event_loop.create_task(market_maker.run_additional_state_update())
+            if market_maker.checkpoint_path:
+                event_loop.create_task(market_maker.run_checkpoints())
+
+    def resume_block(self):
+        # The stream resumes from the pair furthest behind, the others skip the events they already processed
+        resume_blocks = [market_maker.resume_block() for market_maker in self.market_makers.values()
+                         if market_maker.resume_block() is not None]
+        return min(resume_blocks) if resume_blocks else None
+
+    async def run_event_listener(self, event_stream: EventStream):
+        async for event in event_stream:
+            self.dispatch(event)
+
+    def dispatch(self, event):
+        pair_id = event.indexed('pair')
+        if pair_id is None:
+            pair_id = event.args.pair
+        market_maker = self.market_makers.get(pair_id)
+        if market_maker is not None:
+            market_maker.handle_event(event)
+
+    async def revalidate_reference_data(self):
+        loop = asyncio.get_event_loop()
+        try:
+            changed = await loop.run_in_executor(None, self.dexalot.revalidate_reference_data)
+        except Exception as e:
+            logger.error(f"Could not revalidate cached reference data due to: {e}")
+            return
+        if changed:
+            for market_maker in self.market_makers.values():
+                market_maker.dexalot = self.dexalot.for_pair(market_maker.pair)
+                market_maker.order_book.initialized = False
+                market_maker.requote_scheduler.request("reference data changed", refresh_book=True)
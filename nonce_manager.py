@@ -0,0 +1,143 @@
+import threading
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from logger import get_logger
+
+logger = get_logger('dexalot_nonce_manager')
+
+
+class NonceManager:
+    """
+    Allocates nonces locally so several transactions can be in flight at once without waiting for the previous one to
+    be mined. Sent transactions are remembered by nonce until mined so they can be re-sent with a higher gas price
+    (replace-by-fee). Nonces that were allocated but never made it on chain are kept as gaps, the next allocation reuses
+    them and fill_gaps hands them out so later transactions are not stuck behind them.
+    """
+
+    def __init__(self, web3: Web3, address):
+        self.web3 = web3
+        self.address = address
+        self.next_nonce = None
+        self.in_flight = {}  # nonce -> (txn_hash, txn)
+        self.txn_nonces = {}  # txn_hash -> nonce
+        self.gaps = set()
+        self.lock = threading.Lock()
+
+    def allocate(self) -> int:
+        with self.lock:
+            if self.next_nonce is None:
+                self.next_nonce = self.web3.eth.get_transaction_count(self.address, 'pending')
+            if self.gaps:
+                nonce = min(self.gaps)
+                self.gaps.discard(nonce)
+                return nonce
+            nonce = self.next_nonce
+            self.next_nonce += 1
+            return nonce
+
+    def release(self, nonce: int):
+        # The transaction never reached the node so the nonce can be handed out again. A nonce with a transaction in
+        # flight is never released, a failed replacement leaves the original pending
+        with self.lock:
+            if nonce in self.in_flight:
+                return
+            if nonce == self.next_nonce - 1:
+                self.next_nonce -= 1
+            else:
+                self.gaps.add(nonce)
+
+    def mark_sent(self, nonce: int, txn_hash, txn: dict):
+        with self.lock:
+            previous = self.in_flight.get(nonce)
+            if previous is not None:
+                self.txn_nonces.pop(previous[0], None)
+            self.in_flight[nonce] = (txn_hash, txn)
+            self.txn_nonces[txn_hash] = nonce
+
+    def mark_mined(self, txn_hash):
+        with self.lock:
+            nonce = self.txn_nonces.pop(txn_hash, None)
+            if nonce is not None and self.in_flight.get(nonce, (None,))[0] == txn_hash:
+                del self.in_flight[nonce]
+
+    def mark_dropped(self, txn_hash) -> bool:
+        """
+        Called when a transaction was not mined in time. A transaction the node still knows is only slow and stays in
+        flight. Otherwise resyncs with the chain and records a gap if the nonce was not consumed by another
+        (replacement) transaction. Returns True if the transaction was dropped.
+        """
+        try:
+            self.web3.eth.get_transaction(txn_hash)
+            logger.info(f"Transaction {Web3.toHex(txn_hash)} is not mined yet but still pending. Keeping its nonce")
+            return False
+        except TransactionNotFound:
+            pass
+        latest_count = self.web3.eth.get_transaction_count(self.address, 'latest')
+        with self.lock:
+            nonce = self.txn_nonces.pop(txn_hash, None)
+            if nonce is None:
+                return True
+            self.in_flight.pop(nonce, None)
+            if nonce < latest_count:
+                logger.info(f"Nonce {nonce} was consumed by a replacement transaction")
+            elif nonce == self.next_nonce - 1:
+                self.next_nonce -= 1
+            else:
+                logger.warning(f"Transaction with nonce {nonce} was dropped. Recording nonce gap")
+                self.gaps.add(nonce)
+        return True
+
+    def resync(self):
+        latest_count = self.web3.eth.get_transaction_count(self.address, 'latest')
+        pending_count = self.web3.eth.get_transaction_count(self.address, 'pending')
+        with self.lock:
+            for nonce in [nonce for nonce in self.in_flight if nonce < latest_count]:
+                txn_hash, _ = self.in_flight.pop(nonce)
+                self.txn_nonces.pop(txn_hash, None)
+            self.gaps = {nonce for nonce in self.gaps if nonce >= latest_count}
+            if self.next_nonce is None or self.next_nonce < pending_count:
+                self.next_nonce = pending_count
+            logger.info(f"Resynced nonces. Next nonce {self.next_nonce}. In flight {sorted(self.in_flight)}. "
+                        f"Gaps {sorted(self.gaps)}")
+
+    def snapshot(self) -> dict:
+        """Nonce state for a checkpoint, transaction hashes as hex."""
+        with self.lock:
+            in_flight = [[nonce, Web3.toHex(txn_hash), txn] for nonce, (txn_hash, txn) in self.in_flight.items()]
+            return {'next_nonce': self.next_nonce, 'gaps': sorted(self.gaps), 'in_flight': in_flight}
+
+    def restore(self, snapshot: dict) -> list:
+        """Merge the nonce state of a checkpoint, several pairs sharing this manager may each restore theirs. Returns
+        the hashes of the restored in flight transactions, whose receipts have to be tracked again."""
+        restored = []
+        with self.lock:
+            if snapshot['next_nonce'] is not None:
+                self.next_nonce = max(self.next_nonce or 0, snapshot['next_nonce'])
+            self.gaps.update(snapshot['gaps'])
+            for nonce, txn_hash, txn in snapshot['in_flight']:
+                if nonce not in self.in_flight:
+                    txn_hash = HexBytes(txn_hash)
+                    self.in_flight[nonce] = (txn_hash, txn)
+                    self.txn_nonces[txn_hash] = nonce
+                    restored.append(txn_hash)
+        return restored
+
+    def fill_gaps(self) -> list:
+        with self.lock:
+            gaps = sorted(self.gaps)
+            self.gaps.clear()
+        return gaps
+
+    def add_gaps(self, nonces: list):
+        # Gaps handed out by fill_gaps that were not filled
+        with self.lock:
+            self.gaps.update(nonces)
+
+    def replacement(self, nonce: int, gas_price_bump=1.125) -> dict:
+        # Nodes only accept a replacement with a gas price at least ~10% above the original
+        with self.lock:
+            _, txn = self.in_flight[nonce]
+        return dict(txn, gasPrice=int(txn['gasPrice'] * gas_price_bump) + 1)
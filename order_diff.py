@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import numpy as np
+
+from enums import OrderSide
+
+# Tolerances are fixed-point integers in parts per million so they can be checked against ticks and lots
+TOLERANCE_SCALE = 10 ** 6
+
+# Most order ids cancelAllOrders takes per call
+CANCEL_BATCH_SIZE = 20
+
+
+def to_tolerance(tolerance) -> int:
+    return int(Decimal(str(tolerance)) * TOLERANCE_SCALE)
+
+
+class Quote:
+    """A desired order, price in quote ticks and amount in base lots."""
+
+    __slots__ = ('side', 'price', 'amount')
+
+    def __init__(self, side: OrderSide, price: int, amount: int):
+        self.side = side
+        self.price = price
+        self.amount = amount
+
+    def __repr__(self):
+        return f"Quote({repr(self.side)}, {self.price}, {self.amount})"
+
+
+class OrderPlan:
+    """Actions that move the live orders to the desired quotes: orders to keep, orders to cancel and quotes to add."""
+
+    def __init__(self):
+        self.keep = []
+        self.cancel = []
+        self.add = []
+
+    def __bool__(self):
+        return bool(self.cancel or self.add)
+
+    def __repr__(self):
+        return (f"OrderPlan(keep={[order.id for order in self.keep]}, "
+                f"cancel={[order.id for order in self.cancel]}, add={self.add})")
+
+    def cancel_batches(self, batch_size=CANCEL_BATCH_SIZE) -> list:
+        """Order ids to cancel grouped for cancelAllOrders, which is limited in how many ids it takes per call."""
+        order_ids = [order.id for order in self.cancel]
+        return [order_ids[i:i + batch_size] for i in range(0, len(order_ids), batch_size)]
+
+
+def within_tolerance(target_value: int, order_value: int, tolerance: int) -> bool:
+    """|order value - target| < order value * tolerance, with the tolerance in parts per million."""
+    return abs(order_value - target_value) * TOLERANCE_SCALE < order_value * tolerance
+
+
+def reconcile(live_orders: list, desired_quotes: list, price_tolerance: int, amount_tolerance: int) -> OrderPlan:
+    """
+    Compute the minimal plan that turns live_orders (OrderRecords of the order registry) into desired_quotes. A live order is kept if it matches a desired quote on the same side
+    within the price tolerance and its remaining amount within the amount tolerance. Unmatched live orders are
+    cancelled and unmatched quotes added.
+
+    Tolerances are checked for every (order, quote) pair of a side at once as an integer boolean matrix, each order
+    then takes the first quote it matches that has not been taken yet.
+    """
+    plan = OrderPlan()
+
+    for order_side in (OrderSide.BUY, OrderSide.SELL):
+        side_orders = [order for order in live_orders if order.side == order_side]
+        side_quotes = [quote for quote in desired_quotes if quote.side == order_side]
+        if not side_orders or not side_quotes:
+            plan.cancel.extend(side_orders)
+            plan.add.extend(side_quotes)
+            continue
+
+        order_prices = np.array([order.price for order in side_orders], dtype=np.int64)
+        order_amounts = np.array([order.remaining for order in side_orders], dtype=np.int64)
+        quote_prices = np.array([quote.price for quote in side_quotes], dtype=np.int64)
+        quote_amounts = np.array([quote.amount for quote in side_quotes], dtype=np.int64)
+
+        # Same condition as within_tolerance
+        matches = ((np.abs(order_prices[:, None] - quote_prices[None, :]) * TOLERANCE_SCALE
+                    < order_prices[:, None] * price_tolerance)
+                   & (np.abs(order_amounts[:, None] - quote_amounts[None, :]) * TOLERANCE_SCALE
+                      < order_amounts[:, None] * amount_tolerance))
+
+        unmatched = np.ones(len(side_quotes), dtype=bool)
+        for order, order_matches in zip(side_orders, matches):
+            candidates = order_matches & unmatched
+            if candidates.any():
+                unmatched[candidates.argmax()] = False
+                plan.keep.append(order)
+            else:
+                plan.cancel.append(order)
+        plan.add.extend(quote for quote, is_unmatched in zip(side_quotes, unmatched) if is_unmatched)
+
+    return plan
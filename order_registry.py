@@ -0,0 +1,184 @@
+import time
+from collections import OrderedDict
+
+from enums import OrderSide, OrderStatus
+from logger import get_logger
+from orderbook import CLOSED_STATUSES
+
+logger = get_logger('dexalot_order_registry')
+
+# Status changes an open order can go through, anything else is a stale or replayed update
+TRANSITIONS = {
+    OrderStatus.NEW: {OrderStatus.PARTIAL, OrderStatus.FILLED, OrderStatus.CANCELLED, OrderStatus.KILLED,
+                      OrderStatus.EXPIRED, OrderStatus.REJECTED},
+    OrderStatus.PARTIAL: {OrderStatus.PARTIAL, OrderStatus.FILLED, OrderStatus.CANCELLED, OrderStatus.KILLED,
+                          OrderStatus.EXPIRED},
+}
+
+
+def to_order_id(order_id) -> str:
+    """
+    Canonical form of an order id: lowercase hex with a 0x prefix. Decoded bytes32 event args are plain bytes whose
+    hex() has no prefix while REST ids keep theirs, so every id is normalized before it is used as a key or encoded.
+    """
+    if isinstance(order_id, (bytes, bytearray)):
+        return '0x' + bytes(order_id).hex()
+    order_id = order_id.lower()
+    return order_id if order_id.startswith('0x') else '0x' + order_id
+
+
+class OrderRecord:
+    """One of our open orders, price in quote ticks and quantities in base lots."""
+
+    __slots__ = ('id', 'side', 'price', 'quantity', 'quantity_filled', 'status', 'updated_timestamp')
+
+    def __init__(self, order_id: str, side: OrderSide, price: int, quantity: int, quantity_filled=0,
+                 status=OrderStatus.NEW):
+        self.id = order_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.quantity_filled = quantity_filled
+        self.status = status
+        self.updated_timestamp = time.monotonic()
+
+    @property
+    def remaining(self) -> int:
+        return self.quantity - self.quantity_filled
+
+    def __repr__(self):
+        return f"OrderRecord({self.id}, {repr(self.side)}, {repr(self.status)}, {self.price}, " \
+               f"{self.quantity_filled}/{self.quantity})"
+
+
+class OrderRegistry:
+    """
+    Our open orders indexed by id and by side and price level. Kept up to date from our own OrderStatusChanged events
+    and the OrderStatusChanged logs of our transaction receipts, whichever arrives first, through the state machine
+    in TRANSITIONS: NEW -> PARTIAL -> FILLED/CANCELLED (or KILLED/EXPIRED/REJECTED). Closed orders are dropped.
+
+    The REST open orders are only needed to bootstrap the registry and to periodically reconcile it. As the REST API
+    can lag behind the chain, orders updated locally within grace_period seconds are trusted over the REST view.
+    """
+
+    def __init__(self, grace_period=10, closed_history=1024):
+        self.grace_period = grace_period
+        self.orders = {}  # order id -> OrderRecord
+        self.levels = {OrderSide.BUY: {}, OrderSide.SELL: {}}  # side -> price -> {order id -> OrderRecord}
+        self.closed = OrderedDict()  # recently closed order id -> closed timestamp
+        self.closed_history = closed_history
+        self.initialized = False
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return iter(list(self.orders.values()))
+
+    def get(self, order_id):
+        return self.orders.get(to_order_id(order_id))
+
+    def side_orders(self, order_side: OrderSide) -> list:
+        return [order for level in self.levels[order_side].values() for order in level.values()]
+
+    def at_price(self, order_side: OrderSide, price: int) -> list:
+        return list(self.levels[order_side].get(price, {}).values())
+
+    def _add(self, order: OrderRecord):
+        self.orders[order.id] = order
+        self.levels[order.side].setdefault(order.price, {})[order.id] = order
+
+    def _remove(self, order_id: str):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return
+        level = self.levels[order.side][order.price]
+        del level[order_id]
+        if not level:
+            del self.levels[order.side][order.price]
+
+    def _mark_closed(self, order_id: str):
+        self.closed[order_id] = time.monotonic()
+        self.closed.move_to_end(order_id)
+        while len(self.closed) > self.closed_history:
+            self.closed.popitem(last=False)
+
+    def apply_status(self, order_id: str, order_side: OrderSide, order_status: OrderStatus, price: int,
+                     quantity: int, quantity_filled: int):
+        """Apply an OrderStatusChanged update of one of our orders. Returns the updated record, None if the order is
+        closed or the update was ignored."""
+        order_id = to_order_id(order_id)
+        order = self.orders.get(order_id)
+        if order is None:
+            if order_status in CLOSED_STATUSES:
+                self._mark_closed(order_id)
+                return None
+            if order_id in self.closed:
+                logger.info(f"Ignoring {repr(order_status)} of closed order {order_id}")
+                return None
+            order = OrderRecord(order_id, order_side, price, quantity, quantity_filled, order_status)
+            self._add(order)
+            return order
+
+        if order_status not in TRANSITIONS[order.status] or quantity_filled < order.quantity_filled:
+            # Receipt logs and events deliver the same updates, duplicates and older updates are dropped
+            return order
+
+        if order_status in CLOSED_STATUSES:
+            self._remove(order_id)
+            self._mark_closed(order_id)
+            return None
+        order.status = order_status
+        order.quantity_filled = quantity_filled
+        order.updated_timestamp = time.monotonic()
+        return order
+
+    def snapshot(self) -> list:
+        """Open orders as plain lists for a checkpoint, with the wall clock time they were last updated at."""
+        wall_offset = time.time() - time.monotonic()
+        return [[order.id, order.side.value, order.price, order.quantity, order.quantity_filled, order.status.value,
+                 order.updated_timestamp + wall_offset] for order in self.orders.values()]
+
+    def restore(self, records: list):
+        """Load the open orders of a checkpoint. They keep the time they were last updated at, so after a restart
+        longer than the grace period the REST view overrides them on the first reconcile."""
+        monotonic_offset = time.monotonic() - time.time()
+        for order_id, side, price, quantity, quantity_filled, status, updated_time in records:
+            order_id = to_order_id(order_id)
+            if order_id not in self.orders:
+                order = OrderRecord(order_id, OrderSide(side), price, quantity, quantity_filled, OrderStatus(status))
+                order.updated_timestamp = min(updated_time + monotonic_offset, order.updated_timestamp)
+                self._add(order)
+
+    def reconcile(self, rest_orders: list) -> int:
+        """Reconcile the registry with REST open orders, already converted to OrderRecords. Returns the number of
+        orders that did not match."""
+        now = time.monotonic()
+        for rest_order in rest_orders:
+            rest_order.id = to_order_id(rest_order.id)
+        rest_ids = {order.id for order in rest_orders}
+        mismatched = 0
+
+        for order in list(self.orders.values()):
+            if order.id not in rest_ids and now - order.updated_timestamp > self.grace_period:
+                self._remove(order.id)
+                mismatched += 1
+
+        for rest_order in rest_orders:
+            order = self.orders.get(rest_order.id)
+            if order is None:
+                closed_timestamp = self.closed.get(rest_order.id)
+                if closed_timestamp is not None and now - closed_timestamp <= self.grace_period:
+                    continue
+                self.closed.pop(rest_order.id, None)
+                self._add(rest_order)
+                mismatched += 1
+            elif rest_order.quantity_filled > order.quantity_filled:
+                order.quantity_filled = rest_order.quantity_filled
+                order.status = OrderStatus.PARTIAL
+                mismatched += 1
+
+        if mismatched and self.initialized:
+            logger.warning(f"Order registry differed from REST open orders on {mismatched} orders")
+        self.initialized = True
+        return mismatched
@@ -0,0 +1,166 @@
+from array import array
+from bisect import bisect_left, insort
+
+from enums import OrderSide, OrderStatus
+
+CLOSED_STATUSES = (OrderStatus.FILLED, OrderStatus.CANCELLED, OrderStatus.KILLED, OrderStatus.EXPIRED,
+                   OrderStatus.REJECTED)
+
+
+class BookLevels:
+    """Compact array-backed (price, quantity) levels of one side of a book snapshot, best price first."""
+
+    __slots__ = ('prices', 'quantities')
+
+    def __init__(self):
+        self.prices = array('Q')
+        self.quantities = array('Q')
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __iter__(self):
+        return zip(self.prices, self.quantities)
+
+    def __repr__(self):
+        return f"BookLevels({list(self)})"
+
+    def append(self, price: int, quantity: int):
+        # Pages can split a price level across calls so merge consecutive entries at the same price
+        if self.prices and self.prices[-1] == price:
+            self.quantities[-1] += quantity
+        else:
+            self.prices.append(price)
+            self.quantities.append(quantity)
+
+
+class BookSide:
+    """Aggregated price levels for one side of the book. Quantities are kept in a dict keyed by price and the prices in
+    a sorted list, so updating an existing level is O(1). Adding or removing a level finds its position by binary
+    search but shifts the list, O(n) in the number of levels, a memmove that is cheap at the depth of a book."""
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.levels = {}
+        self.prices = []
+
+    def __len__(self):
+        return len(self.prices)
+
+    def clear(self):
+        self.levels.clear()
+        self.prices.clear()
+
+    def set_level(self, price: int, quantity: int):
+        if quantity <= 0:
+            if self.levels.pop(price, None) is not None:
+                del self.prices[bisect_left(self.prices, price)]
+        else:
+            if price not in self.levels:
+                insort(self.prices, price)
+            self.levels[price] = quantity
+
+    def add(self, price: int, quantity: int):
+        self.set_level(price, self.levels.get(price, 0) + quantity)
+
+    def best(self):
+        if not self.prices:
+            return 0, 0
+        price = self.prices[-1] if self.is_bid else self.prices[0]
+        return price, self.levels[price]
+
+    def depth(self, n_levels=None):
+        prices = reversed(self.prices) if self.is_bid else self.prices
+        levels = [(price, self.levels[price]) for price in prices]
+        return levels if n_levels is None else levels[:n_levels]
+
+
+class OrderBook:
+    """
+    Local L2 order book maintained from OrderStatusChanged events. Prices and quantities are integers in units of the
+    pair's display decimals. A snapshot from getNOrders is only needed to bootstrap the book and to check for drift.
+
+    Orders seen after the snapshot are tracked by id so partial fills and removals are exact. Orders resting before the
+    snapshot are unknown: their fills are taken from the Executed events that precede their status change, and an
+    order that was the taker of a trade was not resting before, so what is left of it is added to the book. Without an
+    Executed event an unknown order is assumed to have had no previous fills, which the next snapshot corrects.
+    """
+
+    def __init__(self):
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.orders = {}  # order id -> (side, price, remaining quantity)
+        self.executions = {}  # maker order id -> quantity executed since its last status change
+        self.takers = set()  # ids of taker orders executed before their status change
+        self.initialized = False
+
+    def side(self, order_side: OrderSide) -> BookSide:
+        return self.bids if order_side == OrderSide.BUY else self.asks
+
+    def load_snapshot(self, bid_book: BookLevels, ask_book: BookLevels):
+        for book_side, book_levels in ((self.bids, bid_book), (self.asks, ask_book)):
+            book_side.clear()
+            for price, quantity in book_levels:
+                book_side.add(price, quantity)
+        # Forget orders whose level no longer exists
+        self.orders = {order_id: order for order_id, order in self.orders.items()
+                       if order[1] in self.side(order[0]).levels}
+        self.executions.clear()
+        self.takers.clear()
+        self.initialized = True
+
+    def apply_execution(self, maker_id, taker_id, quantity: int):
+        """Record a trade. Executed comes before the OrderStatusChanged of both of its orders, which apply it."""
+        self.executions[maker_id] = self.executions.get(maker_id, 0) + quantity
+        self.takers.add(taker_id)
+
+    def apply_order_status(self, order_id, order_side: OrderSide, order_status: OrderStatus, price: int,
+                           quantity: int, quantity_filled: int):
+        book_side = self.side(order_side)
+        known_order = self.orders.get(order_id)
+        executed = self.executions.pop(order_id, None)
+        is_taker = order_id in self.takers
+        self.takers.discard(order_id)
+        if known_order is not None:
+            previous_remaining = known_order[2]
+        elif is_taker or order_status in (OrderStatus.NEW, OrderStatus.REJECTED):
+            previous_remaining = 0
+        elif executed is not None:
+            # Unknown maker: it rested with what is left now plus what was just executed
+            previous_remaining = (0 if order_status in CLOSED_STATUSES else quantity - quantity_filled) + executed
+        elif order_status in (OrderStatus.CANCELLED, OrderStatus.KILLED, OrderStatus.EXPIRED):
+            previous_remaining = quantity - quantity_filled
+        else:
+            # Unknown order filled against without its Executed event, assume nothing was filled before this event
+            previous_remaining = quantity
+
+        if order_status in CLOSED_STATUSES:
+            remaining = 0
+            self.orders.pop(order_id, None)
+        else:
+            remaining = quantity - quantity_filled
+            self.orders[order_id] = (order_side, price, remaining)
+
+        book_side.add(price, remaining - previous_remaining)
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def is_crossed(self) -> bool:
+        best_bid_price, _ = self.best_bid()
+        best_ask_price, _ = self.best_ask()
+        return best_bid_price != 0 and best_ask_price != 0 and best_bid_price >= best_ask_price
+
+    def drift(self, bid_book: BookLevels, ask_book: BookLevels) -> int:
+        """Number of price levels in the snapshot that do not match the local book."""
+        mismatched = 0
+        for book_side, book_levels in ((self.bids, bid_book), (self.asks, ask_book)):
+            snapshot_levels = list(book_levels)
+            local_levels = book_side.depth(len(snapshot_levels))
+            mismatched += sum(1 for snapshot_level, local_level in zip(snapshot_levels, local_levels)
+                              if snapshot_level != local_level)
+            mismatched += abs(len(snapshot_levels) - len(local_levels))
+        return mismatched
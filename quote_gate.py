@@ -0,0 +1,94 @@
+import math
+
+from enums import OrderSide
+from logger import get_logger
+from order_diff import TOLERANCE_SCALE, OrderPlan
+
+logger = get_logger('dexalot_quote_gate')
+
+
+class QuoteGate:
+    """
+    Decides per side whether the cancels and adds of an OrderPlan pay for their transactions. The expected edge of a
+    resting order is its spread capture against the mid less the maker fee, times the probability it is filled. A
+    side's actions go ahead if the edge of the quotes they add exceeds the edge of the orders they cancel by margin
+    times their gas cost. Otherwise the side's orders are left as they are and the actions are deferred to a later
+    requote, when the market has moved further or gas is cheaper.
+
+    A side that only cancels is never deferred: pulling quotes without replacing them reduces risk.
+
+    Cancels are costed as they are sent: the cancels of the sides that go ahead are sent in batches of cancelAllOrders,
+    or as one cancelOrder when there is a single one, and a side pays its share of the batches by number of orders.
+
+    Edges and costs are in ticks * lots, the notional unit of the ladder.
+    """
+
+    def __init__(self, maker_fee: int, margin: float):
+        self.maker_fee = maker_fee  # Parts per million of the notional
+        self.margin = margin
+
+    def fill_probability(self, distance: int, fill_scale: float) -> float:
+        """Probability a quote distance ticks away from the mid on its profitable side is filled. Orders at or
+        through the mid are taken to fill."""
+        if distance <= 0:
+            return 1.0
+        return math.exp(-distance / fill_scale)
+
+    def order_edge(self, order_side: OrderSide, price: int, lots: int, mid: int, fill_scale: float) -> float:
+        capture = mid - price if order_side == OrderSide.BUY else price - mid
+        fee = price * self.maker_fee / TOLERANCE_SCALE
+        return self.fill_probability(capture, fill_scale) * (capture - fee) * lots
+
+    def apply(self, plan: OrderPlan, mid: int, fill_scale: float, add_cost: float, cancel_cost) -> OrderPlan:
+        """
+        Plan with only the sides whose actions pay for themselves, the orders of deferred sides are kept. cancel_cost
+        is called with the number of orders of a cancel transaction and returns its cost.
+        """
+        sides = {}
+        for order_side in (OrderSide.BUY, OrderSide.SELL):
+            cancel = [order for order in plan.cancel if order.side == order_side]
+            add = [quote for quote in plan.add if quote.side == order_side]
+            if cancel or add:
+                sides[order_side] = (cancel, add)
+
+        # Deferring a side changes how the remaining cancels are batched, so the others are checked again
+        deferred = set()
+        while True:
+            cost_per_cancel = self.cost_per_cancel(plan, deferred, cancel_cost)
+            newly_deferred = {order_side for order_side, (cancel, add) in sides.items()
+                              if order_side not in deferred and
+                              not self.pays(order_side, cancel, add, mid, fill_scale, add_cost, cost_per_cancel)}
+            if not newly_deferred:
+                break
+            deferred |= newly_deferred
+
+        gated = OrderPlan()
+        gated.keep.extend(plan.keep)
+        for order_side, (cancel, add) in sides.items():
+            if order_side in deferred:
+                gated.keep.extend(cancel)
+            else:
+                gated.cancel.extend(cancel)
+                gated.add.extend(add)
+        return gated
+
+    def cost_per_cancel(self, plan: OrderPlan, deferred: set, cancel_cost) -> float:
+        sent = OrderPlan()
+        sent.cancel.extend(order for order in plan.cancel if order.side not in deferred)
+        if not sent.cancel:
+            return 0
+        return sum(cancel_cost(len(batch)) for batch in sent.cancel_batches()) / len(sent.cancel)
+
+    def pays(self, order_side: OrderSide, cancel: list, add: list, mid: int, fill_scale: float, add_cost: float,
+             cost_per_cancel: float) -> bool:
+        # Pulling quotes without replacing them reduces risk (a smaller ladder, inventory skew), it is never deferred
+        if not add:
+            return True
+        gain = sum(self.order_edge(order_side, quote.price, quote.amount, mid, fill_scale) for quote in add) - \
+            sum(self.order_edge(order_side, order.price, order.remaining, mid, fill_scale) for order in cancel)
+        cost = len(cancel) * cost_per_cancel + len(add) * add_cost
+        if gain >= cost * self.margin:
+            return True
+        logger.info("Deferring %r side: %d cancels and %d adds gain %.0f < cost %.0f", order_side, len(cancel),
+                    len(add), gain, cost)
+        return False
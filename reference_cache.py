@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+
+from logger import get_logger
+
+logger = get_logger('dexalot_reference_cache')
+
+CACHE_VERSION = 1
+
+
+def abi_hash(abi) -> str:
+    return hashlib.sha256(json.dumps(abi, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ReferenceCache:
+    """
+    Versioned on-disk cache of pair reference data and contract addresses and ABIs for one REST API base url. Lets
+    Dexalot.initialize start without the REST API, the cached data is revalidated against the API afterwards.
+    """
+
+    def __init__(self, path: str, base_url: str):
+        self.path = path
+        self.base_url = base_url
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read reference cache {self.path} due to: {e}")
+            return None
+
+        if cache.get('version') != CACHE_VERSION or cache.get('base_url') != self.base_url:
+            logger.info(f"Ignoring reference cache {self.path} written for another version or API")
+            return None
+        for deployment_type, contract_info in cache['contracts'].items():
+            if abi_hash(contract_info['abi']) != contract_info['abi_hash']:
+                logger.warning(f"Ignoring reference cache {self.path}, {deployment_type} ABI does not match its hash")
+                return None
+        return cache
+
+    def save(self, pairs: list, contracts: dict):
+        """pairs is the list of deployed pairs, contracts maps deployment type to {'address': ..., 'abi': [...]}."""
+        cache = {
+            'version': CACHE_VERSION,
+            'base_url': self.base_url,
+            'pairs': {pair_data['pair']: pair_data for pair_data in pairs},
+            'contracts': {deployment_type: {'address': contract_info['address'],
+                                            'abi': contract_info['abi'],
+                                            'abi_hash': abi_hash(contract_info['abi'])}
+                          for deployment_type, contract_info in contracts.items()},
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file and rename so a crash never leaves a partial cache behind
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.path)
+        return cache
+
+    @staticmethod
+    def changed_contracts(cache: dict, contracts: dict) -> list:
+        """Deployment types whose address or ABI hash differs between the cache and freshly fetched contracts."""
+        changed = []
+        for deployment_type, contract_info in contracts.items():
+            cached_info = cache['contracts'].get(deployment_type)
+            if (cached_info is None or cached_info['address'] != contract_info['address']
+                    or cached_info['abi_hash'] != abi_hash(contract_info['abi'])):
+                changed.append(deployment_type)
+        return changed
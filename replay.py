@@ -0,0 +1,129 @@
+import argparse
+import json
+import time
+from collections import Counter
+
+from web3 import Web3
+
+from dexalot import Dexalot
+from event_stream import EventStream
+from journal import RECORD_ACTION, RECORD_EVENT, RECORD_REFERENCE, RECORD_SNAPSHOT, read_journal
+from logger import get_logger
+from market_maker import MarketMaker
+
+logger = get_logger('dexalot_replay')
+
+
+class StubExchange(Dexalot):
+    """Offline exchange for replays. Reference data comes from the journal, order actions are recorded, not sent."""
+
+    def __init__(self, reference: dict):
+        super().__init__(base_url='', trade_pair=reference['pair']['pair'], web3=Web3(),
+                         trader_address=reference['trader_address'])
+        self._apply_pair_data(reference['pair'])
+        self.trade_pairs_contract = self.web3.eth.contract(address=reference['address'], abi=reference['abi'])
+        self.actions = []
+
+    def add_order_ticks(self, trade_pair_id, price_ticks: int, lots: int, order_side, order_type, on_receipt=None):
+        self.actions.append({'action': 'add', 'side': order_side.value, 'price': price_ticks, 'amount': lots})
+
+    def cancel_order(self, trade_pair_id: str, order_id: str, on_receipt=None):
+        self.actions.append({'action': 'cancel', 'ids': [order_id]})
+
+    def cancel_all_orders(self, trade_pair_id: str, order_id_list: list, on_receipt=None):
+        self.actions.append({'action': 'cancel', 'ids': list(order_id_list)})
+
+
+class ReplayScheduler:
+    """RequoteScheduler on the journal clock. Requests are coalesced for debounce journal seconds and the requote runs
+    synchronously once the replay moves past the window."""
+
+    def __init__(self, requote, debounce=1.0):
+        self.requote = requote
+        self.debounce = debounce
+        self.reasons = []
+        self.now = 0
+        self.due_time = None
+        self.requotes = 0
+
+    def request(self, reason: str, refresh_book=False):
+        # A refresh_book request is served by the next snapshot in the journal
+        if not self.reasons:
+            self.due_time = self.now + self.debounce
+        self.reasons.append(reason)
+
+    def advance(self, now: float):
+        self.now = now
+        if self.reasons and now >= self.due_time:
+            self.reasons = []
+            self.requotes += 1
+            self.requote()
+
+
+def replay(path: str, config: dict, speed=None) -> dict:
+    """
+    Push a journal through MarketMaker's handlers against a StubExchange. Without a speed records are replayed as fast
+    as possible, otherwise at speed times the recorded wall clock pace.
+    """
+    records = read_journal(path)
+    record_type, _, reference = next(records)
+    if record_type != RECORD_REFERENCE:
+        raise Exception(f"{path} does not start with a reference record")
+
+    market_maker = MarketMaker(dict(config, trade_pair=reference['pair']['pair'], journal_path=None))
+    market_maker.dexalot = StubExchange(reference)
+
+    def requote():
+        market_maker.apply_state()
+        market_maker.update_orders()
+
+    scheduler = market_maker.requote_scheduler = ReplayScheduler(requote, config['requote_debounce'])
+    decoder = EventStream(market_maker.dexalot.web3, market_maker.dexalot.trade_pairs_contract,
+                          ['OrderStatusChanged', 'Executed'])
+
+    counts = Counter()
+    first_timestamp = last_timestamp = None
+    start = time.monotonic()
+    for record_type, timestamp, record in records:
+        if first_timestamp is None:
+            first_timestamp = timestamp
+        last_timestamp = timestamp
+        if speed:
+            delay = (timestamp - first_timestamp) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        scheduler.advance(timestamp)
+
+        if record_type == RECORD_SNAPSHOT:
+            market_maker.apply_state(*record)
+            counts['snapshots'] += 1
+        elif record_type == RECORD_EVENT:
+            # Events before the first snapshot can not be applied to a book
+            if not market_maker.order_book.initialized:
+                counts['skipped_events'] += 1
+                continue
+            event = decoder.decode(record)
+            if event is not None:
+                market_maker.handle_event(event)
+                counts['events'] += 1
+        elif record_type == RECORD_ACTION:
+            counts['journal_actions'] += 1
+
+    elapsed = time.monotonic() - start
+    journal_span = (last_timestamp - first_timestamp) if first_timestamp is not None else 0
+    return {'journal_span': journal_span, 'elapsed': elapsed, 'speedup': journal_span / elapsed if elapsed else 0,
+            'events_per_sec': counts['events'] / elapsed if elapsed else 0, 'requotes': scheduler.requotes,
+            'replay_actions': len(market_maker.dexalot.actions), **counts}
+
+
+if __name__ == '__main__':
+    from config import init_config
+
+    parser = argparse.ArgumentParser(description="Replay a market maker journal against a stub exchange")
+    parser.add_argument('journal', help="Journal written with journal_path set")
+    parser.add_argument('--speed', type=float, default=None,
+                        help="Multiple of the recorded pace, e.g 60 replays an hour in a minute. As fast as possible if omitted")
+    args = parser.parse_args()
+
+    report = replay(args.journal, init_config(), args.speed)
+    logger.info(f"Replay of {args.journal} finished: {json.dumps(report, indent=2)}")
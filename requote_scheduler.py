@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger('dexalot_requote_scheduler')
+
+
+class RequoteScheduler:
+    """
+    Coalesces requote requests. The first request opens a window of debounce seconds, every request arriving within it
+    is merged and a single requote runs against the latest state when the window closes. Requests made while a requote
+    is running open a new window once it finishes, so at most one requote runs at a time and none is lost.
+    """
+
+    def __init__(self, requote, debounce=1.0):
+        self.requote = requote  # async callable taking refresh_book
+        self.debounce = debounce
+        self.reasons = []
+        self.refresh_book = False
+        self.first_request_timestamp = None
+        self.task = None
+
+    def request(self, reason: str, refresh_book=False):
+        if not self.reasons:
+            self.first_request_timestamp = time.monotonic()
+        self.reasons.append(reason)
+        self.refresh_book = self.refresh_book or refresh_book
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_event_loop().create_task(self._run())
+
+    async def _run(self):
+        while self.reasons:
+            await asyncio.sleep(self.debounce)
+            reasons, refresh_book = self.reasons, self.refresh_book
+            self.reasons, self.refresh_book = [], False
+            logger.info("Requoting for %d coalesced events: %s", len(reasons), reasons)
+            metrics.observe('requote_wait', time.monotonic() - self.first_request_timestamp)
+            try:
+                with metrics.timer('requote'):
+                    await self.requote(refresh_book)
+            except Exception as e:
+                logger.error(f"Could not update orders due to: {e}")
@@ -0,0 +1,280 @@
+import asyncio
+import itertools
+import multiprocessing
+import time
+
+from web3 import HTTPProvider, Web3
+from web3.middleware import geth_poa_middleware
+
+from checkpoint import checkpoint_path, read_checkpoint, resume_position, write_checkpoint
+from dexalot import Dexalot
+from event_stream import EventStream
+from logger import get_logger
+from market_maker import init_dexalot
+from metrics import start_metrics
+from multi_pair_runner import MultiPairRunner
+from tx_pipeline import PendingTransaction
+
+logger = get_logger('dexalot_sharded_runner')
+
+
+class CoordinatorClient:
+    """
+    Worker side of the transaction coordinator. Hands unsigned transactions over and returns a future of their hash
+    straight away, run() reads the answers off the event loop and resolves the futures by request id. Requests carry a
+    deadline after which the coordinator drops them and the future fails.
+    """
+
+    def __init__(self, shard_id: int, txn_requests, txn_results, timeout=30):
+        self.shard_id = shard_id
+        self.txn_requests = txn_requests
+        self.txn_results = txn_results
+        self.timeout = timeout
+        self.request_ids = itertools.count()
+        self.pending = {}  # request id -> future of the transaction hash
+
+    def send(self, txn: dict) -> asyncio.Future:
+        request_id = next(self.request_ids)
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.pending[request_id] = future
+        self.txn_requests.put((self.shard_id, request_id, time.time() + self.timeout, txn))
+        loop.call_later(self.timeout, self._expire, request_id)
+        return future
+
+    def _expire(self, request_id: int):
+        future = self.pending.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_exception(Exception(f"Coordinator did not answer transaction request {request_id}"))
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            request_id, txn_hash, error = await loop.run_in_executor(None, self.txn_results.get)
+            future = self.pending.pop(request_id, None)
+            # Answers to requests that timed out earlier are dropped
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(ValueError(error))
+            else:
+                future.set_result(txn_hash)
+
+
+class ShardDexalot(Dexalot):
+    """
+    Exchange handler of a shard worker. Transactions are built and ABI encoded in the worker, the nonce, signature
+    and submission are left to the coordinator which owns the signing key and nonce sequence. Sending never waits for
+    the coordinator: the hash of a transaction is a future until it answers.
+    """
+
+    coordinator = None
+
+    def _send_transaction(self, txn: dict, nonce=None):
+        return self.coordinator.send(txn)
+
+    def _process_transaction(self, txn_hash, description: str, on_receipt=None, contract_txn=None):
+        """txn_hash is the future of the coordinator's answer. The PendingTransaction is returned straight away, its
+        receipt is polled once the hash is known and it resolves as not mined if the coordinator could not send it."""
+        pending_txn = PendingTransaction(None, description, self._receipt_handler(description, on_receipt,
+                                                                                  contract_txn))
+
+        def handle_answer(hash_future):
+            if hash_future.exception() is not None:
+                logger.error(f"Could not send {description} due to: {hash_future.exception()}")
+                self.tx_pipeline.fail(pending_txn)
+            else:
+                pending_txn.txn_hash = hash_future.result()
+                self.tx_pipeline.track(pending_txn)
+
+        txn_hash.add_done_callback(handle_answer)
+        return pending_txn
+
+    def _record_receipt(self, txn_hash, txn_receipt, contract_txn=None):
+        # Nonce bookkeeping is done by the coordinator
+        if contract_txn is not None:
+            self.gas_oracle.record_receipt(contract_txn, txn_receipt)
+        if txn_receipt is not None:
+            self.observe_block(txn_receipt['blockNumber'])
+
+    def nonce_snapshot(self):
+        # The coordinator checkpoints the nonces it allocated, this worker's nonce manager is never used
+        return None
+
+    def restore_nonces(self, snapshot: dict):
+        pass
+
+
+class ShardWorker(MultiPairRunner):
+    """Market makers of one shard of pairs, fed with the raw logs of its pairs by the parent process. A None in the
+    event queue marks that the logs missed since the checkpoints were all fed."""
+
+    def __init__(self, config, event_queue, coordinator: CoordinatorClient):
+        super().__init__(config)
+        self.event_queue = event_queue
+        self.coordinator = coordinator
+
+    async def run(self, event_loop):
+        # The parent revalidated the reference cache before starting the workers
+        self.dexalot = init_dexalot(self.pair_config(self.config['trade_pairs'][0]), event_loop, ShardDexalot)
+        self.dexalot.coordinator = self.coordinator
+        event_loop.create_task(self.coordinator.run())
+        start_metrics(self.config, event_loop)
+        self.start_market_makers(event_loop)
+
+        # Only used to decode logs, the parent owns the subscription
+        decoder = EventStream(self.dexalot.web3, self.dexalot.trade_pairs_contract, ['OrderStatusChanged', 'Executed'])
+        while True:
+            log_entry = await event_loop.run_in_executor(None, self.event_queue.get)
+            if log_entry is None:
+                for market_maker in self.market_makers.values():
+                    market_maker.finish_replay()
+                continue
+            event = decoder.decode(log_entry)
+            if event is not None:
+                self.dispatch(event)
+
+
+def run_shard(shard_id: int, config: dict, event_queue, txn_requests, txn_results):
+    """Entry point of a worker process. The worker web3 has no signing key, it is only used for reads."""
+    web3 = Web3(HTTPProvider(config['rpc_url']))
+    web3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    # Workers dump their stage latencies to the log, only the parent serves them
+    config = dict(config, web3=web3, metrics_port=None)
+
+    event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(event_loop)
+    logger.info(f"Shard {shard_id} started for {config['trade_pairs']}")
+    worker = ShardWorker(config, event_queue, CoordinatorClient(shard_id, txn_requests, txn_results))
+    event_loop.run_until_complete(worker.run(event_loop))
+
+
+class ShardedRunner:
+    """
+    Spreads the pairs in config['trade_pairs'] round robin over config['n_shards'] worker processes so event handling
+    and quoting of many pairs is not bound to one core by the GIL. The parent process owns the log subscription and
+    fans the raw logs of each pair out to its shard over a multiprocessing queue, workers decode them lazily. The
+    parent is also the single transaction coordinator: it owns the signing key and nonce manager, workers send it
+    unsigned transactions and get the transaction hash back.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.dexalot = None
+        self.event_queues = {}  # pair_id -> event queue of the shard quoting the pair
+        self.txn_requests = None
+        self.txn_results = []
+        self.processes = []
+
+    def shards(self) -> list:
+        trade_pairs = self.config['trade_pairs']
+        n_shards = min(self.config['n_shards'], len(trade_pairs))
+        return [trade_pairs[shard_id::n_shards] for shard_id in range(n_shards)]
+
+    async def run(self, event_loop):
+        self.dexalot = init_dexalot(self.config, event_loop)
+        start_metrics(self.config, event_loop)
+        if self.dexalot.reference_data_from_cache:
+            # Workers start from the cache so it has to be current before they are spawned
+            self.dexalot.revalidate_reference_data()
+
+        context = multiprocessing.get_context('spawn')
+        self.txn_requests = context.Queue()
+        worker_config = {key: value for key, value in self.config.items() if key != 'web3'}
+        for shard_id, trade_pairs in enumerate(self.shards()):
+            event_queue = context.Queue()
+            txn_results = context.Queue()
+            process = context.Process(target=run_shard, daemon=True,
+                                      args=(shard_id, dict(worker_config, trade_pairs=trade_pairs), event_queue,
+                                            self.txn_requests, txn_results))
+            process.start()
+            self.processes.append(process)
+            self.txn_results.append(txn_results)
+            for trade_pair in trade_pairs:
+                self.event_queues[Web3.toBytes(text=trade_pair).ljust(32, b'\x00')] = event_queue
+            logger.info(f"Started shard {shard_id} (pid {process.pid}) for {trade_pairs}")
+
+        if self.config['checkpoint_path']:
+            self.restore_nonces()
+            event_loop.create_task(self.run_nonce_checkpoints())
+        event_loop.create_task(self.run_coordinator())
+        event_stream = EventStream(self.dexalot.web3, self.dexalot.trade_pairs_contract,
+                                   ['OrderStatusChanged', 'Executed'], ws_url=self.config['ws_url'],
+                                   poll_interval=self.config['event_poll_interval'], from_block=self.resume_block(),
+                                   indexed_filters={'pair': list(self.event_queues)})
+        event_loop.create_task(self.feed_caught_up(event_stream))
+        await self.run_event_feed(event_stream)
+
+    def nonce_checkpoint_path(self) -> str:
+        return checkpoint_path(self.config['checkpoint_path'], 'coordinator')
+
+    def restore_nonces(self):
+        """Restore the nonces the coordinator allocated before a restart, the pair checkpoints of the workers have none."""
+        path = self.nonce_checkpoint_path()
+        checkpoint = read_checkpoint(path)
+        if checkpoint is None:
+            return
+        if checkpoint['trader_address'] != self.dexalot.trade_address:
+            logger.warning(f"Ignoring nonce checkpoint {path} of {checkpoint['trader_address']}")
+            return
+        self.dexalot.restore_nonces(checkpoint['nonces'])
+        logger.info(f"Restored nonces from checkpoint {path}")
+
+    async def run_nonce_checkpoints(self):
+        path = self.nonce_checkpoint_path()
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.config['checkpoint_interval'])
+            checkpoint = {'trader_address': self.dexalot.trade_address, 'timestamp': time.time(),
+                          'nonces': self.dexalot.nonce_snapshot()}
+            try:
+                await loop.run_in_executor(None, write_checkpoint, path, checkpoint)
+            except Exception as e:
+                logger.error(f"Could not write nonce checkpoint due to: {e}")
+
+    async def feed_caught_up(self, event_stream: EventStream):
+        # Queued behind the replayed logs, so workers start quoting once they applied them
+        await event_stream.wait_caught_up()
+        for event_queue in set(self.event_queues.values()):
+            event_queue.put(None)
+
+    def resume_block(self):
+        """First block to feed from, the earliest resume block of the pair checkpoints the workers restore."""
+        if not self.config['checkpoint_path']:
+            return None
+        resume_blocks = []
+        for trade_pair in self.config['trade_pairs']:
+            checkpoint = read_checkpoint(checkpoint_path(self.config['checkpoint_path'], trade_pair))
+            position = resume_position(checkpoint, self.config['checkpoint_max_age']) if checkpoint else None
+            if position is not None:
+                resume_blocks.append(position[0])
+        return min(resume_blocks) if resume_blocks else None
+
+    async def run_event_feed(self, event_stream: EventStream):
+        async for event in event_stream:
+            pair_id = event.indexed('pair')
+            if pair_id is None:
+                pair_id = event.args.pair
+            event_queue = self.event_queues.get(pair_id)
+            if event_queue is not None:
+                event_queue.put(dict(event.log_entry))
+
+    async def run_coordinator(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            shard_id, request_id, deadline, txn = await loop.run_in_executor(None, self.txn_requests.get)
+            if time.time() > deadline:
+                # The worker stopped waiting for it, sending it now would only place a stale order
+                logger.warning(f"Dropping expired transaction request {request_id} of shard {shard_id}")
+                continue
+            try:
+                txn_hash = await loop.run_in_executor(None, self.dexalot._send_transaction, txn)
+            except Exception as e:
+                logger.error(f"Could not send transaction for shard {shard_id} due to: {e}")
+                self.txn_results[shard_id].put((request_id, None, str(e)))
+                continue
+            self.txn_results[shard_id].put((request_id, txn_hash, None))
+            # The coordinator tracks the receipt too so mined and dropped nonces are accounted for
+            self.dexalot.tx_pipeline.submit(
+                txn_hash, f"Shard {shard_id} transaction",
+                on_receipt=lambda pending_txn: self.dexalot._record_receipt(pending_txn.txn_hash, pending_txn.receipt))
@@ -0,0 +1,34 @@
+import json
+import time
+
+from checkpoint import CHECKPOINT_VERSION, checkpoint_path, read_checkpoint, resume_position, write_checkpoint
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = checkpoint_path(str(tmp_path / 'state' / 'checkpoint-{pair}.json'), 'AVAX/USDC')
+    write_checkpoint(path, {'pair': 'AVAX/USDC', 'nonces': {'in_flight': {'5': b'\x01' * 2}}})
+
+    checkpoint = read_checkpoint(path)
+    assert path.endswith('checkpoint-AVAX-USDC.json')
+    assert checkpoint['version'] == CHECKPOINT_VERSION
+    assert checkpoint['nonces']['in_flight']['5'] == '0x0101'
+    assert not (tmp_path / 'state' / 'checkpoint-AVAX-USDC.json.tmp').exists()
+
+
+def test_missing_unreadable_and_old_checkpoints_are_ignored(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    assert read_checkpoint(str(path)) is None
+
+    path.write_text('{"pair": "AVAX/US')
+    assert read_checkpoint(str(path)) is None
+
+    path.write_text(json.dumps({'version': CHECKPOINT_VERSION - 1}))
+    assert read_checkpoint(str(path)) is None
+
+
+def test_events_resume_after_the_last_processed_position():
+    checkpoint = {'timestamp': time.time(), 'processed_position': [120, 3]}
+
+    assert resume_position(checkpoint, 60) == (120, 3)
+    assert resume_position(dict(checkpoint, timestamp=time.time() - 120), 60) is None
+    assert resume_position(dict(checkpoint, processed_position=None), 60) is None
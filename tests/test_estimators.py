@@ -0,0 +1,49 @@
+from enums import OrderSide, OrderStatus
+from estimators import MarketEstimators, own_aggressor
+from order_registry import OrderRecord, OrderRegistry
+
+MAKER_ID = bytes(range(32))
+OTHER_ID = bytes(range(32, 64))
+
+
+def rest_registry() -> OrderRegistry:
+    # Our bid as bootstrapped from the REST open orders, with a 0x prefixed id
+    registry = OrderRegistry()
+    registry.reconcile([OrderRecord('0x' + MAKER_ID.hex(), OrderSide.BUY, 100, 50)])
+    return registry
+
+
+def test_own_maker_order_from_rest_gives_aggressor():
+    registry = rest_registry()
+    maker_order = registry.get(MAKER_ID)
+    taker_order = registry.get(OTHER_ID)
+
+    assert maker_order is not None
+    assert own_aggressor(maker_order, taker_order) == OrderSide.SELL
+
+
+def test_own_taker_order_gives_aggressor():
+    registry = OrderRegistry()
+    registry.apply_status(OTHER_ID, OrderSide.BUY, OrderStatus.NEW, 100, 50, 0)
+
+    assert own_aggressor(None, registry.get(OTHER_ID)) == OrderSide.BUY
+    assert own_aggressor(None, None) is None
+
+
+def test_own_aggressor_overrides_book_classification():
+    # A trade at the bid would be classified as sold, but our ask was the maker so it was bought
+    estimators = MarketEstimators(volatility_half_life=10, trade_flow_window=4)
+    ask = OrderRecord('0x' + MAKER_ID.hex(), OrderSide.SELL, 100, 50)
+    estimators.update(100, 5, own_aggressor(ask, None), best_bid=100, best_ask=101)
+
+    assert estimators.last_aggressor == OrderSide.BUY
+    assert estimators.trade_flow.imbalance() == 1.0
+
+
+def test_trade_flow_window_is_fixed_size():
+    estimators = MarketEstimators(volatility_half_life=10, trade_flow_window=2)
+    for aggressor in (OrderSide.BUY, OrderSide.SELL, OrderSide.SELL):
+        estimators.update(100, 5, aggressor)
+
+    assert len(estimators.trade_flow.volume) == 2
+    assert estimators.trade_flow.imbalance() == -1.0
@@ -0,0 +1,76 @@
+import pytest
+
+# web3 is needed by the event stream, it does not import on every interpreter it is tested on
+pytest.importorskip('web3', exc_type=ImportError)
+
+from eth_abi import encode_abi  # noqa: E402
+from eth_utils import event_abi_to_log_topic  # noqa: E402
+from web3 import Web3  # noqa: E402
+
+from event_stream import EventStream  # noqa: E402
+
+CONTRACT_ADDRESS = Web3.toChecksumAddress('0x' + '44' * 20)
+TRADER_ADDRESS = '0x' + '55' * 20
+PAIR_ID = b'AVAX/USDC'.ljust(32, b'\x00')
+OTHER_PAIR_ID = b'ALOT/USDC'.ljust(32, b'\x00')
+
+# The indexed arguments of the TradePairs events, pair is at a different topic position in each
+TRADE_PAIRS_ABI = [
+    {'type': 'event', 'name': 'OrderStatusChanged', 'anonymous': False, 'inputs': [
+        {'name': 'traderaddress', 'type': 'address', 'indexed': True},
+        {'name': 'pair', 'type': 'bytes32', 'indexed': True},
+        {'name': 'id', 'type': 'bytes32', 'indexed': False},
+        {'name': 'price', 'type': 'uint256', 'indexed': False}]},
+    {'type': 'event', 'name': 'Executed', 'anonymous': False, 'inputs': [
+        {'name': 'pair', 'type': 'bytes32', 'indexed': True},
+        {'name': 'price', 'type': 'uint256', 'indexed': False},
+        {'name': 'quantity', 'type': 'uint256', 'indexed': False}]},
+]
+
+
+def event_stream() -> EventStream:
+    web3 = Web3()
+    contract = web3.eth.contract(address=CONTRACT_ADDRESS, abi=TRADE_PAIRS_ABI)
+    return EventStream(web3, contract, ['OrderStatusChanged', 'Executed'], indexed_filters={'pair': [PAIR_ID]})
+
+
+def log_entry(event_name: str, indexed_topics: list, data: bytes) -> dict:
+    event_abi = next(abi for abi in TRADE_PAIRS_ABI if abi['name'] == event_name)
+    return {'address': CONTRACT_ADDRESS, 'blockNumber': 10, 'logIndex': 0, 'transactionIndex': 0,
+            'transactionHash': b'\x01' * 32, 'blockHash': b'\x02' * 32, 'removed': False,
+            'topics': [event_abi_to_log_topic(event_abi)] + indexed_topics, 'data': Web3.toHex(data)}
+
+
+def order_status_changed(pair_id: bytes) -> dict:
+    return log_entry('OrderStatusChanged', [bytes(12) + bytes.fromhex(TRADER_ADDRESS[2:]), pair_id],
+                     encode_abi(['bytes32', 'uint256'], [b'\x03' * 32, 1500]))
+
+
+def executed(pair_id: bytes) -> dict:
+    return log_entry('Executed', [pair_id], encode_abi(['uint256', 'uint256'], [1500, 20]))
+
+
+def test_node_filters_by_signature_only_when_the_pair_positions_differ():
+    topics = event_stream().log_filter()['topics']
+
+    assert len(topics) == 1
+    assert len(topics[0]) == 2
+
+
+def test_pair_is_filtered_at_its_position_in_each_event():
+    stream = event_stream()
+
+    assert stream.decode(order_status_changed(OTHER_PAIR_ID)) is None
+    assert stream.decode(executed(OTHER_PAIR_ID)) is None
+    status_event = stream.decode(order_status_changed(PAIR_ID))
+    executed_event = stream.decode(executed(PAIR_ID))
+    assert (status_event.event, executed_event.event) == ('OrderStatusChanged', 'Executed')
+    assert status_event.indexed('pair') == executed_event.indexed('pair') == PAIR_ID
+
+
+def test_event_data_is_decoded_on_access():
+    event = event_stream().decode(executed(PAIR_ID))
+
+    assert event._decoded is None
+    assert (event.args.price, event.args.quantity) == (1500, 20)
+    assert event.args.pair == PAIR_ID
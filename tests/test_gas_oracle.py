@@ -0,0 +1,81 @@
+import pytest
+
+# web3 is needed by the gas oracle, it does not import on every interpreter it is tested on
+pytest.importorskip('web3', exc_type=ImportError)
+
+from gas_oracle import GasOracle  # noqa: E402
+
+CONTRACT_ADDRESS = '0x' + '33' * 20
+
+
+class FakeContractFunction:
+    """The parts of a web3 ContractFunction the gas oracle reads."""
+
+    def __init__(self, fn_name: str, *args, gas_estimate=100000):
+        self.address = CONTRACT_ADDRESS
+        self.fn_name = fn_name
+        self.args = args
+        self.gas_estimate = gas_estimate
+        self.estimates = 0
+
+    def estimateGas(self, transaction=None):
+        self.estimates += 1
+        return self.gas_estimate
+
+
+def gas_oracle() -> GasOracle:
+    oracle = GasOracle(web3=None, gas_limit_headroom=1.5)
+    oracle.gas_price = 10
+    oracle.gas_price_timestamp = float('inf')
+    return oracle
+
+
+def test_gas_limit_is_learned_from_receipts():
+    oracle = gas_oracle()
+    cancel = FakeContractFunction('cancelOrder', b'\x01' * 32)
+
+    assert oracle.get_gas_limit(cancel) == 150000
+    oracle.record_receipt(cancel, {'status': 1, 'gasUsed': 120000})
+    assert oracle.get_gas_limit(cancel) == 180000
+    assert cancel.estimates == 1
+
+
+def test_gas_usage_is_kept_per_batch_size():
+    oracle = gas_oracle()
+    oracle.record_receipt(FakeContractFunction('cancelAllOrders', ['0x01'] * 2), {'status': 1, 'gasUsed': 40000})
+
+    large_batch = FakeContractFunction('cancelAllOrders', ['0x01'] * 20, gas_estimate=300000)
+    assert oracle.get_gas_limit(large_batch) == 450000
+    assert large_batch.estimates == 1
+
+
+def test_out_of_gas_drops_what_was_learned():
+    oracle = gas_oracle()
+    add_order = FakeContractFunction('addOrder', b'\x01' * 32, 1, 1)
+    gas_limit = oracle.get_gas_limit(add_order)
+
+    oracle.record_receipt(add_order, {'status': 0, 'gasUsed': gas_limit})
+    assert oracle.cached_cost(CONTRACT_ADDRESS, 'addOrder') is None
+    oracle.get_gas_limit(add_order)
+    assert add_order.estimates == 2
+
+
+def test_revert_with_gas_left_keeps_what_was_learned():
+    oracle = gas_oracle()
+    add_order = FakeContractFunction('addOrder', b'\x01' * 32, 1, 1)
+    oracle.get_gas_limit(add_order)
+
+    oracle.record_receipt(add_order, {'status': 0, 'gasUsed': 30000})
+    assert oracle.cached_cost(CONTRACT_ADDRESS, 'addOrder') == 100000 * 10
+
+
+def test_cached_cost_scales_from_the_closest_batch_size():
+    oracle = gas_oracle()
+    assert oracle.cached_cost(CONTRACT_ADDRESS, 'cancelAllOrders', 4) is None
+
+    oracle.record_receipt(FakeContractFunction('cancelAllOrders', ['0x01'] * 2), {'status': 1, 'gasUsed': 40000})
+    oracle.record_receipt(FakeContractFunction('cancelAllOrders', ['0x01'] * 10), {'status': 1, 'gasUsed': 150000})
+
+    assert oracle.cached_cost(CONTRACT_ADDRESS, 'cancelAllOrders', 2) == 40000 * 10
+    assert oracle.cached_cost(CONTRACT_ADDRESS, 'cancelAllOrders', 4) == 80000 * 10
+    assert oracle.cached_cost(CONTRACT_ADDRESS, 'cancelAllOrders', 8) == 120000 * 10
@@ -0,0 +1,21 @@
+from journal import RECORD_ACTION, RECORD_EVENT, RECORD_REFERENCE, JournalWriter, read_journal
+
+ADDRESS = '0x' + '22' * 20
+
+
+def test_records_are_readable_before_the_writer_is_closed(tmp_path):
+    # A crashed market maker never closes its journal, everything up to the crash must already be on disk
+    path = str(tmp_path / 'journal.bin')
+    writer = JournalWriter(path)
+    writer.record_reference({'pair': 'AVAX/USDC'}, ADDRESS, [], ADDRESS)
+    writer.record_event({'blockNumber': 7, 'logIndex': 2, 'transactionIndex': 1, 'transactionHash': b'\x01' * 32,
+                         'blockHash': b'\x02' * 32, 'topics': [b'\x03' * 32], 'data': '0x' + '04' * 32})
+    writer.record_action({'action': 'cancel', 'ids': ['0x' + '05' * 32]})
+
+    records = list(read_journal(path))
+    assert [record_type for record_type, _, _ in records] == [RECORD_REFERENCE, RECORD_EVENT, RECORD_ACTION]
+    event = records[1][2]
+    assert (event['blockNumber'], event['logIndex']) == (7, 2)
+    assert bytes(event['topics'][0]) == b'\x03' * 32
+    assert records[2][2]['action'] == 'cancel'
+    writer.close()
@@ -0,0 +1,27 @@
+from enums import OrderSide
+from ladder import build_ladder
+
+
+def prices_and_amounts(quotes, order_side: OrderSide) -> list:
+    return [(quote.price, quote.amount) for quote in quotes if quote.side == order_side]
+
+
+def test_levels_step_away_from_the_mid_with_growing_size():
+    quotes = build_ladder(1000, 1010, 100, 50, 3, 5, 1.5, 0, 10 ** 9)
+
+    assert prices_and_amounts(quotes, OrderSide.BUY) == [(1000, 100), (995, 150), (990, 225)]
+    assert prices_and_amounts(quotes, OrderSide.SELL) == [(1010, 50), (1015, 75), (1020, 112)]
+
+
+def test_levels_out_of_notional_bounds_are_dropped():
+    # Bid notionals 100000, 148500, 220500 and ask notionals 101000, 153000, 231750
+    quotes = build_ladder(1000, 1010, 100, 100, 3, 10, 1.5, 100500, 200000)
+
+    assert prices_and_amounts(quotes, OrderSide.BUY) == [(990, 150)]
+    assert prices_and_amounts(quotes, OrderSide.SELL) == [(1010, 100), (1020, 150)]
+
+
+def test_levels_at_non_positive_prices_are_dropped():
+    quotes = build_ladder(10, 20, 1, 1, 4, 5, 1, 0, 10 ** 9)
+
+    assert [quote.price for quote in quotes if quote.side == OrderSide.BUY] == [10, 5]
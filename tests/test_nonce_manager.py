@@ -0,0 +1,101 @@
+import pytest
+
+# web3 is needed by the nonce manager, it does not import on every interpreter it is tested on
+pytest.importorskip('web3', exc_type=ImportError)
+
+from web3.exceptions import TransactionNotFound  # noqa: E402
+
+from nonce_manager import NonceManager  # noqa: E402
+
+ADDRESS = '0x' + '11' * 20
+
+
+class FakeEth:
+    """Transaction counts and the transactions known to a node."""
+
+    def __init__(self, latest_count=0, pending_count=0):
+        self.latest_count = latest_count
+        self.pending_count = pending_count
+        self.known_transactions = set()
+
+    def get_transaction_count(self, address, block_identifier):
+        return self.latest_count if block_identifier == 'latest' else self.pending_count
+
+    def get_transaction(self, txn_hash):
+        if txn_hash not in self.known_transactions:
+            raise TransactionNotFound(txn_hash)
+        return {'hash': txn_hash}
+
+
+class FakeWeb3:
+    def __init__(self, eth: FakeEth):
+        self.eth = eth
+
+
+def nonce_manager(latest_count=5, pending_count=5) -> NonceManager:
+    return NonceManager(FakeWeb3(FakeEth(latest_count, pending_count)), ADDRESS)
+
+
+def send(manager: NonceManager, txn_hash: bytes) -> int:
+    nonce = manager.allocate()
+    manager.mark_sent(nonce, txn_hash, {'gasPrice': 100})
+    return nonce
+
+
+def test_release_hands_the_last_nonce_out_again():
+    manager = nonce_manager()
+    nonce = manager.allocate()
+    manager.release(nonce)
+
+    assert manager.allocate() == nonce
+
+
+def test_release_of_an_earlier_nonce_records_a_gap():
+    manager = nonce_manager()
+    first = manager.allocate()
+    manager.allocate()
+    manager.release(first)
+
+    assert manager.allocate() == first
+    assert manager.allocate() == first + 2
+
+
+def test_in_flight_nonce_is_never_released():
+    # A failed replacement of pending nonce 5 must not hand 5 out to the next order
+    manager = nonce_manager()
+    nonce = send(manager, b'\x01' * 32)
+    manager.release(nonce)
+
+    assert manager.allocate() == nonce + 1
+    assert not manager.gaps
+
+
+def test_slow_transaction_is_not_dropped():
+    manager = nonce_manager()
+    txn_hash = b'\x01' * 32
+    nonce = send(manager, txn_hash)
+    manager.web3.eth.known_transactions.add(txn_hash)
+
+    assert not manager.mark_dropped(txn_hash)
+    assert nonce in manager.in_flight
+    assert manager.allocate() == nonce + 1
+
+
+def test_dropped_transaction_leaves_a_gap_behind_later_ones():
+    manager = nonce_manager()
+    dropped_hash = b'\x01' * 32
+    nonce = send(manager, dropped_hash)
+    send(manager, b'\x02' * 32)
+
+    assert manager.mark_dropped(dropped_hash)
+    assert manager.fill_gaps() == [nonce]
+
+
+def test_unfilled_gaps_are_kept():
+    manager = nonce_manager()
+    manager.add_gaps([7, 9])
+
+    assert manager.fill_gaps() == [7, 9]
+    assert manager.fill_gaps() == []
+    manager.add_gaps([9])
+    assert manager.fill_gaps() == [9]
@@ -0,0 +1,63 @@
+from enums import OrderSide
+from order_diff import OrderPlan, Quote, reconcile, to_tolerance, within_tolerance
+from order_registry import OrderRecord
+
+PRICE_TOLERANCE = to_tolerance('0.001')
+AMOUNT_TOLERANCE = to_tolerance('0.05')
+
+
+def order(i: int, side: OrderSide, price: int, quantity: int, quantity_filled=0) -> OrderRecord:
+    return OrderRecord(f"0x{i:064x}", side, price, quantity, quantity_filled)
+
+
+def test_orders_within_tolerance_are_kept():
+    live_orders = [order(1, OrderSide.BUY, 10000, 100), order(2, OrderSide.SELL, 10100, 100)]
+    # 5 ticks (0.05%) and 3 lots (3%) away
+    desired_quotes = [Quote(OrderSide.BUY, 10005, 103), Quote(OrderSide.SELL, 10100, 100)]
+
+    plan = reconcile(live_orders, desired_quotes, PRICE_TOLERANCE, AMOUNT_TOLERANCE)
+    assert plan.keep == live_orders
+    assert not plan
+
+
+def test_orders_outside_tolerance_are_replaced():
+    live_orders = [order(1, OrderSide.BUY, 10000, 100), order(2, OrderSide.SELL, 10100, 100)]
+    desired_quotes = [Quote(OrderSide.BUY, 10020, 100), Quote(OrderSide.SELL, 10100, 110)]
+
+    plan = reconcile(live_orders, desired_quotes, PRICE_TOLERANCE, AMOUNT_TOLERANCE)
+    assert not plan.keep
+    assert plan.cancel == live_orders
+    assert plan.add == desired_quotes
+
+
+def test_a_quote_is_matched_by_one_order_only():
+    # Two identical orders for one quote, the second one is surplus
+    live_orders = [order(1, OrderSide.BUY, 10000, 100), order(2, OrderSide.BUY, 10000, 100)]
+    desired_quotes = [Quote(OrderSide.BUY, 10000, 100), Quote(OrderSide.SELL, 10100, 100)]
+
+    plan = reconcile(live_orders, desired_quotes, PRICE_TOLERANCE, AMOUNT_TOLERANCE)
+    assert plan.keep == live_orders[:1]
+    assert plan.cancel == live_orders[1:]
+    assert plan.add == desired_quotes[1:]
+
+
+def test_partially_filled_orders_are_matched_on_their_remaining_amount():
+    live_orders = [order(1, OrderSide.SELL, 10100, 200, 100)]
+    desired_quotes = [Quote(OrderSide.SELL, 10100, 200)]
+
+    plan = reconcile(live_orders, desired_quotes, PRICE_TOLERANCE, AMOUNT_TOLERANCE)
+    assert plan.cancel == live_orders
+    assert plan.add == desired_quotes
+
+
+def test_within_tolerance_is_relative_to_the_order_value():
+    assert within_tolerance(1049, 1000, AMOUNT_TOLERANCE)
+    assert not within_tolerance(1050, 1000, AMOUNT_TOLERANCE)
+
+
+def test_cancels_are_batched_for_cancel_all_orders():
+    plan = OrderPlan()
+    plan.cancel.extend(order(i, OrderSide.BUY, 10000, 1) for i in range(45))
+
+    assert [len(batch) for batch in plan.cancel_batches()] == [20, 20, 5]
+    assert plan.cancel_batches()[2][-1] == f"0x{44:064x}"
@@ -0,0 +1,78 @@
+import time
+
+from enums import OrderSide, OrderStatus
+from order_registry import OrderRecord, OrderRegistry, to_order_id
+
+ORDER_ID = bytes(range(32))
+REST_ORDER_ID = '0x' + ORDER_ID.hex().upper()
+
+
+def bootstrap_registry() -> OrderRegistry:
+    registry = OrderRegistry(grace_period=0)
+    registry.reconcile([OrderRecord(REST_ORDER_ID, OrderSide.BUY, 100, 50),
+                        OrderRecord('0x' + 'ff' * 32, OrderSide.SELL, 110, 50)])
+    return registry
+
+
+def test_to_order_id_is_canonical():
+    assert to_order_id(ORDER_ID) == '0x' + ORDER_ID.hex()
+    assert to_order_id(bytearray(ORDER_ID)) == to_order_id(ORDER_ID)
+    assert to_order_id(REST_ORDER_ID) == to_order_id(ORDER_ID)
+    assert to_order_id(ORDER_ID.hex()) == to_order_id(ORDER_ID)
+
+
+def test_event_bytes_id_updates_rest_order():
+    registry = bootstrap_registry()
+    order = registry.apply_status(ORDER_ID, OrderSide.BUY, OrderStatus.PARTIAL, 100, 50, 20)
+
+    assert len(registry) == 2
+    assert order is registry.get(REST_ORDER_ID)
+    assert registry.get(ORDER_ID).remaining == 30
+
+
+def test_event_bytes_id_closes_rest_order():
+    registry = bootstrap_registry()
+    assert registry.apply_status(ORDER_ID, OrderSide.BUY, OrderStatus.FILLED, 100, 50, 50) is None
+
+    assert len(registry) == 1
+    assert registry.get(REST_ORDER_ID) is None
+    assert registry.at_price(OrderSide.BUY, 100) == []
+
+
+def test_rest_id_after_event_is_not_duplicated():
+    registry = OrderRegistry(grace_period=10)
+    registry.apply_status(ORDER_ID, OrderSide.BUY, OrderStatus.NEW, 100, 50, 0)
+    registry.reconcile([OrderRecord(REST_ORDER_ID, OrderSide.BUY, 100, 50)])
+
+    assert len(registry) == 1
+    assert [order.id for order in registry] == [to_order_id(ORDER_ID)]
+
+
+def test_closed_event_id_is_not_revived_by_rest():
+    registry = OrderRegistry(grace_period=10)
+    registry.apply_status(ORDER_ID, OrderSide.BUY, OrderStatus.NEW, 100, 50, 0)
+    registry.apply_status(ORDER_ID, OrderSide.BUY, OrderStatus.CANCELLED, 100, 50, 0)
+    registry.reconcile([OrderRecord(REST_ORDER_ID, OrderSide.BUY, 100, 50)])
+
+    assert len(registry) == 0
+
+
+def test_restored_orders_keep_their_update_time():
+    registry = OrderRegistry(grace_period=10)
+    registry.restore([[REST_ORDER_ID, OrderSide.BUY.value, 100, 50, 0, OrderStatus.NEW.value, time.time() - 60],
+                      ['0x' + 'ff' * 32, OrderSide.SELL.value, 110, 50, 0, OrderStatus.NEW.value, time.time()]])
+
+    # Cancelled while down: the REST view wins over the stale restored order, not over the recent one
+    registry.reconcile([])
+    assert registry.get(ORDER_ID) is None
+    assert registry.get('0x' + 'ff' * 32) is not None
+
+
+def test_snapshot_round_trip():
+    registry = bootstrap_registry()
+    restored = OrderRegistry()
+    restored.restore(registry.snapshot())
+
+    assert [order.id for order in restored] == [order.id for order in registry]
+    for order in restored:
+        assert abs(order.updated_timestamp - registry.get(order.id).updated_timestamp) < 1
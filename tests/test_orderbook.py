@@ -0,0 +1,75 @@
+from enums import OrderSide, OrderStatus
+from orderbook import BookLevels, OrderBook
+
+MAKER_ID = '0x' + '01' * 32
+TAKER_ID = '0x' + '02' * 32
+
+
+def book_levels(*levels) -> BookLevels:
+    book = BookLevels()
+    for price, quantity in levels:
+        book.append(price, quantity)
+    return book
+
+
+def snapshot_book() -> OrderBook:
+    order_book = OrderBook()
+    order_book.load_snapshot(book_levels((99, 10), (98, 20)), book_levels((101, 5), (102, 30)))
+    return order_book
+
+
+def test_partial_taker_that_rests_becomes_the_best_bid():
+    # A buy of 8 at 102 takes the 5 resting at 101 and rests its remaining 3 at 102
+    order_book = snapshot_book()
+    order_book.apply_execution(MAKER_ID, TAKER_ID, 5)
+    order_book.apply_order_status(MAKER_ID, OrderSide.SELL, OrderStatus.FILLED, 101, 5, 5)
+    order_book.apply_order_status(TAKER_ID, OrderSide.BUY, OrderStatus.PARTIAL, 102, 8, 5)
+
+    assert order_book.best_bid() == (102, 3)
+    assert order_book.best_ask() == (102, 30)
+    assert not order_book.takers and not order_book.executions
+
+
+def test_unknown_filled_maker_removes_only_its_remaining_quantity():
+    # The maker resting before the snapshot was 10 with 6 filled already, only its last 4 are on the book
+    order_book = OrderBook()
+    order_book.load_snapshot(book_levels((99, 4 + 7)), book_levels())
+    order_book.apply_execution(MAKER_ID, TAKER_ID, 4)
+    order_book.apply_order_status(MAKER_ID, OrderSide.BUY, OrderStatus.FILLED, 99, 10, 10)
+    order_book.apply_order_status(TAKER_ID, OrderSide.SELL, OrderStatus.FILLED, 99, 4, 4)
+
+    assert order_book.best_bid() == (99, 7)
+    assert order_book.best_ask() == (0, 0)
+
+
+def test_unknown_partial_maker_removes_the_executed_quantity():
+    order_book = snapshot_book()
+    order_book.apply_execution(MAKER_ID, TAKER_ID, 2)
+    order_book.apply_order_status(MAKER_ID, OrderSide.SELL, OrderStatus.PARTIAL, 101, 9, 6)
+
+    assert order_book.best_ask() == (101, 3)
+    # Later fills of the same order are applied from what was tracked
+    order_book.apply_order_status(MAKER_ID, OrderSide.SELL, OrderStatus.FILLED, 101, 9, 9)
+    assert order_book.best_ask() == (102, 30)
+
+
+def test_orders_seen_after_the_snapshot_are_exact():
+    order_book = snapshot_book()
+    order_book.apply_order_status(MAKER_ID, OrderSide.BUY, OrderStatus.NEW, 100, 6, 0)
+    assert order_book.best_bid() == (100, 6)
+
+    order_book.apply_order_status(MAKER_ID, OrderSide.BUY, OrderStatus.PARTIAL, 100, 6, 4)
+    assert order_book.best_bid() == (100, 2)
+
+    order_book.apply_order_status(MAKER_ID, OrderSide.BUY, OrderStatus.CANCELLED, 100, 6, 4)
+    assert order_book.best_bid() == (99, 10)
+    assert MAKER_ID not in order_book.orders
+
+
+def test_drift_counts_levels_that_differ_from_the_snapshot():
+    order_book = snapshot_book()
+    order_book.apply_order_status(MAKER_ID, OrderSide.BUY, OrderStatus.NEW, 100, 1, 0)
+
+    # Snapshots are depth limited, the local book is compared over the snapshot's levels only
+    assert order_book.drift(book_levels((99, 10), (98, 20)), book_levels((101, 5), (102, 30))) == 2
+    assert not order_book.is_crossed()
@@ -0,0 +1,67 @@
+from enums import OrderSide
+from order_diff import OrderPlan, Quote
+from order_registry import OrderRecord
+from quote_gate import QuoteGate
+
+
+def replace_plan(n_cancels):
+    # Far orders worth next to nothing replaced by one quote next to the mid gaining ~90
+    plan = OrderPlan()
+    plan.cancel.extend(OrderRecord(f"0x{i:064x}", OrderSide.BUY, 10, 1) for i in range(n_cancels))
+    plan.add.append(Quote(OrderSide.BUY, 99, 100))
+    return plan
+
+
+def test_cancels_are_costed_as_one_batch():
+    cancel_transactions = []
+
+    def cancel_cost(n_orders):
+        cancel_transactions.append(n_orders)
+        return 30
+
+    # One cancelAllOrders of 5 ids costs 30 where five cancelOrder calls would cost 150
+    gated = QuoteGate(0, 1).apply(replace_plan(5), 100, 10, 0, cancel_cost)
+    assert cancel_transactions == [5]
+    assert len(gated.cancel) == 5 and len(gated.add) == 1
+
+
+def test_cancels_over_the_batch_limit_pay_for_every_batch():
+    cancel_transactions = []
+
+    def cancel_cost(n_orders):
+        cancel_transactions.append(n_orders)
+        return 50
+
+    gated = QuoteGate(0, 1).apply(replace_plan(25), 100, 10, 0, cancel_cost)
+    assert cancel_transactions == [20, 5]
+    assert not gated.cancel and not gated.add
+    assert len(gated.keep) == 25
+
+
+def test_pure_cancels_are_never_deferred():
+    # Shrinking the ladder pulls valuable quotes next to the mid, the gain is negative even at no cost
+    plan = OrderPlan()
+    plan.cancel.extend(OrderRecord(f"0x{i:064x}", OrderSide.BUY, 99, 100) for i in range(2))
+
+    gated = QuoteGate(0, 1).apply(plan, 100, 10, 0, lambda n_orders: 0)
+    assert len(gated.cancel) == 2
+    assert not gated.keep
+
+
+def test_cancel_cost_follows_the_sides_that_go_ahead():
+    cancel_transactions = []
+
+    def cancel_cost(n_orders):
+        cancel_transactions.append(n_orders)
+        return 40 if n_orders > 1 else 100
+
+    plan = replace_plan(1)
+    # The sell side would give up a quote next to the mid for a far one, so it is deferred
+    plan.cancel.append(OrderRecord('0x' + 'ff' * 32, OrderSide.SELL, 101, 100))
+    plan.add.append(Quote(OrderSide.SELL, 190, 1))
+
+    # Sharing one cancelAllOrders the buy side pays 20, alone it pays a cancelOrder of 100 for a gain of ~90
+    gated = QuoteGate(0, 1).apply(plan, 100, 10, 0, cancel_cost)
+    assert cancel_transactions == [2, 1]
+    assert not gated.cancel and not gated.add
+    assert len(gated.keep) == 2
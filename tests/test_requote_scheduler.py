@@ -0,0 +1,59 @@
+import asyncio
+
+from requote_scheduler import RequoteScheduler
+
+
+def test_requests_within_the_window_are_coalesced():
+    requotes = []
+
+    async def requote(refresh_book):
+        requotes.append(refresh_book)
+
+    async def run():
+        scheduler = RequoteScheduler(requote, debounce=0.01)
+        scheduler.request('new best bid')
+        scheduler.request('crossed local book', refresh_book=True)
+        scheduler.request('filled')
+        await scheduler.task
+
+    asyncio.run(run())
+    assert requotes == [True]
+
+
+def test_requests_during_a_requote_run_once_it_finishes():
+    requotes = []
+
+    async def run():
+        scheduler = RequoteScheduler(None, debounce=0.01)
+
+        async def requote(refresh_book):
+            requotes.append(refresh_book)
+            if len(requotes) == 1:
+                scheduler.request('filled while requoting')
+                await asyncio.sleep(0.02)
+
+        scheduler.requote = requote
+        scheduler.request('new best ask')
+        await scheduler.task
+
+    asyncio.run(run())
+    assert requotes == [False, False]
+
+
+def test_a_failed_requote_does_not_stop_later_ones():
+    requotes = []
+
+    async def requote(refresh_book):
+        requotes.append(refresh_book)
+        if len(requotes) == 1:
+            raise ValueError('nonce too low')
+
+    async def run():
+        scheduler = RequoteScheduler(requote, debounce=0.01)
+        scheduler.request('first')
+        await scheduler.task
+        scheduler.request('second', refresh_book=True)
+        await scheduler.task
+
+    asyncio.run(run())
+    assert requotes == [False, True]
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+# web3 is needed by the transaction pipeline, it does not import on every interpreter it is tested on
+pytest.importorskip('web3', exc_type=ImportError)
+
+from web3.exceptions import TransactionNotFound  # noqa: E402
+
+from tx_pipeline import TransactionPipeline  # noqa: E402
+
+
+class FakeEth:
+    def __init__(self):
+        self.receipts = {}
+
+    def get_transaction_receipt(self, txn_hash):
+        if txn_hash not in self.receipts:
+            raise TransactionNotFound(txn_hash)
+        return self.receipts[txn_hash]
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+def test_receipts_resolve_in_the_background():
+    web3 = FakeWeb3()
+    callbacks = []
+
+    async def run():
+        pipeline = TransactionPipeline(web3, poll_interval=0.01)
+        task = asyncio.get_event_loop().create_task(pipeline.run())
+        pending_txn = pipeline.submit(b'\x01' * 32, 'addOrder', callbacks.append)
+        await asyncio.sleep(0.03)
+        assert not pending_txn.future.done()
+
+        web3.eth.receipts[b'\x01' * 32] = {'status': 1, 'gasUsed': 100000}
+        receipt = await asyncio.wait_for(pending_txn.future, 1)
+        task.cancel()
+        return pipeline, pending_txn, receipt
+
+    pipeline, pending_txn, receipt = asyncio.run(run())
+    assert receipt['status'] == 1 and pending_txn.succeeded
+    assert callbacks == [pending_txn]
+    assert not pipeline.pending
+
+
+def test_transactions_not_mined_in_time_resolve_to_none():
+    callbacks = []
+
+    async def run():
+        pipeline = TransactionPipeline(FakeWeb3(), poll_interval=0.01, receipt_timeout=0.02)
+        task = asyncio.get_event_loop().create_task(pipeline.run())
+        pending_txn = pipeline.submit(b'\x02' * 32, 'cancelOrder', callbacks.append)
+        receipt = await asyncio.wait_for(pending_txn.future, 1)
+        task.cancel()
+        return pending_txn, receipt
+
+    pending_txn, receipt = asyncio.run(run())
+    assert receipt is None and not pending_txn.succeeded
+    assert callbacks == [pending_txn]
+
+
+def test_failed_callback_still_resolves_the_future():
+    def on_receipt(pending_txn):
+        raise KeyError(pending_txn.txn_hash)
+
+    async def run():
+        pipeline = TransactionPipeline(FakeWeb3())
+        pending_txn = pipeline.submit(None, 'addOrder', on_receipt)
+        pipeline.fail(pending_txn)
+        return await asyncio.wait_for(pending_txn.future, 1)
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger('dexalot_tx_pipeline')
+
+
+class PendingTransaction:
+
+    def __init__(self, txn_hash, description: str, on_receipt=None):
+        self.txn_hash = txn_hash
+        self.description = description
+        self.on_receipt = on_receipt
+        self.submitted_timestamp = time.monotonic()
+        self.receipt = None
+        self.future = asyncio.get_event_loop().create_future()
+
+    @property
+    def succeeded(self) -> bool:
+        return self.receipt is not None and self.receipt['status'] == 1
+
+    def __repr__(self):
+        txn_hash = Web3.toHex(self.txn_hash) if self.txn_hash is not None else 'not sent'
+        return f"PendingTransaction({self.description}, {txn_hash})"
+
+
+class TransactionPipeline:
+    """
+    Tracks submitted transactions and resolves their receipts in the background so callers never block the event
+    loop on wait_for_transaction_receipt. submit() returns a PendingTransaction straight away whose future resolves to
+    the receipt (or None if it was not mined within receipt_timeout) and whose on_receipt callback is invoked once.
+    """
+
+    def __init__(self, web3: Web3, poll_interval=0.5, receipt_timeout=60):
+        self.web3 = web3
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.pending = {}
+
+    def submit(self, txn_hash, description: str, on_receipt=None) -> PendingTransaction:
+        pending_txn = PendingTransaction(txn_hash, description, on_receipt)
+        self.track(pending_txn)
+        return pending_txn
+
+    def track(self, pending_txn: PendingTransaction):
+        # For a PendingTransaction created before its hash was known
+        self.pending[pending_txn.txn_hash] = pending_txn
+
+    def fail(self, pending_txn: PendingTransaction):
+        """Resolve a transaction that was never sent as not mined."""
+        self._resolve(pending_txn, None)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.pending:
+                continue
+
+            pending_txns = list(self.pending.values())
+            receipts = await asyncio.gather(
+                *[loop.run_in_executor(None, self._get_receipt, pending_txn.txn_hash) for pending_txn in pending_txns],
+                return_exceptions=True)
+
+            now = time.monotonic()
+            for pending_txn, receipt in zip(pending_txns, receipts):
+                if isinstance(receipt, Exception):
+                    logger.warning(f"Could not fetch receipt for {pending_txn} due to: {receipt}")
+                    receipt = None
+                if receipt is not None:
+                    self._resolve(pending_txn, receipt)
+                elif now - pending_txn.submitted_timestamp > self.receipt_timeout:
+                    self._resolve(pending_txn, None)
+
+    def _get_receipt(self, txn_hash):
+        try:
+            return self.web3.eth.get_transaction_receipt(txn_hash)
+        except TransactionNotFound:
+            return None
+
+    def _resolve(self, pending_txn: PendingTransaction, receipt):
+        self.pending.pop(pending_txn.txn_hash, None)
+        pending_txn.receipt = receipt
+        if receipt is not None:
+            metrics.observe('tx_mined', time.monotonic() - pending_txn.submitted_timestamp)
+        if not pending_txn.future.done():
+            pending_txn.future.set_result(receipt)
+        if pending_txn.on_receipt is not None:
+            try:
+                pending_txn.on_receipt(pending_txn)
+            except Exception as e:
+                logger.error(f"Receipt callback for {pending_txn} failed due to: {e}")